@@ -17,6 +17,7 @@ from vyper.interfaces import ERC20 as IERC20
 struct CollectionStatus:
     contract: address
     trait_root: bytes32
+    trait_root_version: uint256
 
 struct CollectionContract:
     collection_key_hash: bytes32
@@ -26,6 +27,11 @@ struct TraitRoot:
     collection_key_hash: bytes32
     root_hash: bytes32
 
+struct VersionedTraitRoot:
+    collection_key_hash: bytes32
+    root_hash: bytes32
+    version: uint256
+
 # Events
 
 event ContractsChanged:
@@ -34,6 +40,9 @@ event ContractsChanged:
 event TraitRootChanged:
     changed: DynArray[TraitRoot, CHANGE_BATCH]
 
+event VersionedTraitRootChanged:
+    changed: DynArray[VersionedTraitRoot, CHANGE_BATCH]
+
 event OwnerProposed:
     owner: address
     proposed_owner: address
@@ -45,6 +54,8 @@ event OwnershipTransferred:
 # Global variables
 
 CHANGE_BATCH: constant(uint256) = 128
+TRAIT_ROOT_V1: constant(uint256) = 1
+TRAIT_ROOT_V2: constant(uint256) = 2
 
 VERSION: constant(String[30]) = "P2PLendingControl.20241002"
 
@@ -59,6 +70,10 @@ contracts: public(HashMap[bytes32, address])
 # The collection key is hashed and must match the collection key hash in the offer.
 trait_roots: public(HashMap[bytes32, bytes32])
 
+# format of the trait root of each collection, unset for roots created before versioning:
+# v1 nodes are keccak256(keccak256(a) ^ keccak256(b)) and v2 nodes are keccak256(concat(min(a, b), max(a, b)))
+trait_root_versions: public(HashMap[bytes32, uint256])
+
 
 @external
 def __init__():
@@ -113,24 +128,63 @@ def change_collections_contracts(collections: DynArray[CollectionContract, CHANG
 def change_collections_trait_roots(roots: DynArray[TraitRoot, CHANGE_BATCH]):
     """
     @notice Set trait roots
+    @dev The roots are set in the v1 format. An unset version reads as v1, so it is only cleared for collections that had one set.
     @param roots array of bytes32
     """
     assert msg.sender == self.owner, "sender not owner"
     for r in roots:
         self.trait_roots[r.collection_key_hash] = r.root_hash
+        if self.trait_root_versions[r.collection_key_hash] != empty(uint256):
+            self.trait_root_versions[r.collection_key_hash] = empty(uint256)
 
     log TraitRootChanged(roots)
 
 
+@external
+def change_collections_versioned_trait_roots(roots: DynArray[VersionedTraitRoot, CHANGE_BATCH]):
+    """
+    @notice Set trait roots and the format of each one
+    @param roots array of VersionedTraitRoot
+    """
+    assert msg.sender == self.owner, "sender not owner"
+    for r in roots:
+        assert r.version == TRAIT_ROOT_V1 or r.version == TRAIT_ROOT_V2, "invalid trait root version"
+        self.trait_roots[r.collection_key_hash] = r.root_hash
+        self.trait_root_versions[r.collection_key_hash] = r.version
+
+    log VersionedTraitRootChanged(roots)
+
+
 @external
 @view
 def get_collection_status(collection_key_hash: bytes32) -> CollectionStatus:
     """
     @notice Get the collection status
     @param collection_key_hash hash of the collection key
-    @return the contract address and traits root
+    @return the contract address, traits root and traits root version
     """
+    return self._collection_status(collection_key_hash)
+
+
+@external
+@view
+def get_collections_status(collection_key_hashes: DynArray[bytes32, CHANGE_BATCH]) -> DynArray[CollectionStatus, CHANGE_BATCH]:
+    """
+    @notice Get the status of several collections
+    @param collection_key_hashes array of hashes of the collection keys
+    @return the status of each collection, in the same order
+    """
+    result: DynArray[CollectionStatus, CHANGE_BATCH] = []
+    for key_hash in collection_key_hashes:
+        result.append(self._collection_status(key_hash))
+    return result
+
+
+@internal
+@view
+def _collection_status(collection_key_hash: bytes32) -> CollectionStatus:
     return CollectionStatus({
         contract: self.contracts[collection_key_hash],
-        trait_root: self.trait_roots[collection_key_hash]
+        trait_root: self.trait_roots[collection_key_hash],
+        trait_root_version: max(self.trait_root_versions[collection_key_hash], TRAIT_ROOT_V1)
     })
@@ -0,0 +1,72 @@
+# @version 0.3.10
+
+"""
+@title P2PLendingLens
+@author [Zharta](https://zharta.io/)
+@notice This contract reads the state of many loans and offers of a P2PLendingNfts contract in a single call, to reduce the number of RPC calls needed by off-chain services.
+@dev The contract is stateless and only has view functions, so the same deployment can be used with any P2PLendingNfts contract. The views are kept out of P2PLendingNfts due to its contract size limit.
+"""
+
+# Interfaces
+
+interface P2PLendingNfts:
+    def loans(loan_id: bytes32) -> bytes32: view
+    def offer_count(tracing_id: bytes32) -> uint256: view
+    def revoked_offers(offer_id: bytes32) -> bool: view
+
+# Global variables
+
+MAX_KEYS: constant(uint256) = 1024
+
+VERSION: public(constant(String[30])) = "P2PLendingLens.20241002"
+
+
+@external
+@view
+def get_loans(p2p_lending_nfts: address, loan_ids: DynArray[bytes32, MAX_KEYS]) -> DynArray[bytes32, MAX_KEYS]:
+
+    """
+    @notice Get the state hashes of the given loans.
+    @param p2p_lending_nfts The address of the P2PLendingNfts contract.
+    @param loan_ids The IDs of the loans.
+    @return The state hash of each loan, in the same order, or an empty value if the loan doesn't exist.
+    """
+
+    result: DynArray[bytes32, MAX_KEYS] = []
+    for loan_id in loan_ids:
+        result.append(P2PLendingNfts(p2p_lending_nfts).loans(loan_id))
+    return result
+
+
+@external
+@view
+def get_offer_counts(p2p_lending_nfts: address, tracing_ids: DynArray[bytes32, MAX_KEYS]) -> DynArray[uint256, MAX_KEYS]:
+
+    """
+    @notice Get the number of loans created from the given offers.
+    @param p2p_lending_nfts The address of the P2PLendingNfts contract.
+    @param tracing_ids The tracing IDs of the offers.
+    @return The usage count of each offer, in the same order.
+    """
+
+    result: DynArray[uint256, MAX_KEYS] = []
+    for tracing_id in tracing_ids:
+        result.append(P2PLendingNfts(p2p_lending_nfts).offer_count(tracing_id))
+    return result
+
+
+@external
+@view
+def get_revoked_offers(p2p_lending_nfts: address, offer_ids: DynArray[bytes32, MAX_KEYS]) -> DynArray[bool, MAX_KEYS]:
+
+    """
+    @notice Get the revocation status of the given offers.
+    @param p2p_lending_nfts The address of the P2PLendingNfts contract.
+    @param offer_ids The IDs of the signed offers.
+    @return Whether each offer is revoked, in the same order.
+    """
+
+    result: DynArray[bool, MAX_KEYS] = []
+    for offer_id in offer_ids:
+        result.append(P2PLendingNfts(p2p_lending_nfts).revoked_offers(offer_id))
+    return result
@@ -7,7 +7,7 @@
 @dev It facilitates peer-to-peer lending using NFTs as collateral.
       The contract allows lenders to offer loans and borrowers to accept them by providing NFTs as collateral.
       Key functionalities include:
-      - Creating and managing loan offers
+      - Creating and managing loan offers, including the revocation of all the offers of a lender below a nonce
       - Accepting loan offers and locking NFTs as collateral
       - Accepts ERC721 and CryptoPunks NFTs as collateral
       - Delegating the collateral using [Delegate](https://delegate.xyz/) DelegateRegistry v2
@@ -37,6 +37,7 @@ interface CryptoPunksMarket:
 
 interface DelegationRegistry:
     def delegateERC721(delegate: address, contract: address, token_id: uint256, rights: bytes32, _value: bool) -> bytes32: nonpayable
+    def multicall(data: DynArray[Bytes[DELEGATE_ERC721_CALL_SIZE], MAX_LOANS_BATCH]): nonpayable
 
 interface P2PLendingControl:
     def get_collection_status(collection_key_hash: bytes32) -> CollectionStatus: nonpayable
@@ -44,7 +45,12 @@ interface P2PLendingControl:
 # Structs
 
 PROOF_MAX_SIZE: constant(uint256) = 32
+TRAIT_ROOT_V2: constant(uint256) = 2
 MAX_FEES: constant(uint256) = 4
+MAX_LOANS_BATCH: constant(uint256) = 32
+MAX_ORIGINATION_BATCH: constant(uint256) = 20
+MAX_PAYOUTS: constant(uint256) = MAX_LOANS_BATCH * (MAX_FEES + 1)
+DELEGATE_ERC721_CALL_SIZE: constant(uint256) = 4 + 5 * 32
 BPS: constant(uint256) = 10000
 
 enum FeeType:
@@ -89,6 +95,7 @@ struct Offer:
     pro_rata: bool
     size: uint256
     tracing_id: bytes32
+    nonce: uint256
 
 
 struct Signature:
@@ -118,9 +125,19 @@ struct Loan:
     delegate: address
 
 
+struct Payout:
+    wallet: address
+    amount: uint256
+
+struct Collateral:
+    token_id: uint256
+    proof: DynArray[bytes32, PROOF_MAX_SIZE]
+    delegate: address
+
 struct CollectionStatus:
     contract: address
     trait_root: bytes32
+    trait_root_version: uint256
 
 struct PunkOffer:
     isForSale: bool
@@ -209,6 +226,11 @@ event OfferRevoked:
     collection_key_hash: bytes32
     offer_type: OfferType
 
+event MinOfferNonceSet:
+    lender: address
+    old_nonce: uint256
+    new_nonce: uint256
+
 event OwnerProposed:
     owner: address
     proposed_owner: address
@@ -258,9 +280,11 @@ max_protocol_upfront_fee: public(immutable(uint256))
 max_protocol_settlement_fee: public(immutable(uint256))
 max_lender_broker_settlement_fee: public(immutable(uint256))
 max_borrower_broker_settlement_fee: public(immutable(uint256))
+sparse_fees: public(immutable(bool))
 
 offer_count: public(HashMap[bytes32, uint256])
 revoked_offers: public(HashMap[bytes32, bool])
+min_offer_nonce: public(HashMap[address, uint256])
 
 authorized_proxies: public(HashMap[address, bool])
 pending_transfers: public(HashMap[address, uint256])
@@ -271,10 +295,11 @@ ZHARTA_DOMAIN_NAME: constant(String[6]) = "Zharta"
 ZHARTA_DOMAIN_VERSION: constant(String[1]) = "1"
 
 DOMAIN_TYPE_HASH: constant(bytes32) = keccak256("EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)")
-OFFER_TYPE_DEF: constant(String[413]) = "Offer(uint256 principal,uint256 interest,address payment_token,uint256 duration,uint256 origination_fee_amount," \
+OFFER_TYPE_DEF: constant(String[427]) = "Offer(uint256 principal,uint256 interest,address payment_token,uint256 duration,uint256 origination_fee_amount," \
                                         "uint256 broker_upfront_fee_amount,uint256 broker_settlement_fee_bps,address broker_address," \
                                         "uint256 offer_type,uint256 token_id,uint256 token_range_min,uint256 token_range_max,bytes32 collection_key_hash," \
-                                        "bytes32 trait_hash,uint256 expiration,address lender,bool pro_rata,uint256 size,bytes32 tracing_id)"
+                                        "bytes32 trait_hash,uint256 expiration,address lender,bool pro_rata,uint256 size,bytes32 tracing_id," \
+                                        "uint256 nonce)"
 OFFER_TYPE_HASH: constant(bytes32) = keccak256(OFFER_TYPE_DEF)
 
 offer_sig_domain_separator: immutable(bytes32)
@@ -293,6 +318,7 @@ def __init__(
     _max_protocol_settlement_fee: uint256,
     _max_lender_broker_settlement_fee: uint256,
     _max_borrower_broker_settlement_fee: uint256,
+    _sparse_fees: bool,
 ):
 
     """
@@ -303,6 +329,7 @@ def __init__(
     @param _protocol_upfront_fee The percentage (bps) of the principal paid to the protocol at origination.
     @param _protocol_settlement_fee The percentage (bps) of the interest paid to the protocol at settlement.
     @param _protocol_wallet The address where the protocol fees are accrued.
+    @param _sparse_fees Whether the loans only keep the fees with a non-zero upfront amount or settlement bps.
     """
 
     assert _protocol_wallet != empty(address), "wallet is the zero address"
@@ -322,6 +349,7 @@ def __init__(
     max_protocol_settlement_fee = _max_protocol_settlement_fee
     max_lender_broker_settlement_fee = _max_lender_broker_settlement_fee
     max_borrower_broker_settlement_fee = _max_borrower_broker_settlement_fee
+    sparse_fees = _sparse_fees
     self.protocol_upfront_fee = _protocol_upfront_fee
     self.protocol_settlement_fee = _protocol_settlement_fee
     self.protocol_wallet = _protocol_wallet
@@ -351,7 +379,7 @@ def set_protocol_fee(protocol_upfront_fee: uint256, protocol_settlement_fee: uin
     @param protocol_settlement_fee The new protocol settlement fee.
     """
 
-    assert msg.sender == self.owner, "not owner"
+    self._check_owner()
     assert protocol_upfront_fee <= max_protocol_upfront_fee, "upfront fee exceeds max"
     assert protocol_settlement_fee <= max_protocol_settlement_fee, "settlement fee exceeds max"
 
@@ -369,7 +397,7 @@ def change_protocol_wallet(new_protocol_wallet: address):
     @param new_protocol_wallet The new protocol wallet.
     """
 
-    assert msg.sender == self.owner, "not owner"
+    self._check_owner()
     assert new_protocol_wallet != empty(address), "wallet is the zero address"
 
     log ProtocolWalletChanged(self.protocol_wallet, new_protocol_wallet)
@@ -386,7 +414,7 @@ def set_proxy_authorization(_proxy: address, _value: bool):
     @param _value The value of the authorization.
     """
 
-    assert msg.sender == self.owner, "not owner"
+    self._check_owner()
 
     self.authorized_proxies[_proxy] = _value
 
@@ -402,7 +430,7 @@ def propose_owner(_address: address):
     @param _address The address of the proposed owner.
     """
 
-    assert msg.sender == self.owner, "not owner"
+    self._check_owner()
     assert _address != empty(address), "_address is zero"
 
     log OwnerProposed(self.owner, _address)
@@ -449,71 +477,51 @@ def create_loan(
     """
 
 
-    assert self._is_offer_signed_by_lender(offer, offer.offer.lender), "offer not signed by lender"
-    assert offer.offer.expiration > block.timestamp, "offer expired"
-    assert offer.offer.payment_token == payment_token, "invalid payment token"
-    assert offer.offer.origination_fee_amount <= offer.offer.principal, "origination fee gt principal"
-
-    collection_status: CollectionStatus = p2p_control.get_collection_status(offer.offer.collection_key_hash)
-    self._validate_token_ids(offer.offer, collateral_token_id, collection_status, collateral_proof)
+    collection_status: CollectionStatus = self._validate_offer(offer, collateral_token_id, collateral_proof)
 
     fees: DynArray[Fee, MAX_FEES] = self._get_loan_fees(offer.offer, borrower_broker_upfront_fee_amount, borrower_broker_settlement_fee_bps, borrower_broker)
-    total_upfront_fees: uint256 = 0
-    for fee in fees:
-        total_upfront_fees += fee.upfront_amount
+    self._check_and_update_offer_state(offer, 1)
 
-    offer_id: bytes32 = self._compute_signed_offer_id(offer)
-    loan: Loan = Loan({
-        id: empty(bytes32),
-        offer_id: offer_id,
-        offer_tracing_id: offer.offer.tracing_id,
-        amount: offer.offer.principal,
-        interest: offer.offer.interest,
-        payment_token: offer.offer.payment_token,
-        maturity: block.timestamp + offer.offer.duration,
-        start_time: block.timestamp,
-        borrower: msg.sender if not self.authorized_proxies[msg.sender] else tx.origin,
-        lender: offer.offer.lender,
-        collateral_contract: collection_status.contract,
-        collateral_token_id: collateral_token_id,
-        fees: fees,
-        pro_rata: offer.offer.pro_rata,
-        delegate: delegate
-    })
-    loan.id = self._compute_loan_id(loan)
+    borrower: address = msg.sender if not self.authorized_proxies[msg.sender] else tx.origin
+    loan_id: bytes32 = self._originate_loan(offer, borrower, collection_status.contract, collateral_token_id, fees, delegate)
+    self._fund_loans(offer.offer, borrower, fees, 1)
+    return loan_id
 
-    assert self.loans[loan.id] == empty(bytes32), "loan already exists"
-    self._check_and_update_offer_state(offer)
-    self.loans[loan.id] = self._loan_state_hash(loan)
 
-    self._store_collateral(loan.borrower, loan.collateral_contract, loan.collateral_token_id)
-    self._transfer_funds(loan.lender, loan.borrower, loan.amount - total_upfront_fees + offer.offer.broker_upfront_fee_amount)
+@external
+def create_loans(
+    offer: SignedOffer,
+    collaterals: DynArray[Collateral, MAX_ORIGINATION_BATCH],
+    borrower_broker_upfront_fee_amount: uint256,
+    borrower_broker_settlement_fee_bps: uint256,
+    borrower_broker: address
+) -> DynArray[bytes32, MAX_ORIGINATION_BATCH]:
 
-    for fee in fees:
-        if fee.type != FeeType.ORIGINATION_FEE and fee.upfront_amount > 0:
-            self._transfer_funds(loan.lender, fee.wallet, fee.upfront_amount)
+    """
+    @notice Create several loans from the same offer, one for each collateral.
+    @dev The offer signature and collection status are validated once and the offer usage is increased by the number of loans. The lender funds the loans with a single transfer to the borrower and a single transfer to each fee wallet. A LoanCreated event is logged for each loan.
+    @param offer The signed offer, usually a collection or trait offer with enough size for all the loans.
+    @param collaterals The collateral token IDs, each with its trait proof (if needed) and delegate.
+    @param borrower_broker_upfront_fee_amount The upfront fee amount for the borrower broker, for each loan.
+    @param borrower_broker_settlement_fee_bps The settlement fee basis points relative to the interest for the borrower broker.
+    @param borrower_broker The address of the borrower broker.
+    @return The IDs of the created loans.
+    """
 
-    if delegate != empty(address):
-        self._set_delegation(delegate, loan.collateral_contract, loan.collateral_token_id, True)
+    assert len(collaterals) > 0, "no collaterals"
 
-    log LoanCreated(
-        loan.id,
-        loan.amount,
-        loan.interest,
-        loan.payment_token,
-        loan.maturity,
-        loan.start_time,
-        loan.borrower,
-        loan.lender,
-        loan.collateral_contract,
-        loan.collateral_token_id,
-        loan.fees,
-        loan.pro_rata,
-        offer_id,
-        offer.offer.tracing_id,
-        delegate
-    )
-    return loan.id
+    collection_status: CollectionStatus = self._validate_offer_terms(offer)
+    fees: DynArray[Fee, MAX_FEES] = self._get_loan_fees(offer.offer, borrower_broker_upfront_fee_amount, borrower_broker_settlement_fee_bps, borrower_broker)
+    self._check_and_update_offer_state(offer, len(collaterals))
+
+    borrower: address = msg.sender if not self.authorized_proxies[msg.sender] else tx.origin
+    loan_ids: DynArray[bytes32, MAX_ORIGINATION_BATCH] = []
+    for collateral in collaterals:
+        self._validate_token_ids(offer.offer, collateral.token_id, collection_status, collateral.proof)
+        loan_ids.append(self._originate_loan(offer, borrower, collection_status.contract, collateral.token_id, fees, collateral.delegate))
+
+    self._fund_loans(offer.offer, borrower, fees, len(collaterals))
+    return loan_ids
 
 
 @external
@@ -521,42 +529,63 @@ def settle_loan(loan: Loan):
 
     """
     @notice Settle a loan.
+    @dev The lender and the settlement fee wallets are paid directly by the borrower. If a payment fails, the funds go through the contract and are kept as a pending transfer when they can't be sent.
     @param loan The loan to be settled.
     """
 
-    assert self._is_loan_valid(loan), "invalid loan"
-    assert block.timestamp <= loan.maturity, "loan defaulted"
-    assert self._check_user(loan.borrower), "not borrower"
-
-    interest: uint256 = self._compute_settlement_interest(loan)
-    settlement_fees_total: uint256 = 0
+    interest: uint256 = 0
     settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
-    borrower_broker_fee_amount: uint256 = 0
-    settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+    lender_amount: uint256 = 0
+    interest, settlement_fees, lender_amount = self._close_settled_loan(loan)
 
-    self.loans[loan.id] = empty(bytes32)
-    self._reduce_offer_count(loan.offer_tracing_id)
+    self._pay_funds(loan.borrower, loan.lender, lender_amount)
+    for fee in settlement_fees:
+        self._pay_funds(loan.borrower, fee.wallet, fee.amount)
 
-    self._receive_funds(loan.borrower, loan.amount + interest + borrower_broker_fee_amount)
+    self._release_collateral(loan, loan.borrower)
+    self._log_loan_paid(loan, interest, settlement_fees)
 
-    self._send_funds(loan.lender, loan.amount + interest - settlement_fees_total + borrower_broker_fee_amount)
-    for fee in settlement_fees:
-        self._send_funds(fee.wallet, fee.amount)
 
-    self._transfer_collateral(loan.borrower, loan.collateral_contract, loan.collateral_token_id)
+@external
+def settle_loans(loans: DynArray[Loan, MAX_LOANS_BATCH]):
 
-    if loan.delegate != empty(address):
-        self._set_delegation(loan.delegate, loan.collateral_contract, loan.collateral_token_id, False)
+    """
+    @notice Settle several loans of the same borrower in a single transaction.
+    @dev The amounts due to each lender and fee wallet are aggregated and paid directly by the borrower, with a single transfer per wallet. A LoanPaid event is logged for each loan as it is closed, before the aggregated transfers, while `settle_loan` logs it after the funds and the collateral are transferred.
+    @param loans The loans to be settled.
+    """
 
-    log LoanPaid(
-        loan.id,
-        loan.borrower,
-        loan.lender,
-        loan.payment_token,
-        loan.amount,
-        interest,
-        settlement_fees
-    )
+    payouts: DynArray[Payout, MAX_PAYOUTS] = []
+
+    for loan in loans:
+        interest: uint256 = 0
+        settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
+        lender_amount: uint256 = 0
+        interest, settlement_fees, lender_amount = self._close_settled_loan(loan)
+        self._log_loan_paid(loan, interest, settlement_fees)
+
+        loan_payouts: DynArray[Payout, MAX_FEES + 1] = [Payout({wallet: loan.lender, amount: lender_amount})]
+        for fee in settlement_fees:
+            loan_payouts.append(Payout({wallet: fee.wallet, amount: fee.amount}))
+
+        for payout in loan_payouts:
+            found: bool = False
+            for i in range(MAX_PAYOUTS):
+                if i == len(payouts):
+                    break
+                if payouts[i].wallet == payout.wallet:
+                    payouts[i].amount += payout.amount
+                    found = True
+                    break
+            if not found:
+                payouts.append(payout)
+
+    for payout in payouts:
+        if payout.amount > 0:
+            self._pay_funds(loans[0].borrower, payout.wallet, payout.amount)
+
+    for loan in loans:
+        self._release_collateral(loan, loan.borrower)
 
 
 @external
@@ -567,24 +596,35 @@ def claim_defaulted_loan_collateral(loan: Loan):
     @param loan The loan whose collateral is to be claimed. The loan maturity must have been passed.
     """
 
-    assert self._is_loan_valid(loan), "invalid loan"
-    assert block.timestamp > loan.maturity, "loan not defaulted"
-    assert self._check_user(loan.lender), "not lender"
+    self._claim_defaulted_loan(loan, True)
 
-    self.loans[loan.id] = empty(bytes32)
 
-    self._transfer_collateral(loan.lender, loan.collateral_contract, loan.collateral_token_id)
+@external
+def claim_defaulted_loans_collateral(loans: DynArray[Loan, MAX_LOANS_BATCH], batch_delegation_revocation: bool):
 
-    if loan.delegate != empty(address):
-        self._set_delegation(loan.delegate, loan.collateral_contract, loan.collateral_token_id, False)
+    """
+    @notice Claim the collateral of several defaulted loans in a single transaction.
+    @dev A LoanCollateralClaimed event is logged for each loan once its collateral is transferred. If `batch_delegation_revocation` is set, the delegations are revoked in a single `multicall` to the delegation registry instead of one call per loan, after the events are logged.
+    @param loans The loans whose collateral is to be claimed. The maturity of every loan must have been passed.
+    @param batch_delegation_revocation Whether to revoke the delegations in a single delegation registry call.
+    """
 
-    log LoanCollateralClaimed(
-        loan.id,
-        loan.borrower,
-        loan.lender,
-        loan.collateral_contract,
-        loan.collateral_token_id
-    )
+    revocations: DynArray[Bytes[DELEGATE_ERC721_CALL_SIZE], MAX_LOANS_BATCH] = []
+
+    for loan in loans:
+        self._claim_defaulted_loan(loan, not batch_delegation_revocation)
+        if batch_delegation_revocation and loan.delegate != empty(address):
+            revocations.append(_abi_encode(
+                loan.delegate,
+                loan.collateral_contract,
+                loan.collateral_token_id,
+                empty(bytes32),
+                False,
+                method_id=method_id("delegateERC721(address,address,uint256,bytes32,bool)")
+            ))
+
+    if len(revocations) > 0:
+        delegation_registry.multicall(revocations)
 
 
 @external
@@ -608,36 +648,18 @@ def replace_loan(
     @return The ID of the new loan.
     """
 
-    assert self._is_loan_valid(loan), "invalid loan"
-    assert self._check_user(loan.borrower), "not borrower"
-    assert block.timestamp <= loan.maturity, "loan defaulted"
-
-    assert self._is_offer_signed_by_lender(offer, offer.offer.lender), "offer not signed by lender"
-    assert offer.offer.expiration > block.timestamp, "offer expired"
-    assert offer.offer.payment_token == payment_token, "invalid payment token"
-    assert offer.offer.origination_fee_amount <= offer.offer.principal, "origination fee gt principal"
-
-    collection_status: CollectionStatus = p2p_control.get_collection_status(offer.offer.collection_key_hash)
-    self._validate_token_ids(offer.offer, loan.collateral_token_id, collection_status, collateral_proof)
-    assert collection_status.contract == loan.collateral_contract, "collateral contract mismatch"
-
-    self._check_and_update_offer_state(offer)
-    self._reduce_offer_count(loan.offer_tracing_id)
-
-    principal_delta: int256 = convert(offer.offer.principal, int256) - convert(loan.amount, int256)
-    interest: uint256 = self._compute_settlement_interest(loan)
+    self._validate_loan(loan)
+    self._check_borrower(loan.borrower)
 
-    settlement_fees_total: uint256 = 0
+    interest: uint256 = 0
     settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
+    settlement_fees_total: uint256 = 0
     borrower_broker_fee_amount: uint256 = 0
-    settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+    interest, settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._close_replaced_loan(loan, offer, collateral_proof)
 
+    principal_delta: int256 = convert(offer.offer.principal, int256) - convert(loan.amount, int256)
     new_loan_fees: DynArray[Fee, MAX_FEES] = self._get_loan_fees(offer.offer, borrower_broker_upfront_fee_amount, borrower_broker_settlement_fee_bps, borrower_broker)
-    total_upfront_fees: uint256 = 0
-    for fee in new_loan_fees:
-        total_upfront_fees += fee.upfront_amount
-
-    self.loans[loan.id] = empty(bytes32)
+    total_upfront_fees: uint256 = self._total_upfront_fees(new_loan_fees)
 
     borrower_delta: int256 = principal_delta - convert(total_upfront_fees + interest + borrower_broker_fee_amount, int256) + convert(offer.offer.broker_upfront_fee_amount, int256)
     current_lender_delta: uint256 = loan.amount + interest - settlement_fees_total + borrower_broker_fee_amount
@@ -657,35 +679,9 @@ def replace_loan(
     if borrower_delta > 0:
         self._send_funds(loan.borrower, convert(borrower_delta, uint256))
 
-    for fee in settlement_fees:
-        self._send_funds(fee.wallet, fee.amount)
-
-    for fee in new_loan_fees:
-        if fee.type != FeeType.ORIGINATION_FEE and fee.upfront_amount > 0:
-            self._send_funds(fee.wallet, fee.upfront_amount)
-
-    offer_id: bytes32 = self._compute_signed_offer_id(offer)
-    new_loan: Loan = Loan({
-        id: empty(bytes32),
-        offer_id: offer_id,
-        offer_tracing_id: offer.offer.tracing_id,
-        amount: offer.offer.principal,
-        interest: offer.offer.interest,
-        payment_token: offer.offer.payment_token,
-        maturity: block.timestamp + offer.offer.duration,
-        start_time: block.timestamp,
-        borrower: loan.borrower,
-        lender: offer.offer.lender,
-        collateral_contract: collection_status.contract,
-        collateral_token_id: loan.collateral_token_id,
-        fees: new_loan_fees,
-        pro_rata: offer.offer.pro_rata,
-        delegate: loan.delegate
-    })
-    new_loan.id = self._compute_loan_id(new_loan)
+    self._send_replacement_fees(settlement_fees, new_loan_fees)
 
-    assert self.loans[new_loan.id] == empty(bytes32), "loan already exists"
-    self.loans[new_loan.id] = self._loan_state_hash(new_loan)
+    new_loan: Loan = self._store_new_loan(offer, loan.borrower, loan.collateral_contract, loan.collateral_token_id, new_loan_fees, loan.delegate)
 
     log LoanReplaced(
         new_loan.id,
@@ -704,8 +700,8 @@ def replace_loan(
         loan.amount,
         interest,
         settlement_fees,
-        offer_id,
-        offer.offer.tracing_id
+        new_loan.offer_id,
+        new_loan.offer_tracing_id
     )
 
     return new_loan.id
@@ -722,37 +718,19 @@ def replace_loan_lender(loan: Loan, offer: SignedOffer, collateral_proof: DynArr
     @return The ID of the new loan.
     """
 
-    assert self._is_loan_valid(loan), "invalid loan"
-    assert self._check_user(loan.lender), "not lender"
-    assert block.timestamp <= loan.maturity, "loan defaulted"
-
-    assert self._is_offer_signed_by_lender(offer, offer.offer.lender), "offer not signed by lender"
-    assert offer.offer.expiration > block.timestamp, "offer expired"
-    assert offer.offer.payment_token == payment_token, "invalid payment token"
-    assert offer.offer.origination_fee_amount <= offer.offer.principal, "origination fee gt principal"
-    assert block.timestamp + offer.offer.duration >= loan.maturity, "maturity before loan maturity"
-
-    collection_status: CollectionStatus = p2p_control.get_collection_status(offer.offer.collection_key_hash)
-    self._validate_token_ids(offer.offer, loan.collateral_token_id, collection_status, collateral_proof)
-    assert collection_status.contract == loan.collateral_contract, "collateral contract mismatch"
+    self._validate_loan(loan)
+    self._check_lender(loan.lender)
 
-    self._check_and_update_offer_state(offer)
-    self._reduce_offer_count(loan.offer_tracing_id)
-
-    principal_delta: int256 = convert(offer.offer.principal, int256) - convert(loan.amount, int256)
-    interest: uint256 = self._compute_settlement_interest(loan)
-
-    settlement_fees_total: uint256 = 0
+    interest: uint256 = 0
     settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
+    settlement_fees_total: uint256 = 0
     borrower_broker_fee_amount: uint256 = 0
-    settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+    interest, settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._close_replaced_loan(loan, offer, collateral_proof)
+    assert block.timestamp + offer.offer.duration >= loan.maturity, "maturity before loan maturity"
 
+    principal_delta: int256 = convert(offer.offer.principal, int256) - convert(loan.amount, int256)
     new_loan_fees: DynArray[Fee, MAX_FEES] = self._get_loan_fees(offer.offer, 0, 0, empty(address))
-    total_upfront_fees: uint256 = 0
-    for fee in new_loan_fees:
-        total_upfront_fees += fee.upfront_amount
-
-    self.loans[loan.id] = empty(bytes32)
+    total_upfront_fees: uint256 = self._total_upfront_fees(new_loan_fees)
 
     max_interest_delta: uint256 = self._compute_max_interest_delta(loan, offer.offer, interest, borrower_broker_fee_amount)
     borrower_compensation: uint256 = convert(max(convert(max_interest_delta, int256), convert(interest + borrower_broker_fee_amount, int256) - principal_delta), uint256)
@@ -780,35 +758,9 @@ def replace_loan_lender(loan: Loan, offer: SignedOffer, collateral_proof: DynArr
     if borrower_delta > 0:
         self._send_funds(loan.borrower, convert(borrower_delta, uint256))
 
-    for fee in settlement_fees:
-        self._send_funds(fee.wallet, fee.amount)
+    self._send_replacement_fees(settlement_fees, new_loan_fees)
 
-    for fee in new_loan_fees:
-        if fee.type != FeeType.ORIGINATION_FEE and fee.upfront_amount > 0:
-            self._send_funds(fee.wallet, fee.upfront_amount)
-
-    offer_id: bytes32 = self._compute_signed_offer_id(offer)
-    new_loan: Loan = Loan({
-        id: empty(bytes32),
-        offer_id: offer_id,
-        offer_tracing_id: offer.offer.tracing_id,
-        amount: offer.offer.principal,
-        interest: offer.offer.interest,
-        payment_token: offer.offer.payment_token,
-        maturity: block.timestamp + offer.offer.duration,
-        start_time: block.timestamp,
-        borrower: loan.borrower,
-        lender: offer.offer.lender,
-        collateral_contract: collection_status.contract,
-        collateral_token_id: loan.collateral_token_id,
-        fees: new_loan_fees,
-        pro_rata: offer.offer.pro_rata,
-        delegate: loan.delegate
-    })
-    new_loan.id = self._compute_loan_id(new_loan)
-
-    assert self.loans[new_loan.id] == empty(bytes32), "loan already exists"
-    self.loans[new_loan.id] = self._loan_state_hash(new_loan)
+    new_loan: Loan = self._store_new_loan(offer, loan.borrower, loan.collateral_contract, loan.collateral_token_id, new_loan_fees, loan.delegate)
 
     log LoanReplacedByLender(
         new_loan.id,
@@ -828,8 +780,8 @@ def replace_loan_lender(loan: Loan, offer: SignedOffer, collateral_proof: DynArr
         interest,
         settlement_fees,
         borrower_compensation,
-        offer_id,
-        offer.offer.tracing_id
+        new_loan.offer_id,
+        new_loan.offer_tracing_id
     )
 
     return new_loan.id
@@ -843,9 +795,8 @@ def revoke_offer(offer: SignedOffer):
     @param offer The signed offer to be revoked.
     """
 
-    assert self._check_user(offer.offer.lender), "not lender"
-    assert offer.offer.expiration > block.timestamp, "offer expired"
-    assert self._is_offer_signed_by_lender(offer, offer.offer.lender), "offer not signed by lender"
+    self._check_lender(offer.offer.lender)
+    self._validate_offer_signature(offer)
 
     offer_id: bytes32 = self._compute_signed_offer_id(offer)
     assert not self.revoked_offers[offer_id], "offer already revoked"
@@ -853,6 +804,22 @@ def revoke_offer(offer: SignedOffer):
     self._revoke_offer(offer_id, offer)
 
 
+@external
+def set_min_offer_nonce(nonce: uint256):
+
+    """
+    @notice Revoke all the offers of the lender with a nonce lower than the given one.
+    @dev Sets the minimum nonce of the lender offers and logs the event. The minimum nonce can only be increased.
+    @param nonce The new minimum nonce. Offers signed with a lower nonce are no longer valid.
+    """
+
+    lender: address = msg.sender if not self.authorized_proxies[msg.sender] else tx.origin
+    assert nonce > self.min_offer_nonce[lender], "nonce not increased"
+
+    log MinOfferNonceSet(lender, self.min_offer_nonce[lender], nonce)
+    self.min_offer_nonce[lender] = nonce
+
+
 @external
 def claim_pending_transfers():
     assert self.pending_transfers[msg.sender] > 0, "no pending transfers"
@@ -905,13 +872,194 @@ def _compute_signed_offer_id(offer: SignedOffer) -> bytes32:
     ))
 
 @internal
-def _check_and_update_offer_state(offer: SignedOffer):
+def _validate_offer(
+    offer: SignedOffer,
+    collateral_token_id: uint256,
+    collateral_proof: DynArray[bytes32, PROOF_MAX_SIZE]
+) -> CollectionStatus:
+    collection_status: CollectionStatus = self._validate_offer_terms(offer)
+    self._validate_token_ids(offer.offer, collateral_token_id, collection_status, collateral_proof)
+    return collection_status
+
+
+@internal
+def _validate_offer_signature(offer: SignedOffer):
+    assert self._is_offer_signed_by_lender(offer, offer.offer.lender), "offer not signed by lender"
+    assert offer.offer.expiration > block.timestamp, "offer expired"
+
+
+@internal
+def _validate_offer_terms(offer: SignedOffer) -> CollectionStatus:
+    self._validate_offer_signature(offer)
+    assert offer.offer.payment_token == payment_token, "invalid payment token"
+    assert offer.offer.origination_fee_amount <= offer.offer.principal, "origination fee gt principal"
+    assert offer.offer.nonce >= self.min_offer_nonce[offer.offer.lender], "offer nonce revoked"
+
+    collection_status: CollectionStatus = p2p_control.get_collection_status(offer.offer.collection_key_hash)
+    assert collection_status.contract != empty(address), "collateral not whitelisted"
+    return collection_status
+
+
+@internal
+def _store_new_loan(
+    offer: SignedOffer,
+    borrower: address,
+    collateral_contract: address,
+    collateral_token_id: uint256,
+    fees: DynArray[Fee, MAX_FEES],
+    delegate: address
+) -> Loan:
+    loan: Loan = Loan({
+        id: empty(bytes32),
+        offer_id: self._compute_signed_offer_id(offer),
+        offer_tracing_id: offer.offer.tracing_id,
+        amount: offer.offer.principal,
+        interest: offer.offer.interest,
+        payment_token: offer.offer.payment_token,
+        maturity: block.timestamp + offer.offer.duration,
+        start_time: block.timestamp,
+        borrower: borrower,
+        lender: offer.offer.lender,
+        collateral_contract: collateral_contract,
+        collateral_token_id: collateral_token_id,
+        fees: fees,
+        pro_rata: offer.offer.pro_rata,
+        delegate: delegate
+    })
+    loan.id = self._compute_loan_id(loan)
+
+    assert self.loans[loan.id] == empty(bytes32), "loan already exists"
+    self.loans[loan.id] = self._loan_state_hash(loan)
+    return loan
+
+
+@internal
+def _originate_loan(
+    offer: SignedOffer,
+    borrower: address,
+    collateral_contract: address,
+    collateral_token_id: uint256,
+    fees: DynArray[Fee, MAX_FEES],
+    delegate: address
+) -> bytes32:
+    loan: Loan = self._store_new_loan(offer, borrower, collateral_contract, collateral_token_id, fees, delegate)
+    self._store_collateral(borrower, collateral_contract, collateral_token_id)
+
+    if delegate != empty(address):
+        self._set_delegation(delegate, collateral_contract, collateral_token_id, True)
+
+    log LoanCreated(
+        loan.id,
+        loan.amount,
+        loan.interest,
+        loan.payment_token,
+        loan.maturity,
+        loan.start_time,
+        loan.borrower,
+        loan.lender,
+        loan.collateral_contract,
+        loan.collateral_token_id,
+        loan.fees,
+        loan.pro_rata,
+        loan.offer_id,
+        loan.offer_tracing_id,
+        delegate
+    )
+    return loan.id
+
+
+@internal
+def _fund_loans(offer: Offer, borrower: address, fees: DynArray[Fee, MAX_FEES], loans: uint256):
+    self._transfer_funds(offer.lender, borrower, loans * (offer.principal - self._total_upfront_fees(fees) + offer.broker_upfront_fee_amount))
+
+    for fee in fees:
+        if fee.type != FeeType.ORIGINATION_FEE and fee.upfront_amount > 0:
+            self._transfer_funds(offer.lender, fee.wallet, loans * fee.upfront_amount)
+
+
+@internal
+def _close_settled_loan(loan: Loan) -> (uint256, DynArray[FeeAmount, MAX_FEES], uint256):
+    self._validate_loan(loan)
+    self._check_not_defaulted(loan.maturity)
+    self._check_borrower(loan.borrower)
+
+    interest: uint256 = self._compute_settlement_interest(loan)
+    settlement_fees_total: uint256 = 0
+    settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
+    borrower_broker_fee_amount: uint256 = 0
+    settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+
+    self.loans[loan.id] = empty(bytes32)
+    self._reduce_offer_count(loan.offer_tracing_id)
+    return (interest, settlement_fees, loan.amount + interest - settlement_fees_total + borrower_broker_fee_amount)
+
+
+@internal
+def _log_loan_paid(loan: Loan, interest: uint256, settlement_fees: DynArray[FeeAmount, MAX_FEES]):
+    log LoanPaid(
+        loan.id,
+        loan.borrower,
+        loan.lender,
+        loan.payment_token,
+        loan.amount,
+        interest,
+        settlement_fees
+    )
+
+
+@internal
+def _close_replaced_loan(
+    loan: Loan,
+    offer: SignedOffer,
+    collateral_proof: DynArray[bytes32, PROOF_MAX_SIZE]
+) -> (uint256, DynArray[FeeAmount, MAX_FEES], uint256, uint256):
+    self._check_not_defaulted(loan.maturity)
+
+    collection_status: CollectionStatus = self._validate_offer(offer, loan.collateral_token_id, collateral_proof)
+    assert collection_status.contract == loan.collateral_contract, "collateral contract mismatch"
+
+    self._check_and_update_offer_state(offer, 1)
+    self._reduce_offer_count(loan.offer_tracing_id)
+
+    interest: uint256 = self._compute_settlement_interest(loan)
+    settlement_fees_total: uint256 = 0
+    settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
+    borrower_broker_fee_amount: uint256 = 0
+    settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+
+    self.loans[loan.id] = empty(bytes32)
+    return (interest, settlement_fees, settlement_fees_total, borrower_broker_fee_amount)
+
+
+@internal
+def _claim_defaulted_loan(loan: Loan, revoke_delegation: bool):
+    self._validate_loan(loan)
+    assert block.timestamp > loan.maturity, "loan not defaulted"
+    self._check_lender(loan.lender)
+
+    self.loans[loan.id] = empty(bytes32)
+
+    self._transfer_collateral(loan.lender, loan.collateral_contract, loan.collateral_token_id)
+    if revoke_delegation and loan.delegate != empty(address):
+        self._set_delegation(loan.delegate, loan.collateral_contract, loan.collateral_token_id, False)
+
+    log LoanCollateralClaimed(
+        loan.id,
+        loan.borrower,
+        loan.lender,
+        loan.collateral_contract,
+        loan.collateral_token_id
+    )
+
+
+@internal
+def _check_and_update_offer_state(offer: SignedOffer, loans: uint256):
     offer_id: bytes32 = self._compute_signed_offer_id(offer)
     assert not self.revoked_offers[offer_id], "offer revoked"
 
-    count: uint256 = self.offer_count[offer.offer.tracing_id]
-    assert count < offer.offer.size, "offer fully utilized"
-    self.offer_count[offer.offer.tracing_id] = count + 1
+    count: uint256 = self.offer_count[offer.offer.tracing_id] + loans
+    assert count <= offer.offer.size, "offer fully utilized"
+    self.offer_count[offer.offer.tracing_id] = count
 
     if offer.offer.offer_type == OfferType.TOKEN:
         self._revoke_offer(offer_id, offer)
@@ -936,8 +1084,8 @@ def _reduce_offer_count(tracing_id: bytes32):
 
 @view
 @internal
-def _is_loan_valid(loan: Loan) -> bool:
-    return self.loans[loan.id] == self._loan_state_hash(loan)
+def _validate_loan(loan: Loan):
+    assert self.loans[loan.id] == self._loan_state_hash(loan), "invalid loan"
 
 @pure
 @internal
@@ -965,43 +1113,55 @@ def _is_offer_signed_by_lender(signed_offer: SignedOffer, lender: address) -> bo
 
 @internal
 def _get_loan_fees(offer: Offer, borrower_broker_upfront_fee_amount: uint256, borrower_broker_settlement_fee_bps: uint256, borrower_broker: address) -> DynArray[Fee, MAX_FEES]:
-    fees: DynArray[Fee, MAX_FEES] = []
-    if offer.origination_fee_amount > 0:
-        assert offer.origination_fee_amount <= offer.principal, "origination fee gt principal"
-    if offer.broker_settlement_fee_bps > 0 or offer.broker_upfront_fee_amount > 0:
-        assert offer.broker_address != empty(address), "broker fee without address"
-    if borrower_broker_upfront_fee_amount > 0 or borrower_broker_settlement_fee_bps > 0:
-        assert borrower_broker != empty(address), "broker fee without address"
     assert offer.broker_settlement_fee_bps <= max_lender_broker_settlement_fee, "lender broker fee exceeds max"
     assert borrower_broker_settlement_fee_bps <= max_borrower_broker_settlement_fee, "borrower broker fee exceeds max"
     assert self.protocol_settlement_fee + offer.broker_settlement_fee_bps <= BPS, "settlement fees gt principal"
 
-    fees.append(Fee({
-        type: FeeType.PROTOCOL_FEE,
-        upfront_amount: self.protocol_upfront_fee * offer.principal / BPS,
-        interest_bps: self.protocol_settlement_fee,
-        wallet: self.protocol_wallet
-    }))
-    fees.append(Fee({
-        type: FeeType.ORIGINATION_FEE,
-        upfront_amount: offer.origination_fee_amount,
-        interest_bps: 0,
-        wallet: offer.lender
-    }))
-    fees.append(Fee({
-        type: FeeType.LENDER_BROKER_FEE,
-        upfront_amount: offer.broker_upfront_fee_amount,
-        interest_bps: offer.broker_settlement_fee_bps,
-        wallet: offer.broker_address
-    }))
-    fees.append(Fee({
-        type: FeeType.BORROWER_BROKER_FEE,
-        upfront_amount: borrower_broker_upfront_fee_amount,
-        interest_bps: borrower_broker_settlement_fee_bps,
-        wallet: borrower_broker
-    }))
+    all_fees: DynArray[Fee, MAX_FEES] = [
+        Fee({
+            type: FeeType.PROTOCOL_FEE,
+            upfront_amount: self.protocol_upfront_fee * offer.principal / BPS,
+            interest_bps: self.protocol_settlement_fee,
+            wallet: self.protocol_wallet
+        }),
+        Fee({
+            type: FeeType.ORIGINATION_FEE,
+            upfront_amount: offer.origination_fee_amount,
+            interest_bps: 0,
+            wallet: offer.lender
+        }),
+        Fee({
+            type: FeeType.LENDER_BROKER_FEE,
+            upfront_amount: offer.broker_upfront_fee_amount,
+            interest_bps: offer.broker_settlement_fee_bps,
+            wallet: offer.broker_address
+        }),
+        Fee({
+            type: FeeType.BORROWER_BROKER_FEE,
+            upfront_amount: borrower_broker_upfront_fee_amount,
+            interest_bps: borrower_broker_settlement_fee_bps,
+            wallet: borrower_broker
+        })
+    ]
+    fees: DynArray[Fee, MAX_FEES] = []
+    for fee in all_fees:
+        if fee.upfront_amount > 0 or fee.interest_bps > 0:
+            assert fee.wallet != empty(address), "broker fee without address"
+            fees.append(fee)
+
+    if not sparse_fees:
+        return all_fees
     return fees
 
+@pure
+@internal
+def _total_upfront_fees(fees: DynArray[Fee, MAX_FEES]) -> uint256:
+    total: uint256 = 0
+    for fee in fees:
+        total += fee.upfront_amount
+    return total
+
+
 @internal
 def _get_settlement_fees(loan: Loan, settlement_interest: uint256) -> (DynArray[FeeAmount, MAX_FEES], uint256, uint256):
     total: uint256 = 0
@@ -1018,6 +1178,16 @@ def _get_settlement_fees(loan: Loan, settlement_interest: uint256) -> (DynArray[
     return (settlement_fees, total, borrower_broker_fee_amount)
 
 
+@internal
+def _send_replacement_fees(settlement_fees: DynArray[FeeAmount, MAX_FEES], new_loan_fees: DynArray[Fee, MAX_FEES]):
+    for fee in settlement_fees:
+        self._send_funds(fee.wallet, fee.amount)
+
+    for fee in new_loan_fees:
+        if fee.type != FeeType.ORIGINATION_FEE and fee.upfront_amount > 0:
+            self._send_funds(fee.wallet, fee.upfront_amount)
+
+
 @internal
 def _compute_settlement_interest(loan: Loan) -> uint256:
     if loan.pro_rata:
@@ -1069,7 +1239,10 @@ def _store_punk(_wallet: address, _collateralAddress: address, _tokenId: uint256
 
 @internal
 def _store_erc721(_wallet: address, _collateralAddress: address, _tokenId: uint256):
-    IERC721(_collateralAddress).safeTransferFrom(_wallet, self, _tokenId, b"")
+    # the token checks ownership and approval itself, the revert reason is only resolved if the transfer fails
+    if not self._call_erc721_transfer(_collateralAddress, method_id("transferFrom(address,address,uint256)", output_type=bytes4), _wallet, self, _tokenId):
+        assert self._erc721_owner(_collateralAddress, _tokenId) == _wallet, "collateral not owned by wallet"
+        raise "transfer is not approved"
 
 
 @internal
@@ -1080,8 +1253,25 @@ def _transfer_punk(_wallet: address, _collateralAddress: address, _tokenId: uint
 
 @internal
 def _transfer_erc721(_wallet: address, _collateralAddress: address, _tokenId: uint256):
-    assert self._erc721_owner(_collateralAddress, _tokenId) == self, "collateral not owned by vault"
-    IERC721(_collateralAddress).safeTransferFrom(self, _wallet, _tokenId, b"")
+    # contracts must acknowledge the token through onERC721Received, a plain transferFrom is enough for other wallets
+    selector: bytes4 = method_id("transferFrom(address,address,uint256)", output_type=bytes4)
+    if _wallet.is_contract:
+        selector = method_id("safeTransferFrom(address,address,uint256)", output_type=bytes4)
+    if not self._call_erc721_transfer(_collateralAddress, selector, self, _wallet, _tokenId):
+        assert self._erc721_owner(_collateralAddress, _tokenId) == self, "collateral not owned by vault"
+        raise "collateral transfer failed"
+
+
+@internal
+def _call_erc721_transfer(_collateralAddress: address, _selector: bytes4, _from: address, _to: address, _tokenId: uint256) -> bool:
+    return raw_call(_collateralAddress, concat(_selector, _abi_encode(_from, _to, _tokenId)), revert_on_failure=False)
+
+
+@internal
+def _release_collateral(loan: Loan, wallet: address):
+    self._transfer_collateral(wallet, loan.collateral_contract, loan.collateral_token_id)
+    if loan.delegate != empty(address):
+        self._set_delegation(loan.delegate, loan.collateral_contract, loan.collateral_token_id, False)
 
 
 @internal
@@ -1094,24 +1284,31 @@ def _transfer_collateral(wallet: address, collateral_contract: address, token_id
 
 @internal
 def _send_funds(_to: address, _amount: uint256):
+    if not self._call_payment_token(_abi_encode(_to, _amount, method_id=method_id("transfer(address,uint256)"))):
+        log TransferFailed(_to, _amount)
+        self.pending_transfers[_to] += _amount
+
+
+@internal
+def _pay_funds(_from: address, _to: address, _amount: uint256):
+    # pays directly from `_from`, if that fails the funds go through the contract as before, ending up as a pending transfer if `_to` can't receive them
+    if not self._call_payment_token(_abi_encode(_from, _to, _amount, method_id=method_id("transferFrom(address,address,uint256)"))):
+        self._receive_funds(_from, _amount)
+        self._send_funds(_to, _amount)
+
+
+@internal
+def _call_payment_token(call_data: Bytes[100]) -> bool:
     success: bool = False
     response: Bytes[32] = b""
 
-    success, response = raw_call(
-        payment_token,
-        _abi_encode(_to, _amount, method_id=method_id("transfer(address,uint256)")),
-        max_outsize=32,
-        revert_on_failure=False
-    )
-
-    if not success or not convert(response, bool):
-        log TransferFailed(_to, _amount)
-        self.pending_transfers[_to] += _amount
+    success, response = raw_call(payment_token, call_data, max_outsize=32, revert_on_failure=False)
+    return success and convert(response, bool)
 
 
 @internal
 def _receive_funds(_from: address, _amount: uint256):
-    assert IERC20(payment_token).transferFrom(_from, self, _amount), "transferFrom failed"
+    self._transfer_funds(_from, self, _amount)
 
 
 @internal
@@ -1148,29 +1345,40 @@ def _is_punk_approved_for_vault(_borrower: address, _collateralAddress: address,
     )
 
 
-@view
-@internal
-def _is_erc721_approved_for_vault(_borrower: address, _collateralAddress: address, _tokenId: uint256) -> bool:
-    return IERC721(_collateralAddress).isApprovedForAll(_borrower, self) or IERC721(_collateralAddress).getApproved(_tokenId) == self
-
-
 @internal
 def _store_collateral(wallet: address, collateral_contract: address, token_id: uint256):
-
-    assert wallet != empty(address), "addr is the zero addr"
-    assert collateral_contract != empty(address), "collat addr is the zero addr"
-
+    # the collateral contract is whitelisted, as checked in _validate_offer_terms, and the wallet is the caller
     if self._is_punk(collateral_contract):
         assert self._punk_owner(collateral_contract, token_id) == wallet, "collateral not owned by wallet"
         assert self._is_punk_approved_for_vault(wallet, collateral_contract, token_id), "transfer is not approved"
         self._store_punk(wallet, collateral_contract, token_id)
 
     else:
-        assert self._erc721_owner(collateral_contract, token_id) == wallet, "collateral not owned by wallet"
-        assert self._is_erc721_approved_for_vault(wallet, collateral_contract, token_id), "transfer is not approved"
         self._store_erc721(wallet, collateral_contract, token_id)
 
 
+@view
+@internal
+def _check_owner():
+    assert msg.sender == self.owner, "not owner"
+
+
+@view
+@internal
+def _check_not_defaulted(maturity: uint256):
+    assert block.timestamp <= maturity, "loan defaulted"
+
+
+@internal
+def _check_borrower(borrower: address):
+    assert self._check_user(borrower), "not borrower"
+
+
+@internal
+def _check_lender(lender: address):
+    assert self._check_user(lender), "not lender"
+
+
 @internal
 def _check_user(user: address) -> bool:
     return msg.sender == user or (self.authorized_proxies[msg.sender] and user == tx.origin)
@@ -1182,7 +1390,6 @@ def _validate_token_ids(
     collection_status: CollectionStatus,
     collateral_proof: DynArray[bytes32, PROOF_MAX_SIZE]
 ):
-    assert collection_status.contract != empty(address), "collateral not whitelisted"
     if offer.offer_type == OfferType.TOKEN:
         assert offer.token_id == collateral_token_id, "token id not in offer"
     elif offer.offer_type == OfferType.COLLECTION:
@@ -1190,6 +1397,13 @@ def _validate_token_ids(
         assert collateral_token_id <= offer.token_range_max, "tokenid above offer range"
     else:
         _hash: bytes32 = keccak256(_abi_encode(collection_status.contract, offer.trait_hash, collateral_token_id))
-        for p in collateral_proof:
-            _hash = keccak256(_abi_encode(convert(keccak256(_hash), uint256) ^ convert(keccak256(p), uint256)))
+        if collection_status.trait_root_version != TRAIT_ROOT_V2:
+            for p in collateral_proof:
+                _hash = keccak256(_abi_encode(convert(keccak256(_hash), uint256) ^ convert(keccak256(p), uint256)))
+        else:
+            for p in collateral_proof:
+                if convert(_hash, uint256) < convert(p, uint256):
+                    _hash = keccak256(_abi_encode(_hash, p))
+                else:
+                    _hash = keccak256(_abi_encode(p, _hash))
         assert collection_status.trait_root == _hash, "proof invalid"
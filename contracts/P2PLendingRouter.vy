@@ -0,0 +1,97 @@
+# @version 0.3.10
+
+"""
+@title P2PLendingRouter
+@author [Zharta](https://zharta.io/)
+@notice This contract batches calls to a P2PLendingNfts contract in a single transaction, eg settling a loan and creating a new one.
+@dev The router must be an authorized proxy in the P2PLendingNfts contract, which then acts for the transaction origin: it is the borrower of the created loans and is checked as the borrower or lender of the existing ones. Funds and collateral are moved by the P2PLendingNfts contract directly from and to the user, so the approvals are given to that contract and not to the router. To prevent other contracts from acting for the origin, the router can only be called directly by an EOA.
+      The payment token allowance can optionally be set in the same transaction with an EIP-2612 permit.
+"""
+
+# Interfaces
+
+interface P2PLendingNfts:
+    def payment_token() -> address: view
+
+# Structs
+
+struct Permit:
+    amount: uint256
+    deadline: uint256
+    v: uint8
+    r: bytes32
+    s: bytes32
+
+# Global variables
+
+MAX_CALLS: constant(uint256) = 8
+MAX_CALL_SIZE: constant(uint256) = 4096
+MAX_RESULT_SIZE: constant(uint256) = 32
+
+# selectors of the P2PLendingNfts functions that can be called through the router
+CREATE_LOAN: constant(bytes4) = 0x5b9b10e6
+SETTLE_LOAN: constant(bytes4) = 0x802d6799
+REPLACE_LOAN: constant(bytes4) = 0x0d1635a5
+REVOKE_OFFER: constant(bytes4) = 0x8694cbd6
+
+VERSION: public(constant(String[30])) = "P2PLendingRouter.20241002"
+
+p2p_lending_nfts: public(immutable(address))
+payment_token: public(immutable(address))
+
+
+@external
+def __init__(_p2p_lending_nfts: address):
+
+    """
+    @notice Initialize the contract with the given parameters.
+    @param _p2p_lending_nfts The address of the P2PLendingNfts contract. The payment token is read from it.
+    """
+
+    assert _p2p_lending_nfts != empty(address), "p2p lending nfts is zero"
+
+    p2p_lending_nfts = _p2p_lending_nfts
+    payment_token = P2PLendingNfts(_p2p_lending_nfts).payment_token()
+
+
+@external
+def multicall(
+    calls: DynArray[Bytes[MAX_CALL_SIZE], MAX_CALLS],
+    permit: Permit = empty(Permit)
+) -> DynArray[Bytes[MAX_RESULT_SIZE], MAX_CALLS]:
+
+    """
+    @notice Call the P2PLendingNfts contract with each of the given calls, in order. If any call fails, the whole transaction reverts with the failed call's reason.
+    @dev Only `create_loan`, `settle_loan`, `replace_loan` and `revoke_offer` calls are allowed. If the permit has a deadline, it is submitted first to set the allowance of the P2PLendingNfts contract over the caller's payment tokens. A failed permit is ignored, as it may have been front-run, and the calls revert later if the allowance is not enough.
+    @param calls The ABI encoded calls, including the function selector.
+    @param permit The EIP-2612 permit signed by the caller for the P2PLendingNfts contract as spender, if any.
+    @return The data returned by each call, ie the ID of the new loan for `create_loan` and `replace_loan`.
+    """
+
+    assert msg.sender == tx.origin, "caller is not an EOA"
+
+    if permit.deadline > 0:
+        # vyper requires the result of a non reverting raw_call to be assigned, it is ignored as the allowance is checked by the payment token when the funds are transferred
+        _permitted: bool = raw_call(
+            payment_token,
+            _abi_encode(
+                msg.sender,
+                p2p_lending_nfts,
+                permit.amount,
+                permit.deadline,
+                permit.v,
+                permit.r,
+                permit.s,
+                method_id=method_id("permit(address,address,uint256,uint256,uint8,bytes32,bytes32)")
+            ),
+            revert_on_failure=False
+        )
+
+    results: DynArray[Bytes[MAX_RESULT_SIZE], MAX_CALLS] = []
+    for call_data in calls:
+        selector: bytes4 = convert(slice(call_data, 0, 4), bytes4)
+        assert selector in [CREATE_LOAN, SETTLE_LOAN, REPLACE_LOAN, REVOKE_OFFER], "call not allowed"
+        results.append(raw_call(p2p_lending_nfts, call_data, max_outsize=MAX_RESULT_SIZE))
+
+    return results
+
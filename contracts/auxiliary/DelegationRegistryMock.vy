@@ -60,6 +60,7 @@ event DelegateERC1155:
 # Global variables
 
 DELEGATION_REVOKED: constant(address) = 0x000000000000000000000000000000000000dEaD
+MULTICALL_MAX_CALLS: constant(uint256) = 64
 
 delegations: HashMap[bytes32, Delegation]
 outgoingDelegationHashes: HashMap[address, DynArray[bytes32, 2**20]]  #  from -> delegationHash
@@ -135,6 +136,17 @@ def delegateERC20(to: address, contract_: address, rights: bytes32, amount: uint
 def delegateERC1155(to: address, contract_: address, tokenId: uint256, rights: bytes32, amount: uint256) -> bytes32:
     raise "Not implemented"
 
+@external
+def multicall(data: DynArray[Bytes[256], MULTICALL_MAX_CALLS]) -> DynArray[Bytes[256], MULTICALL_MAX_CALLS]:
+    results: DynArray[Bytes[256], MULTICALL_MAX_CALLS] = []
+    for call_data in data:
+        success: bool = False
+        response: Bytes[256] = b""
+        success, response = raw_call(self, call_data, max_outsize=256, is_delegate_call=True, revert_on_failure=False)
+        assert success, "MulticallFailed"
+        results.append(response)
+    return results
+
 @external
 def checkDelegateForAll(to: address, from_: address, rights: bytes32) -> bool:
     if self._invalidFrom(from_):
@@ -0,0 +1,113 @@
+import json
+import os
+import pickle
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import cache
+from hashlib import sha256
+from importlib.metadata import version
+from pathlib import Path
+
+from vyper.cli.vyper_compile import get_interface_codes
+from vyper.codegen.core import anchor_opt_level
+from vyper.compiler import OUTPUT_FORMATS
+from vyper.compiler.phases import CompilerData
+from vyper.evm.opcodes import anchor_evm_version
+
+ROOT_DIR = Path(__file__).parents[2]
+ARTIFACTS_DIR = ROOT_DIR / ".cache" / "artifacts"
+SOURCE_DIRS = ("contracts", "tests/stubs")
+FORMATS = ("abi", "bytecode", "bytecode_runtime", "layout")
+
+
+@dataclass(frozen=True)
+class Artifact:
+    """
+    Output of the compilation of a contract, keyed by the hash of its source. The compiler data is kept next to it, so
+    that boa loads the contract with its source maps and storage layout without compiling it again.
+    """
+
+    name: str
+    source_path: str
+    source_hash: str
+    vyper: str
+    abi: list[dict]
+    bytecode: str
+    bytecode_runtime: str
+    layout: dict
+
+    @property
+    def path(self) -> Path:
+        return artifact_path(self.source_path, self.source_hash)
+
+    def compiler_data(self) -> CompilerData:
+        return pickle.loads(self.path.with_suffix(".pickle").read_bytes())
+
+
+def source_paths() -> list[str]:
+    return sorted(str(path.relative_to(ROOT_DIR)) for d in SOURCE_DIRS for path in (ROOT_DIR / d).rglob("*.vy"))
+
+
+def source_hash(source_path: str) -> str:
+    # the path is part of the key, as boa names the contract after it
+    digest = sha256(f"{version('vyper')}:{source_path}:".encode())
+    digest.update((ROOT_DIR / source_path).read_bytes())
+    return digest.hexdigest()
+
+
+def artifact_path(source_path: str, digest: str) -> Path:
+    return ARTIFACTS_DIR / Path(source_path).with_suffix("") / f"{digest}.json"
+
+
+def _write(path: Path, data: bytes):
+    # written to a temporary file first, as several processes may compile the same contract concurrently
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+
+def compile_artifact(source_path: str) -> Artifact:
+    digest = source_hash(source_path)
+    source = (ROOT_DIR / source_path).read_text(encoding="utf8")
+    interface_codes = get_interface_codes(ROOT_DIR, {source_path: source})[source_path]
+    compiler_data = CompilerData(source, source_path, interface_codes)
+    settings = compiler_data.settings
+    with anchor_opt_level(settings.optimize), anchor_evm_version(settings.evm_version):
+        outputs = {output_format: OUTPUT_FORMATS[output_format](compiler_data) for output_format in FORMATS}
+
+    artifact = Artifact(
+        name=Path(source_path).stem, source_path=source_path, source_hash=digest, vyper=version("vyper"), **outputs
+    )
+    path = artifact.path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for stale in [*path.parent.glob("*.json"), *path.parent.glob("*.pickle")]:
+        if stale.stem != digest:
+            stale.unlink(missing_ok=True)
+    # the compiler data is written first, so an artifact is only found once both exist
+    _write(path.with_suffix(".pickle"), pickle.dumps(compiler_data))
+    _write(path, json.dumps(vars(artifact), indent=2).encode())
+    return artifact
+
+
+@cache
+def load_artifact(source_path: str) -> Artifact:
+    """The artifact of the contract at `source_path`, relative to the repository root, compiled if the source changed"""
+
+    path = artifact_path(source_path, source_hash(source_path))
+    if not path.exists():
+        return compile_artifact(source_path)
+    return Artifact(**json.loads(path.read_text()))
+
+
+def build_artifacts(paths: Iterable[str] | None = None, jobs: int | None = None) -> list[str]:
+    """Compiles the contracts without an artifact for their current source, in parallel, returning their paths"""
+
+    paths = source_paths() if paths is None else list(paths)
+    missing = [p for p in paths if not artifact_path(p, source_hash(p)).exists()]
+    if len(missing) == 1:
+        compile_artifact(missing[0])
+    elif missing:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(compile_artifact, missing))
+    return missing
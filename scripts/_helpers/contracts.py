@@ -2,12 +2,12 @@ import json
 from dataclasses import dataclass
 from hashlib import sha3_256
 
-from ape import project
 from ape.contracts.base import ContractContainer, ContractType
 from hexbytes import HexBytes
 from rich import print
 from rich.markup import escape
 
+from .artifacts import load_artifact
 from .basetypes import ContractConfig, DeploymentContext
 from .transactions import check_owner, execute, execute_read
 
@@ -34,7 +34,7 @@ class GenericContract(ContractConfig):
 @dataclass
 class ERC721(ContractConfig):
     def __init__(self, *, key: str, abi_key: str, address: str | None = None):
-        super().__init__(key, None, project.ERC721, abi_key=abi_key, nft=True)
+        super().__init__(key, None, ArtifactContainer("contracts/auxiliary/ERC721.vy"), abi_key=abi_key, nft=True)
         if address:
             self.load_contract(address)
 
@@ -48,7 +48,7 @@ class P2PLendingControl(ContractConfig):
         super().__init__(
             key,
             None,
-            project.P2PLendingControl,
+            ArtifactContainer("contracts/P2PLendingControl.vy"),
             version=version,
             abi_key=abi_key,
             deployment_deps=set(),
@@ -106,11 +106,12 @@ class P2PLendingNfts(ContractConfig):
         max_protocol_settlement_fee: int,
         max_lender_broker_settlement_fee: int,
         max_borrower_broker_settlement_fee: int,
+        sparse_fees: bool = False,
     ):
         super().__init__(
             key,
             None,
-            project.P2PLendingNfts,
+            ArtifactContainer("contracts/P2PLendingNfts.vy"),
             version=version,
             abi_key=abi_key,
             deployment_deps={payment_token_key, delegation_registry_key, cryptopunks_key, p2p_controller_key},
@@ -126,12 +127,62 @@ class P2PLendingNfts(ContractConfig):
                 max_protocol_settlement_fee,
                 max_lender_broker_settlement_fee,
                 max_borrower_broker_settlement_fee,
+                sparse_fees,
             ],
         )
         if address:
             self.load_contract(address)
 
 
+@dataclass
+class P2PLendingRouter(ContractConfig):
+    def __init__(
+        self,
+        *,
+        key: str,
+        version: str | None = None,
+        abi_key: str,
+        p2p_lending_nfts_key: str,
+        address: str | None = None,
+    ):
+        super().__init__(
+            key,
+            None,
+            ArtifactContainer("contracts/P2PLendingRouter.vy"),
+            version=version,
+            abi_key=abi_key,
+            deployment_deps={p2p_lending_nfts_key},
+            deployment_args=[p2p_lending_nfts_key],
+            config_deps={p2p_lending_nfts_key: self.authorize_proxy},
+        )
+        self.p2p_lending_nfts_key = p2p_lending_nfts_key
+        if address:
+            self.load_contract(address)
+
+    def authorize_proxy(self, context: DeploymentContext):
+        # the router acts for the transaction origin, so it must be an authorized proxy of the P2PLendingNfts contract
+        if not context.dryrun and execute_read(context, self.p2p_lending_nfts_key, "authorized_proxies", self.key):
+            print(f"Contract [blue]{escape(self.key)}[/] is already authorized, skipping update")
+            return
+        execute(context, self.p2p_lending_nfts_key, "set_proxy_authorization", self.key, True)  # noqa: FBT003
+
+
+@dataclass
+class P2PLendingLens(ContractConfig):
+    def __init__(self, *, key: str, version: str | None = None, abi_key: str, address: str | None = None):
+        super().__init__(
+            key,
+            None,
+            ArtifactContainer("contracts/P2PLendingLens.vy"),
+            version=version,
+            abi_key=abi_key,
+            deployment_deps=set(),
+            deployment_args=[],
+        )
+        if address:
+            self.load_contract(address)
+
+
 @dataclass
 class CryptoPunks(ContractConfig):
     def __init__(
@@ -145,7 +196,7 @@ class CryptoPunks(ContractConfig):
         super().__init__(
             key,
             None,
-            project.CryptoPunksMarketMock,
+            ArtifactContainer("contracts/auxiliary/CryptoPunksMarketMock.vy"),
             version=version,
             abi_key=abi_key,
             nft=True,
@@ -171,7 +222,7 @@ class ERC20(ContractConfig):
         super().__init__(
             key,
             None,
-            project.WETH9Mock,
+            ArtifactContainer("contracts/auxiliary/WETH9Mock.vy"),
             version=version,
             abi_key=abi_key,
             deployment_args=[name, symbol, decimals, int(supply)],
@@ -219,3 +270,17 @@ class DelegateRegistry2Container(ContractContainer):
             runtimeBytecode=runtime_bytecode,
         )
         super().__init__(contract)
+
+
+class ArtifactContainer(ContractContainer):
+    # loads the precompiled artifact of the contract instead of compiling the project with ape
+    def __init__(self, source_path: str):
+        artifact = load_artifact(source_path)
+        contract = ContractType(
+            contractName=artifact.name,
+            sourceId=artifact.source_path,
+            abi=artifact.abi,
+            deploymentBytecode=HexBytes(artifact.bytecode),
+            runtimeBytecode=HexBytes(artifact.bytecode_runtime),
+        )
+        super().__init__(contract)
@@ -0,0 +1,148 @@
+import json
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+from typing import Any
+
+from eth_abi import decode
+from eth_utils import keccak, to_checksum_address
+from hexbytes import HexBytes
+
+from .artifacts import load_artifact
+
+ROOT_DIR = Path(__file__).parents[2]
+CONFIGS_DIR = ROOT_DIR / "configs"
+
+LOG_CHUNK_SIZE = 2000
+
+
+@cache
+def load_abi(contract_name: str) -> tuple[dict, ...]:
+    return tuple(load_artifact(f"contracts/{contract_name}.vy").abi)
+
+
+def load_contract_address(env: str, key: str) -> str:
+    config_file = CONFIGS_DIR / env / "p2p.json"
+    with config_file.open(encoding="utf8") as f:
+        config = json.load(f)
+    return config["p2p"][key]["address"]
+
+
+def to_hex(value: str | bytes) -> str:
+    return "0x" + bytes(HexBytes(value)).hex()
+
+
+def to_int(value: str | int) -> int:
+    return int(value, 16) if isinstance(value, str) else value
+
+
+def abi_type(abi_input: dict) -> str:
+    typ = abi_input["type"]
+    if typ.startswith("tuple"):
+        components = ",".join(abi_type(c) for c in abi_input["components"])
+        return f"({components}){typ[5:]}"
+    return typ
+
+
+def to_python(value: Any, abi_input: dict) -> Any:
+    typ = abi_input["type"]
+    if typ.startswith("tuple"):
+        if typ.endswith("]"):
+            return [to_python(v, abi_input | {"type": typ[: typ.rindex("[")]}) for v in value]
+        return {c["name"]: to_python(v, c) for v, c in zip(value, abi_input["components"])}
+    if typ.endswith("]"):
+        inner = abi_input | {"type": typ[: typ.rindex("[")]}
+        return [to_python(v, inner) for v in value]
+    if typ == "address":
+        return to_checksum_address(value)
+    if typ.startswith("bytes"):
+        return "0x" + value.hex()
+    return value
+
+
+@dataclass(frozen=True)
+class DecodedEvent:
+    name: str
+    args: dict[str, Any]
+    address: str
+    block_number: int
+    block_hash: str
+    transaction_hash: str
+    log_index: int
+
+    def __getitem__(self, key):
+        return self.args[key]
+
+
+@dataclass(frozen=True)
+class EventAbi:
+    name: str
+    inputs: tuple[dict, ...]
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}({','.join(abi_type(i) for i in self.inputs)})"
+
+    @property
+    def topic(self) -> bytes:
+        return keccak(text=self.signature)
+
+    def decode(self, topics: list[bytes], data: bytes) -> dict[str, Any]:
+        indexed = [i for i in self.inputs if i.get("indexed")]
+        not_indexed = [i for i in self.inputs if not i.get("indexed")]
+        indexed_values = [decode([abi_type(i)], t)[0] for i, t in zip(indexed, topics[1:])]
+        data_values = decode([abi_type(i) for i in not_indexed], data)
+        values = dict(zip((i["name"] for i in indexed), indexed_values)) | dict(
+            zip((i["name"] for i in not_indexed), data_values)
+        )
+        return {i["name"]: to_python(values[i["name"]], i) for i in self.inputs}
+
+
+class EventDecoder:
+    def __init__(self, abi: Iterable[dict], names: Iterable[str] | None = None):
+        events = [EventAbi(e["name"], tuple(e["inputs"])) for e in abi if e["type"] == "event"]
+        if names is not None:
+            names = set(names)
+            events = [e for e in events if e.name in names]
+        self.events = {e.topic: e for e in events}
+
+    @classmethod
+    def for_contract(cls, contract_name: str, names: Iterable[str] | None = None):
+        return cls(load_abi(contract_name), names)
+
+    @property
+    def topics(self) -> list[str]:
+        return ["0x" + t.hex() for t in self.events]
+
+    def decode(self, log: dict) -> DecodedEvent | None:
+        topics = [HexBytes(t) for t in log["topics"]]
+        if not topics or bytes(topics[0]) not in self.events:
+            return None
+        event = self.events[bytes(topics[0])]
+        return DecodedEvent(
+            name=event.name,
+            args=event.decode(topics, HexBytes(log["data"])),
+            address=to_checksum_address(log["address"]),
+            block_number=to_int(log["blockNumber"]),
+            block_hash=to_hex(log["blockHash"]),
+            transaction_hash=to_hex(log["transactionHash"]),
+            log_index=to_int(log["logIndex"]),
+        )
+
+    def decode_all(self, logs: Iterable[dict]) -> Iterator[DecodedEvent]:
+        for log in logs:
+            event = self.decode(log)
+            if event is not None:
+                yield event
+
+
+def iter_logs(
+    w3, address: str, from_block: int, to_block: int, *, topics: list[str] | None = None, chunk_size: int = LOG_CHUNK_SIZE
+) -> Iterator[dict]:
+    for start in range(from_block, to_block + 1, chunk_size):
+        end = min(start + chunk_size - 1, to_block)
+        log_filter = {"address": address, "fromBlock": start, "toBlock": end}
+        if topics:
+            log_filter["topics"] = [topics]
+        yield from w3.eth.get_logs(log_filter)
@@ -0,0 +1,221 @@
+import json
+from collections.abc import Callable, Iterable
+from datetime import UTC, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .events import DecodedEvent
+
+LIFECYCLE_EVENTS = ("LoanCreated", "LoanReplaced", "LoanReplacedByLender", "LoanPaid", "LoanCollateralClaimed")
+
+# vyper enums are bit flags, values match FeeType in P2PLendingNfts
+FEE_TYPES = {1: "protocol", 2: "origination", 4: "lender_broker", 8: "borrower_broker"}
+
+STATE_FILE = "_export_state.json"
+UNKNOWN_COLLECTION = "unknown"
+
+AMOUNT = pa.decimal128(38, 0)
+TIMESTAMP = pa.timestamp("s", tz="UTC")
+
+SCHEMA = pa.schema(
+    [
+        ("event", pa.string()),
+        ("block_number", pa.int64()),
+        ("block_timestamp", TIMESTAMP),
+        ("transaction_hash", pa.string()),
+        ("log_index", pa.int32()),
+        ("contract", pa.string()),
+        ("loan_id", pa.string()),
+        ("original_loan_id", pa.string()),
+        ("offer_id", pa.string()),
+        ("offer_tracing_id", pa.string()),
+        ("borrower", pa.string()),
+        ("lender", pa.string()),
+        ("payment_token", pa.string()),
+        ("collateral_contract", pa.string()),
+        ("collateral_token_id", pa.string()),
+        ("amount", AMOUNT),
+        ("interest", AMOUNT),
+        ("start_time", TIMESTAMP),
+        ("maturity", TIMESTAMP),
+        ("pro_rata", pa.bool_()),
+        ("delegate", pa.string()),
+        ("paid_principal", AMOUNT),
+        ("paid_interest", AMOUNT),
+        ("borrower_compensation", AMOUNT),
+        *[
+            field
+            for fee in FEE_TYPES.values()
+            for field in (
+                (f"{fee}_fee_upfront_amount", AMOUNT),
+                (f"{fee}_fee_interest_bps", pa.int32()),
+                (f"{fee}_fee_wallet", pa.string()),
+                (f"{fee}_settlement_fee_amount", AMOUNT),
+                (f"{fee}_settlement_fee_wallet", pa.string()),
+            )
+        ],
+    ]
+)
+
+
+def _amount(value: int | None) -> Decimal | None:
+    return Decimal(value) if value is not None else None
+
+
+def flatten_event(event: DecodedEvent, block_timestamp: int) -> dict[str, Any]:
+    args = event.args
+    row = {
+        "event": event.name,
+        "block_number": event.block_number,
+        "block_timestamp": block_timestamp,
+        "transaction_hash": event.transaction_hash,
+        "log_index": event.log_index,
+        "contract": event.address,
+        "loan_id": args["id"],
+        "original_loan_id": args.get("original_loan_id"),
+        "offer_id": args.get("offer_id"),
+        "offer_tracing_id": args.get("offer_tracing_id"),
+        "borrower": args.get("borrower"),
+        "lender": args.get("lender"),
+        "payment_token": args.get("payment_token"),
+        "collateral_contract": args.get("collateral_contract"),
+        "collateral_token_id": str(args["collateral_token_id"]) if "collateral_token_id" in args else None,
+        "amount": _amount(args.get("amount")),
+        "interest": _amount(args.get("interest")),
+        "start_time": args.get("start_time"),
+        "maturity": args.get("maturity"),
+        "pro_rata": args.get("pro_rata"),
+        "delegate": args.get("delegate"),
+        "paid_principal": _amount(args.get("paid_principal")),
+        "paid_interest": _amount(args.get("paid_interest")),
+        "borrower_compensation": _amount(args.get("borrower_compensation")),
+    }
+    for fee in args.get("fees", []):
+        name = FEE_TYPES[fee["type"]]
+        row[f"{name}_fee_upfront_amount"] = _amount(fee["upfront_amount"])
+        row[f"{name}_fee_interest_bps"] = fee["interest_bps"]
+        row[f"{name}_fee_wallet"] = fee["wallet"]
+    for fee in args.get("paid_settlement_fees", []):
+        name = FEE_TYPES[fee["type"]]
+        row[f"{name}_settlement_fee_amount"] = _amount(fee["amount"])
+        row[f"{name}_settlement_fee_wallet"] = fee["wallet"]
+    return row
+
+
+class PartitionWriter:
+    def __init__(self, path: Path, row_group_size: int):
+        self.path = path
+        self.tmp_path = path.with_suffix(".inprogress")
+        self.row_group_size = row_group_size
+        self.rows: list[dict] = []
+        self.writer: pq.ParquetWriter | None = None
+
+    def append(self, row: dict):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.writer = pq.ParquetWriter(self.tmp_path, SCHEMA)
+        self.writer.write_table(pa.Table.from_pylist(self.rows, schema=SCHEMA), row_group_size=self.row_group_size)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.tmp_path.rename(self.path)
+            self.writer = None
+
+
+class ParquetExporter:
+    """
+    Streams decoded P2PLendingNfts lifecycle events into hive style partitions
+    `date=YYYY-MM-DD/collection=<address>/part-<from_block>.parquet`.
+    Each run writes new part files, so later runs append to existing partitions.
+    Only the loans still active are kept in memory (and in the state file), to
+    resolve the collection of `LoanPaid` events.
+    """
+
+    def __init__(self, root: Path, row_group_size: int = 50_000):
+        self.root = root
+        self.row_group_size = row_group_size
+        self.writers: dict[tuple[str, str], PartitionWriter] = {}
+        self.current_date: str | None = None
+        self.rows_written = 0
+        state = self._load_state()
+        self.last_block: int | None = state.get("last_block")
+        self.active_loans: dict[str, list] = state.get("active_loans", {})
+        self.run_block: int | None = None
+
+    def _load_state(self) -> dict:
+        state_file = self.root / STATE_FILE
+        if not state_file.exists():
+            return {}
+        with state_file.open(encoding="utf8") as f:
+            return json.load(f)
+
+    def _save_state(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        state_file = self.root / STATE_FILE
+        tmp_file = state_file.with_suffix(".tmp")
+        with tmp_file.open("w", encoding="utf8") as f:
+            json.dump({"last_block": self.last_block, "active_loans": self.active_loans}, f)
+        tmp_file.rename(state_file)
+
+    def next_block(self, default: int = 0) -> int:
+        return self.last_block + 1 if self.last_block is not None else default
+
+    def _writer(self, date: str, collection: str) -> PartitionWriter:
+        key = (date, collection)
+        if key not in self.writers:
+            path = self.root / f"date={date}" / f"collection={collection}" / f"part-{self.run_block:012d}.parquet"
+            self.writers[key] = PartitionWriter(path, self.row_group_size)
+        return self.writers[key]
+
+    def _close_writers(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+    def _track_loan(self, row: dict):
+        if row["event"] in {"LoanCreated", "LoanReplaced", "LoanReplacedByLender"}:
+            self.active_loans.pop(row["original_loan_id"], None)
+            self.active_loans[row["loan_id"]] = [row["collateral_contract"], row["collateral_token_id"]]
+        elif row["event"] == "LoanPaid":
+            row["collateral_contract"], row["collateral_token_id"] = self.active_loans.pop(row["loan_id"], [None, None])
+        elif row["event"] == "LoanCollateralClaimed":
+            self.active_loans.pop(row["loan_id"], None)
+
+    def write(self, event: DecodedEvent, block_timestamp: int):
+        if self.run_block is None:
+            self.run_block = event.block_number
+        row = flatten_event(event, block_timestamp)
+        self._track_loan(row)
+
+        date = datetime.fromtimestamp(block_timestamp, tz=UTC).date().isoformat()
+        if date != self.current_date:
+            # events are ordered by block, so partitions from previous days are complete
+            self._close_writers()
+            self.current_date = date
+
+        self._writer(date, row["collateral_contract"] or UNKNOWN_COLLECTION).append(row)
+        self.rows_written += 1
+
+    def export(self, events: Iterable[DecodedEvent], block_timestamp: Callable[[int], int], to_block: int):
+        try:
+            for event in events:
+                if event.name in LIFECYCLE_EVENTS:
+                    self.write(event, block_timestamp(event.block_number))
+        finally:
+            self._close_writers()
+        self.last_block = to_block
+        self._save_state()
@@ -0,0 +1,204 @@
+import asyncio
+import contextlib
+import inspect
+import logging
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from eth_utils import keccak
+from hexbytes import HexBytes
+
+from .events import DecodedEvent, EventDecoder, to_hex, to_int
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+@dataclass(frozen=True)
+class Block:
+    number: int
+    hash: str
+    timestamp: int
+    logs_bloom: bytes = b""
+
+
+@dataclass(frozen=True)
+class BlockEvents:
+    block: Block
+    events: list[DecodedEvent]
+
+
+Consumer = Callable[[BlockEvents], Awaitable[None] | None]
+
+
+def bloom_contains(bloom: bytes, value: bytes) -> bool:
+    if not bloom:
+        return True
+    hash_ = keccak(value)
+    bloom_int = int.from_bytes(bloom, "big")
+    for i in range(0, 6, 2):
+        bit = int.from_bytes(hash_[i : i + 2], "big") & 2047
+        if not bloom_int >> bit & 1:
+            return False
+    return True
+
+
+class LatencyStats:
+    def __init__(self, window: int = 10_000):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, p: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": max(self.samples, default=None),
+        }
+
+
+@dataclass
+class ConsumerHandle:
+    name: str
+    callback: Consumer
+    queue: asyncio.Queue
+    latency: LatencyStats = field(default_factory=LatencyStats)
+    errors: int = 0
+    task: asyncio.Task | None = None
+
+    async def run(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                result = self.callback(item)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                self.errors += 1
+                logger.exception("consumer %s failed handling block %s", self.name, item.block.number)
+            else:
+                self.latency.add(time.time() - item.block.timestamp)
+            finally:
+                self.queue.task_done()
+
+    def metrics(self) -> dict:
+        return {"queued": self.queue.qsize(), "errors": self.errors, "latency": self.latency.summary()}
+
+
+class BlockListener:
+    """
+    Follows the chain head and fans out the P2PLendingNfts events of each new block to the registered consumers.
+
+    New heads come from a `newHeads` subscription when `w3` has a persistent websocket connection, otherwise the
+    block number is polled. Every block is delivered to each consumer, in order, even if it had no events (eg to
+    drive time based logic). Each consumer has a bounded queue and the listener waits for room in all of them
+    before moving on, so slow consumers apply backpressure instead of growing memory. Consumers are plain functions,
+    or coroutine functions when they need to await.
+    """
+
+    def __init__(
+        self,
+        w3,
+        address: str,
+        decoder: EventDecoder,
+        *,
+        from_block: int | None = None,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        use_subscription: bool | None = None,
+    ):
+        self.w3 = w3
+        self.address = address
+        self.decoder = decoder
+        self.next_block = from_block
+        self.poll_interval = poll_interval
+        self.use_subscription = hasattr(w3, "ws") if use_subscription is None else use_subscription
+        self.consumers: dict[str, ConsumerHandle] = {}
+        self.fetch_latency = LatencyStats()
+        self.blocks_processed = 0
+        self.logs_requests = 0
+        self._stopped = asyncio.Event()
+
+    def register(self, name: str, callback: Consumer, queue_size: int = DEFAULT_QUEUE_SIZE) -> ConsumerHandle:
+        handle = ConsumerHandle(name, callback, asyncio.Queue(maxsize=queue_size))
+        self.consumers[name] = handle
+        return handle
+
+    async def _get_block(self, number: int) -> Block:
+        block = await self.w3.eth.get_block(number)
+        return Block(block["number"], to_hex(block["hash"]), block["timestamp"], bytes(HexBytes(block.get("logsBloom", b""))))
+
+    async def _get_events(self, block: Block) -> list[DecodedEvent]:
+        # skip the eth_getLogs roundtrip when the header bloom filter rules out logs from the contract
+        if not bloom_contains(block.logs_bloom, bytes(HexBytes(self.address))):
+            return []
+        self.logs_requests += 1
+        logs = await self.w3.eth.get_logs({"address": self.address, "blockHash": block.hash})
+        return list(self.decoder.decode_all(logs))
+
+    async def process_until(self, head: int):
+        if self.next_block is None:
+            self.next_block = head
+        while self.next_block <= head and not self._stopped.is_set():
+            block = await self._get_block(self.next_block)
+            item = BlockEvents(block, await self._get_events(block))
+            self.fetch_latency.add(time.time() - block.timestamp)
+            for consumer in self.consumers.values():
+                await consumer.queue.put(item)
+            self.blocks_processed += 1
+            self.next_block += 1
+
+    async def _heads(self):
+        if self.use_subscription:
+            await self.w3.eth.subscribe("newHeads")
+            async for message in self.w3.ws.process_subscriptions():
+                yield to_int(message["result"]["number"])
+        else:
+            while True:
+                yield await self.w3.eth.block_number
+                await asyncio.sleep(self.poll_interval)
+
+    async def run(self):
+        for consumer in self.consumers.values():
+            consumer.task = asyncio.create_task(consumer.run(), name=f"consumer-{consumer.name}")
+        try:
+            async for head in self._heads():
+                await self.process_until(head)
+                if self._stopped.is_set():
+                    break
+            await self.drain()
+        finally:
+            for consumer in self.consumers.values():
+                consumer.task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await consumer.task
+
+    async def drain(self):
+        for consumer in self.consumers.values():
+            await consumer.queue.join()
+
+    def stop(self):
+        self._stopped.set()
+
+    def metrics(self) -> dict:
+        return {
+            "next_block": self.next_block,
+            "blocks_processed": self.blocks_processed,
+            "logs_requests": self.logs_requests,
+            "fetch_latency": self.fetch_latency.summary(),
+            "consumers": {name: c.metrics() for name, c in self.consumers.items()},
+        }
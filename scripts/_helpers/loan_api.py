@@ -0,0 +1,225 @@
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from functools import wraps
+from itertools import islice
+
+from aiohttp import web
+from eth_utils import is_address, to_checksum_address
+
+from .events import DecodedEvent
+from .listener import BlockEvents, LatencyStats
+from .loans import LoanBook
+
+DEFAULT_CACHE_SIZE = 100_000
+MAX_LIST_LIMIT = 10_000
+
+BOOK_KEY = web.AppKey("book", LoanBook)
+LATENCY_KEY = web.AppKey("latency", LatencyStats)
+
+
+def _json_value(value):
+    # uint256 values don't fit in javascript numbers, so integers are serialized as strings
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, dict):
+        return {k: _json_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_json_value(v) for v in value]
+    return value
+
+
+def encode_loan(loan: dict) -> bytes:
+    return json.dumps(_json_value(loan), separators=(",", ":")).encode()
+
+
+class LoanCache:
+    """LRU cache of the JSON encoded loans, read through from the LoanBook"""
+
+    def __init__(self, book: LoanBook, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.book = book
+        self.maxsize = maxsize
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, loan_id: str) -> bytes | None:
+        encoded = self.entries.get(loan_id)
+        if encoded is not None:
+            self.hits += 1
+            self.entries.move_to_end(loan_id)
+            return encoded
+
+        self.misses += 1
+        loan = self.book.get(loan_id)
+        if loan is None:
+            return None
+        encoded = self.entries[loan_id] = encode_loan(loan)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return encoded
+
+    def invalidate(self, loan_ids: Iterable[str]):
+        for loan_id in loan_ids:
+            self.entries.pop(loan_id, None)
+
+    def metrics(self) -> dict:
+        return {"size": len(self.entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+CACHE_KEY = web.AppKey("cache", LoanCache)
+
+
+def apply_events(app: web.Application, events: Iterable[DecodedEvent]):
+    app[CACHE_KEY].invalidate(app[BOOK_KEY].apply_all(events))
+
+
+def block_consumer(app: web.Application):
+    def _consume(item: BlockEvents):
+        apply_events(app, item.events)
+        app[BOOK_KEY].last_block = item.block.number
+
+    return _consume
+
+
+def _address(request: web.Request, key: str) -> str:
+    value = request.match_info[key]
+    if not is_address(value):
+        raise web.HTTPBadRequest(text=f"invalid address {value}")
+    return to_checksum_address(value)
+
+
+def _loan_id(request: web.Request) -> str:
+    value = request.match_info["loan_id"].lower()
+    if not value.startswith("0x"):
+        value = "0x" + value
+    return value
+
+
+def _loans_response(cache: LoanCache, loan_ids: Iterable[str]) -> web.Response:
+    body = b"[" + b",".join(encoded for loan_id in loan_ids if (encoded := cache.get(loan_id)) is not None) + b"]"
+    return web.Response(body=body, content_type="application/json")
+
+
+def get_loan(request: web.Request) -> web.Response:
+    encoded = request.app[CACHE_KEY].get(_loan_id(request))
+    if encoded is None:
+        raise web.HTTPNotFound(text="loan not found or not active")
+    return web.Response(body=encoded, content_type="application/json")
+
+
+def get_current_loan(request: web.Request) -> web.Response:
+    app = request.app
+    loan_id = app[BOOK_KEY].current_loan(_loan_id(request))
+    encoded = app[CACHE_KEY].get(loan_id) if loan_id else None
+    if encoded is None:
+        raise web.HTTPNotFound(text="loan not found or no longer active")
+    return web.Response(body=encoded, content_type="application/json")
+
+
+def list_loans(request: web.Request) -> web.Response:
+    try:
+        limit = int(request.query.get("limit", 100))
+    except ValueError:
+        raise web.HTTPBadRequest(text="invalid limit") from None
+    if limit < 0:
+        raise web.HTTPBadRequest(text="invalid limit")
+    limit = min(limit, MAX_LIST_LIMIT)
+    return web.json_response(list(islice(request.app[BOOK_KEY].loans, limit)))
+
+
+def get_borrower_loans(request: web.Request) -> web.Response:
+    app = request.app
+    return _loans_response(app[CACHE_KEY], app[BOOK_KEY].borrower_loans(_address(request, "borrower")))
+
+
+def get_lender_loans(request: web.Request) -> web.Response:
+    app = request.app
+    return _loans_response(app[CACHE_KEY], app[BOOK_KEY].lender_loans(_address(request, "lender")))
+
+
+def get_collateral_loan(request: web.Request) -> web.Response:
+    app = request.app
+    try:
+        token_id = int(request.match_info["token_id"])
+    except ValueError:
+        raise web.HTTPBadRequest(text="invalid token id") from None
+    loan_id = app[BOOK_KEY].collateral_loan(_address(request, "collateral_contract"), token_id)
+    encoded = app[CACHE_KEY].get(loan_id) if loan_id else None
+    if encoded is None:
+        raise web.HTTPNotFound(text="collateral not in an active loan")
+    return web.Response(body=encoded, content_type="application/json")
+
+
+def get_collection_collateral(request: web.Request) -> web.Response:
+    token_ids = request.app[BOOK_KEY].collateral.collateral_token_ids(_address(request, "collateral_contract"))
+    return web.json_response([str(token_id) for token_id in sorted(token_ids)])
+
+
+async def flag_collection_collateral(request: web.Request) -> web.Response:
+    collateral_contract = _address(request, "collateral_contract")
+    try:
+        body = await request.json()
+        if not isinstance(body, list):
+            raise TypeError  # noqa: TRY301
+        token_ids = [int(token_id) for token_id in body]
+    except (json.JSONDecodeError, ValueError, TypeError):
+        raise web.HTTPBadRequest(text="expected a list of token ids") from None
+    if len(token_ids) > MAX_LIST_LIMIT:
+        raise web.HTTPBadRequest(text=f"at most {MAX_LIST_LIMIT} token ids per request")
+    flags = request.app[BOOK_KEY].collateral.flag(collateral_contract, token_ids)
+    return web.json_response({str(token_id): loan_id for token_id, loan_id in flags.items()})
+
+
+def get_status(request: web.Request) -> web.Response:
+    app = request.app
+    return web.json_response(
+        {
+            "last_block": app[BOOK_KEY].last_block,
+            "active_loans": len(app[BOOK_KEY]),
+            "cache": app[CACHE_KEY].metrics(),
+            "latency": app[LATENCY_KEY].summary(),
+        }
+    )
+
+
+def _view(view: Callable[[web.Request], web.Response]):
+    # aiohttp only takes coroutine handlers, the views read the in memory LoanBook and never wait for anything
+    @wraps(view)
+    async def handler(request: web.Request) -> web.Response:  # noqa: RUF029
+        return view(request)
+
+    return handler
+
+
+@web.middleware
+async def latency_middleware(request: web.Request, handler):
+    start = time.perf_counter()
+    try:
+        return await handler(request)
+    finally:
+        request.app[LATENCY_KEY].add(time.perf_counter() - start)
+
+
+def create_app(book: LoanBook, cache_size: int = DEFAULT_CACHE_SIZE) -> web.Application:
+    app = web.Application(middlewares=[latency_middleware])
+    app[BOOK_KEY] = book
+    app[CACHE_KEY] = LoanCache(book, cache_size)
+    app[LATENCY_KEY] = LatencyStats()
+    app.add_routes(
+        [
+            web.get("/loans", _view(list_loans)),
+            web.get("/loans/{loan_id}", _view(get_loan)),
+            web.get("/loans/{loan_id}/current", _view(get_current_loan)),
+            web.get("/borrowers/{borrower}/loans", _view(get_borrower_loans)),
+            web.get("/lenders/{lender}/loans", _view(get_lender_loans)),
+            web.get("/collateral/{collateral_contract}", _view(get_collection_collateral)),
+            web.post("/collateral/{collateral_contract}", flag_collection_collateral),
+            web.get("/collateral/{collateral_contract}/{token_id}", _view(get_collateral_loan)),
+            web.get("/status", _view(get_status)),
+        ]
+    )
+    return app
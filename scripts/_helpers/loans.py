@@ -0,0 +1,162 @@
+from collections import defaultdict
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+from .events import DecodedEvent
+
+LOAN_EVENTS = ("LoanCreated", "LoanReplaced", "LoanReplacedByLender", "LoanPaid", "LoanCollateralClaimed")
+OPENING_EVENTS = {"LoanCreated", "LoanReplaced", "LoanReplacedByLender"}
+
+# field order of the Loan struct in P2PLendingNfts, so loans can be passed as is to settle/replace/claim
+LOAN_FIELDS = (
+    "id",
+    "offer_id",
+    "offer_tracing_id",
+    "amount",
+    "interest",
+    "payment_token",
+    "maturity",
+    "start_time",
+    "borrower",
+    "lender",
+    "collateral_contract",
+    "collateral_token_id",
+    "fees",
+    "pro_rata",
+    "delegate",
+)
+
+
+def loan_from_event(event: DecodedEvent, delegate: str | None = None) -> dict:
+    # LoanReplaced* events don't include the delegate, which is kept from the replaced loan
+    args = {"delegate": delegate} | event.args
+    return {field: args[field] for field in LOAN_FIELDS}
+
+
+@dataclass
+class LoanChain:
+    current: str | None
+    loan_ids: list[str] = field(default_factory=list)
+
+
+class CollateralIndex:
+    """
+    Maps each collateral, `(collateral_contract, collateral_token_id)`, to its current loan id.
+    Loans replaced through `replace_loan`/`replace_loan_lender` share a chain with the loans replacing them, so any
+    loan id in the chain also resolves to the current one, in constant time. Chains are dropped once their current loan
+    is settled or claimed, so the index only grows with the active loans.
+    """
+
+    def __init__(self):
+        self.by_collection: dict[str, dict[int, str]] = defaultdict(dict)
+        self.chains: dict[str, LoanChain] = {}
+
+    def __len__(self):
+        return sum(len(tokens) for tokens in self.by_collection.values())
+
+    def get(self, collateral_contract: str, collateral_token_id: int) -> str | None:
+        tokens = self.by_collection.get(collateral_contract)
+        return tokens.get(collateral_token_id) if tokens else None
+
+    def resolve(self, loan_id: str) -> str | None:
+        # the current loan of the chain, None if the chain ended (settled or claimed) or the loan is unknown
+        chain = self.chains.get(loan_id)
+        return chain.current if chain else None
+
+    def collateral_token_ids(self, collateral_contract: str) -> set[int]:
+        return set(self.by_collection.get(collateral_contract, ()))
+
+    def flag(self, collateral_contract: str, token_ids: Iterable[int]) -> dict[int, str | None]:
+        tokens = self.by_collection.get(collateral_contract, {})
+        return {token_id: tokens.get(token_id) for token_id in token_ids}
+
+    def add(self, loan: dict, original_loan_id: str | None = None):
+        chain = self.chains.get(original_loan_id) if original_loan_id else None
+        if chain is None:
+            chain = LoanChain(loan["id"])
+        chain.current = loan["id"]
+        chain.loan_ids.append(loan["id"])
+        self.chains[loan["id"]] = chain
+        self.by_collection[loan["collateral_contract"]][loan["collateral_token_id"]] = loan["id"]
+
+    def remove(self, loan: dict, *, replaced: bool = False):
+        # a replaced loan keeps its chain for the loan replacing it, added right after
+        chain = self.chains.get(loan["id"])
+        if chain and chain.current == loan["id"]:
+            chain.current = None
+            if not replaced:
+                for loan_id in chain.loan_ids:
+                    del self.chains[loan_id]
+        tokens = self.by_collection.get(loan["collateral_contract"])
+        if tokens and tokens.get(loan["collateral_token_id"]) == loan["id"]:
+            del tokens[loan["collateral_token_id"]]
+            if not tokens:
+                del self.by_collection[loan["collateral_contract"]]
+
+
+class LoanBook:
+    """
+    Active P2PLendingNfts loans, rebuilt from the contract events, indexed by loan id, borrower, lender and collateral.
+    """
+
+    def __init__(self):
+        self.loans: dict[str, dict] = {}
+        self.by_borrower: dict[str, set[str]] = defaultdict(set)
+        self.by_lender: dict[str, set[str]] = defaultdict(set)
+        self.collateral = CollateralIndex()
+        self.last_block: int | None = None
+
+    def __len__(self):
+        return len(self.loans)
+
+    def get(self, loan_id: str) -> dict | None:
+        return self.loans.get(loan_id)
+
+    def borrower_loans(self, borrower: str) -> list[str]:
+        return sorted(self.by_borrower.get(borrower, ()))
+
+    def lender_loans(self, lender: str) -> list[str]:
+        return sorted(self.by_lender.get(lender, ()))
+
+    def collateral_loan(self, collateral_contract: str, collateral_token_id: int) -> str | None:
+        return self.collateral.get(collateral_contract, collateral_token_id)
+
+    def current_loan(self, loan_id: str) -> str | None:
+        return self.collateral.resolve(loan_id)
+
+    def _add(self, loan: dict, original_loan_id: str | None = None):
+        self.loans[loan["id"]] = loan
+        self.by_borrower[loan["borrower"]].add(loan["id"])
+        self.by_lender[loan["lender"]].add(loan["id"])
+        self.collateral.add(loan, original_loan_id)
+
+    def _remove(self, loan_id: str, *, replaced: bool = False) -> dict | None:
+        loan = self.loans.pop(loan_id, None)
+        if loan is None:
+            return None
+        for index, key in ((self.by_borrower, loan["borrower"]), (self.by_lender, loan["lender"])):
+            index[key].discard(loan_id)
+            if not index[key]:
+                del index[key]
+        self.collateral.remove(loan, replaced=replaced)
+        return loan
+
+    def apply(self, event: DecodedEvent) -> list[str]:
+        # returns the ids of the loans no longer active, eg to invalidate caches
+        closed = []
+        delegate = None
+        if event.name in {"LoanReplaced", "LoanReplacedByLender"}:
+            original_loan = self._remove(event["original_loan_id"], replaced=True)
+            closed.append(event["original_loan_id"])
+            delegate = original_loan["delegate"] if original_loan else None
+        elif event.name in {"LoanPaid", "LoanCollateralClaimed"}:
+            self._remove(event["id"])
+            closed.append(event["id"])
+
+        if event.name in OPENING_EVENTS:
+            self._add(loan_from_event(event, delegate), event.args.get("original_loan_id"))
+        self.last_block = event.block_number
+        return closed
+
+    def apply_all(self, events: Iterable[DecodedEvent]) -> list[str]:
+        return [loan_id for event in events if event.name in LOAN_EVENTS for loan_id in self.apply(event)]
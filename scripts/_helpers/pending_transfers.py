@@ -0,0 +1,107 @@
+from collections import defaultdict
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+
+from eth_abi import decode, encode
+from eth_utils import function_signature_to_4byte_selector, to_checksum_address
+
+from .events import DecodedEvent, load_abi
+
+PENDING_TRANSFERS_EVENTS = ("TransferFailed", "PendingTransfersClaimed")
+
+# Multicall3 is deployed at the same address in mainnet and most other chains, see https://www.multicall3.com
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL_CHUNK_SIZE = 500
+
+AGGREGATE3_SELECTOR = function_signature_to_4byte_selector("aggregate3((address,bool,bytes)[])")
+PENDING_TRANSFERS_SELECTOR = function_signature_to_4byte_selector("pending_transfers(address)")
+
+
+@dataclass(frozen=True)
+class Mismatch:
+    wallet: str
+    tracked: int
+    onchain: int
+
+
+class PendingTransfersTracker:
+    """
+    Per wallet balances of `pending_transfers`, aggregated from the `TransferFailed` and `PendingTransfersClaimed` events.
+    `last_block` is the last block whose events were applied, whether or not it had any.
+    """
+
+    def __init__(self):
+        self.balances: dict[str, int] = defaultdict(int)
+        self.failed_transfers: dict[str, int] = defaultdict(int)
+        self.last_block: int | None = None
+
+    def apply(self, event: DecodedEvent) -> str | None:
+        # returns the wallet whose balance changed, if any
+        if event.name == "TransferFailed":
+            self.balances[event["_to"]] += event["amount"]
+            self.failed_transfers[event["_to"]] += 1
+        elif event.name == "PendingTransfersClaimed":
+            self.balances.pop(event["_to"], None)
+        else:
+            return None
+        return event["_to"]
+
+    def apply_all(self, events: Iterable[DecodedEvent], to_block: int | None = None) -> set[str]:
+        # to_block is the last block scanned for the events, recorded so that the on-chain reads match the balances
+        changed = {wallet for event in events if (wallet := self.apply(event)) is not None}
+        if to_block is not None:
+            self.last_block = to_block
+        return changed
+
+    def pending(self, min_amount: int = 1) -> dict[str, int]:
+        return {wallet: amount for wallet, amount in self.balances.items() if amount >= min_amount}
+
+    def verify(self, onchain: dict[str, int]) -> list[Mismatch]:
+        return [
+            Mismatch(wallet, self.balances.get(wallet, 0), amount)
+            for wallet, amount in onchain.items()
+            if self.balances.get(wallet, 0) != amount
+        ]
+
+    def reconcile(self, onchain: dict[str, int]):
+        for wallet, amount in onchain.items():
+            if amount:
+                self.balances[wallet] = amount
+            else:
+                self.balances.pop(wallet, None)
+
+
+def encode_pending_transfers_calls(p2p_address: str, wallets: Sequence[str]) -> bytes:
+    calls = [(p2p_address, False, PENDING_TRANSFERS_SELECTOR + encode(["address"], [wallet])) for wallet in wallets]
+    return AGGREGATE3_SELECTOR + encode(["(address,bool,bytes)[]"], [calls])
+
+
+def decode_pending_transfers_results(wallets: Sequence[str], data: bytes) -> dict[str, int]:
+    (results,) = decode(["(bool,bytes)[]"], data)
+    return {to_checksum_address(wallet): decode(["uint256"], result)[0] for wallet, (_, result) in zip(wallets, results)}
+
+
+def read_pending_transfers(
+    w3,
+    p2p_address: str,
+    wallets: Sequence[str],
+    chunk_size: int = MULTICALL_CHUNK_SIZE,
+    block_identifier: int | str = "latest",
+) -> dict[str, int]:
+    # reads pending_transfers for all the wallets, batched in Multicall3 calls or one call per wallet when the chain
+    # has no Multicall3 (eg a local node). To reconcile a tracker, read at its last_block, otherwise the events of the
+    # later blocks would be counted twice once applied
+    wallets = list(wallets)
+    if not w3.eth.get_code(MULTICALL3_ADDRESS, block_identifier):
+        p2p = w3.eth.contract(address=p2p_address, abi=load_abi("P2PLendingNfts"))
+        return {
+            to_checksum_address(w): p2p.functions.pending_transfers(w).call(block_identifier=block_identifier) for w in wallets
+        }
+
+    pending = {}
+    for start in range(0, len(wallets), chunk_size):
+        chunk = wallets[start : start + chunk_size]
+        tx = {"to": MULTICALL3_ADDRESS, "data": encode_pending_transfers_calls(p2p_address, chunk)}
+        data = w3.eth.call(tx, block_identifier)
+        pending |= decode_pending_transfers_results(chunk, data)
+    return pending
@@ -0,0 +1,576 @@
+# ruff: noqa: FBT003, SLF001
+
+import heapq
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass, field
+from importlib.metadata import version
+from pathlib import Path
+
+import boa
+from boa.contracts.vyper.vyper_contract import VyperDeployer
+from boa.environment import Address, Env
+from eth_abi import encode
+from eth_keys import keys
+from eth_utils import keccak
+
+from .artifacts import load_artifact
+from .events import EventDecoder, load_abi
+from .loans import LOAN_EVENTS, LOAN_FIELDS, OPENING_EVENTS, LoanBook
+
+TX_BASE_GAS = 21000
+MAX_REFUND_QUOTIENT = 5  # EIP-3529
+PRECOMPILES = [Address(f"0x{i:040x}").canonical_address for i in range(1, 10)]
+GENESIS_TIMESTAMP = 1_700_000_000
+DAY = 86400
+MAX_FUNDS = 2**200
+COLLECTION_OFFER = 2  # OfferType.COLLECTION
+
+DOMAIN_TYPE_HASH = keccak(text="EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)")
+OFFER_TYPE_DEF = (
+    "Offer(uint256 principal,uint256 interest,address payment_token,uint256 duration,uint256 origination_fee_amount,"
+    "uint256 broker_upfront_fee_amount,uint256 broker_settlement_fee_bps,address broker_address,uint256 offer_type,"
+    "uint256 token_id,uint256 token_range_min,uint256 token_range_max,bytes32 collection_key_hash,bytes32 trait_hash,"
+    "uint256 expiration,address lender,bool pro_rata,uint256 size,bytes32 tracing_id,uint256 nonce)"
+)
+OFFER_TYPE_HASH = keccak(text=OFFER_TYPE_DEF)
+OFFER_ABI_TYPES = ["bytes32", *(member.split()[0] for member in OFFER_TYPE_DEF[6:-1].split(","))]
+
+# relative weight of each operation, operations not possible in the current state fall back to create_loan
+DEFAULT_MIX = {
+    "create_loan": 30,
+    "settle_loan": 20,
+    "replace_loan": 10,
+    "replace_loan_lender": 10,
+    "claim_defaulted_loan_collateral": 10,
+    "revoke_offer": 20,
+}
+
+
+@dataclass
+class SimulationConfig:
+    borrowers: int = 100
+    lenders: int = 50
+    brokers: int = 10
+    proxies: int = 2
+    collections: int = 4
+    loans: int = 1_000
+    offers: int = 10_000
+    transactions: int = 2_000
+    transactions_per_block: int = 10
+    seconds_per_block: int = 3_600
+    proxy_share: float = 0.25
+    broker_share: float = 0.5
+    mix: dict[str, int] = field(default_factory=lambda: dict(DEFAULT_MIX))
+    sample_every: int = 100
+    seed: int = 0
+
+
+def percentiles(values: list[int]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def _at(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "min": ordered[0],
+        "mean": round(sum(ordered) / len(ordered)),
+        "p50": _at(50),
+        "p90": _at(90),
+        "p99": _at(99),
+        "max": ordered[-1],
+    }
+
+
+def _load_partial(source_path: str) -> VyperDeployer:
+    return VyperDeployer(load_artifact(source_path).compiler_data(), filename=source_path)
+
+
+class Actors:
+    """Deterministic wallets of each population, so runs with the same seed sign the same offers"""
+
+    def __init__(self, config: SimulationConfig):
+        self.borrowers = self._wallets("borrower", config.borrowers, config.seed)
+        self.lenders = self._wallets("lender", config.lenders, config.seed)
+        self.brokers = [address for address, _ in self._wallets("broker", config.brokers, config.seed)]
+        self.owner = self._wallets("owner", 1, config.seed)[0][0]
+        self.keys = dict(self.lenders)
+
+    @staticmethod
+    def _wallets(name: str, count: int, seed: int) -> list[tuple[str, keys.PrivateKey]]:
+        wallets = []
+        for i in range(count):
+            key = keys.PrivateKey(keccak(text=f"{name}{seed}:{i}"))
+            wallets.append((key.public_key.to_checksum_address(), key))
+        return wallets
+
+
+class OfferBook:
+    """
+    The published offers, generated from their index and signed the first time they are used, so that millions of
+    offers cost nothing until borrowers take them. Offer `i` is over collection `i % collections`.
+    """
+
+    def __init__(self, config: SimulationConfig, actors: Actors, collection_key_hashes: list[bytes], p2p_nfts, usdc):
+        self.config = config
+        self.actors = actors
+        self.collection_key_hashes = collection_key_hashes
+        self.payment_token = usdc.address
+        self.domain_separator = keccak(
+            encode(
+                ["bytes32", "bytes32", "bytes32", "uint256", "address"],
+                [DOMAIN_TYPE_HASH, keccak(text="Zharta"), keccak(text="1"), boa.env.evm.patch.chain_id, p2p_nfts.address],
+            )
+        )
+        self.signed: dict[int, tuple] = {}
+        self.tracing_ids: dict[str, int] = {}
+        self.offer_count: Counter = Counter()
+        self.used: set[int] = set()
+        self.revoked: set[int] = set()
+
+    def __len__(self):
+        return self.config.offers
+
+    def offer(self, index: int) -> tuple:
+        rng = random.Random(f"offer{self.config.seed}:{index}")
+        lender, _ = self.actors.lenders[rng.randrange(len(self.actors.lenders))]
+        principal = rng.randint(1, 100) * 10**9
+        broker, broker_upfront_fee, broker_settlement_fee_bps = "0x" + "00" * 20, 0, 0
+        if self.actors.brokers and rng.random() < self.config.broker_share:
+            broker = rng.choice(self.actors.brokers)
+            broker_upfront_fee, broker_settlement_fee_bps = principal // 1000, rng.choice([100, 250, 500])
+        return (
+            principal,
+            principal * rng.randint(1, 10) // 100,  # interest
+            self.payment_token,
+            rng.choice([1, 7, 30]) * DAY,  # duration
+            rng.choice([0, principal // 200]),  # origination fee
+            broker_upfront_fee,
+            broker_settlement_fee_bps,
+            broker,
+            COLLECTION_OFFER,
+            0,  # token_id
+            0,  # token_range_min
+            2**256 - 1,  # token_range_max
+            self.collection_key_hashes[index % len(self.collection_key_hashes)],
+            b"\0" * 32,  # trait_hash
+            GENESIS_TIMESTAMP + 3650 * DAY,  # expiration
+            lender,
+            rng.random() < 0.5,  # pro_rata
+            rng.randint(1, 5),  # size
+            keccak(text=f"tracing{self.config.seed}:{index}"),
+            0,  # nonce
+        )
+
+    def signed_offer(self, index: int) -> tuple:
+        if index not in self.signed:
+            offer = self.offer(index)
+            lender_key = self.actors.keys[offer[15]]
+            struct_hash = keccak(encode(OFFER_ABI_TYPES, [OFFER_TYPE_HASH, *offer]))
+            signature = lender_key.sign_msg_hash(keccak(b"\x19\x01" + self.domain_separator + struct_hash))
+            self.signed[index] = (offer, (signature.v + 27, signature.r, signature.s))
+            self.tracing_ids["0x" + offer[18].hex()] = index
+        return self.signed[index]
+
+    def take(self, index: int):
+        self.offer_count[index] += 1
+        self.used.add(index)
+
+    def release(self, tracing_id: str):
+        # settled and replaced loans free their place in the offer, defaulted ones don't
+        index = self.tracing_ids[tracing_id]
+        self.offer_count[index] -= 1
+        if not self.offer_count[index]:
+            del self.offer_count[index]
+
+    def available(self, index: int) -> bool:
+        return index not in self.revoked and self.offer_count[index] < self.offer(index)[17]
+
+    def pick(self, rng: random.Random, collection: int | None = None, tries: int = 16) -> int | None:
+        collections = len(self.collection_key_hashes)
+        for _ in range(tries):
+            index = rng.randrange(self.config.offers)
+            if collection is not None:
+                index -= index % collections - collection
+                if index >= self.config.offers:
+                    index -= collections
+            if self.available(index):
+                return index
+        return None
+
+
+class Simulation:
+    """
+    Drives a P2PLendingNfts deployment on a boa environment of its own with populations of borrowers, lenders, brokers
+    and proxies (P2PLendingRouter deployments), several transactions per block and the clock moving forward between
+    blocks, so that loans mature and default. The loans are tracked with the same events and LoanBook used by the
+    off-chain tooling, which is also measured.
+    Each call is priced as a transaction of its own, ie with the intrinsic and calldata gas, cold accesses and the
+    storage values of the previous transaction as the original ones.
+    """
+
+    def __init__(self, config: SimulationConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.actors = Actors(config)
+        self.gas: dict[str, list[int]] = defaultdict(list)
+        self.seconds: Counter = Counter()
+        self.reverts: dict[str, Counter] = defaultdict(Counter)
+        self.events: Counter = Counter()
+        self.event_data_bytes = 0
+        self.tooling_seconds = 0.0
+        self.timeline: list[dict] = []
+        self.phases: dict[str, dict] = {}
+        self.live: list[str] = []
+        self.live_index: dict[str, int] = {}
+        self.maturities: list[tuple[int, str]] = []
+        self.loans_opened = 0
+        self.blocks = 0
+        self.transactions = 0
+        self.free_tokens: dict[tuple[str, int], list[int]] = defaultdict(list)
+        self.next_token_id = 0
+        self.book = LoanBook()
+
+    def run(self) -> dict:
+        start = time.perf_counter()
+        with boa.swap_env(Env()):
+            self._deploy()
+            self._run_phase("ramp", lambda: len(self.live) < self.config.loans, {"create_loan": 1})
+            steady_end = self.transactions + self.config.transactions
+            self._run_phase("steady", lambda: self.transactions < steady_end, self.config.mix)
+            self._check_state()
+        return self.report(time.perf_counter() - start)
+
+    def _deploy(self):
+        boa.env.evm.patch.timestamp = GENESIS_TIMESTAMP
+        boa.env.eoa = owner = self.actors.owner
+        self.usdc = _load_partial("contracts/auxiliary/WETH9Mock.vy").deploy("USDC", "USDC", 9, 0)
+        delegation_registry = _load_partial("contracts/auxiliary/DelegationRegistryMock.vy").deploy()
+        cryptopunks = _load_partial("contracts/auxiliary/CryptoPunksMarketMock.vy").deploy()
+        erc721 = _load_partial("contracts/auxiliary/ERC721.vy")
+        self.collections = [erc721.deploy() for _ in range(self.config.collections)]
+        key_hashes = [keccak(text=f"collection{i}") for i in range(self.config.collections)]
+        p2p_control = _load_partial("contracts/P2PLendingControl.vy").deploy()
+        p2p_control.change_collections_contracts([(k, c.address) for k, c in zip(key_hashes, self.collections)])
+        self.p2p_nfts = _load_partial("contracts/P2PLendingNfts.vy").deploy(
+            self.usdc, p2p_control, delegation_registry, cryptopunks, 10, 1000, owner, 10000, 10000, 10000, 10000, True
+        )
+        router = _load_partial("contracts/P2PLendingRouter.vy")
+        self.routers = [router.deploy(self.p2p_nfts) for _ in range(self.config.proxies)]
+        for proxy in self.routers:
+            self.p2p_nfts.set_proxy_authorization(proxy, True)
+
+        for wallet, _ in self.actors.borrowers + self.actors.lenders:
+            self.usdc.mint(wallet, MAX_FUNDS)
+            self.usdc.approve(self.p2p_nfts, MAX_FUNDS, sender=wallet)
+        for wallet, _ in self.actors.borrowers:
+            for collection in self.collections:
+                collection.setApprovalForAll(self.p2p_nfts, True, sender=wallet)
+
+        self.offers = OfferBook(self.config, self.actors, key_hashes, self.p2p_nfts, self.usdc)
+        self.decoder = EventDecoder.for_contract("P2PLendingNfts", LOAN_EVENTS)
+        # event names by emitter and topic, as the payment token and the collections share the Transfer topic
+        emitters = [
+            ("P2PLendingNfts", [self.p2p_nfts]),
+            ("auxiliary/WETH9Mock", [self.usdc]),
+            ("auxiliary/ERC721", self.collections),
+        ]
+        self.event_names = {}
+        for contract_name, contracts in emitters:
+            events = EventDecoder(load_abi(contract_name)).events
+            for contract in contracts:
+                address = Address(contract.address).canonical_address
+                self.event_names[address] = {t: f"{Path(contract_name).name}.{e.name}" for t, e in events.items()}
+
+    def _run_phase(self, name: str, running, mix: dict[str, int]):
+        operations, weights = zip(*mix.items())
+        first_transaction, first_block, start = self.transactions, self.blocks, time.perf_counter()
+        executing = sum(self.seconds.values())
+        while running():
+            for _ in range(self.config.transactions_per_block):
+                if not running():
+                    break
+                operation = self.rng.choices(operations, weights)[0]
+                getattr(self, f"_{operation}")()
+            self._next_block(name)
+        if self.blocks % self.config.sample_every:
+            self.timeline.append(self._sample(name))
+        self.phases[name] = {
+            "transactions": self.transactions - first_transaction,
+            "blocks": self.blocks - first_block,
+            "seconds": time.perf_counter() - start,
+            "execution_seconds": sum(self.seconds.values()) - executing,
+        }
+
+    def _next_block(self, phase: str):
+        self.blocks += 1
+        if self.blocks % self.config.sample_every == 0:
+            self.timeline.append(self._sample(phase))
+        boa.env.time_travel(blocks=1, block_delta=self.config.seconds_per_block)
+
+    def _sample(self, phase: str) -> dict:
+        return {
+            "phase": phase,
+            "block": boa.env.evm.patch.block_number,
+            "timestamp": boa.env.evm.patch.timestamp,
+            "transactions": self.transactions,
+            "loans": len(self.live),
+            "loans_opened": self.loans_opened,
+            "offer_count": len(self.offers.offer_count),
+            "offer_count_keys": len(self.offers.used),
+            "revoked_offers": len(self.offers.revoked),
+            "signed_offers": len(self.offers.signed),
+            "events": sum(self.events.values()),
+            "gas": sum(sum(gas) for gas in self.gas.values()),
+        }
+
+    # operations
+
+    def _borrower_broker_fees(self, principal: int) -> tuple[int, int, str]:
+        if not self.actors.brokers or self.rng.random() >= self.config.broker_share:
+            return 0, 0, "0x" + "00" * 20
+        return principal // 1000, self.rng.choice([100, 250, 500]), self.rng.choice(self.actors.brokers)
+
+    def _create_loan(self):
+        index = self.offers.pick(self.rng)
+        if index is None:
+            return
+        offer = self.offers.signed_offer(index)
+        borrower, _ = self.rng.choice(self.actors.borrowers)
+        collection = index % self.config.collections
+        token_id = self._collateral(borrower, collection)
+        args = (offer, token_id, [], "0x" + "00" * 20, *self._borrower_broker_fees(offer[0][0]))
+        if self._transact("create_loan", args, borrower, proxy_allowed=True):
+            self.offers.take(index)
+        else:
+            self.free_tokens[borrower, collection].append(token_id)
+
+    def _settle_loan(self):
+        loan = self._random_loan()
+        if loan is None:
+            self._create_loan()
+        elif loan["maturity"] < boa.env.evm.patch.timestamp:
+            self._claim(loan)
+        elif self._transact("settle_loan", (self._loan_args(loan),), loan["borrower"], proxy_allowed=True):
+            self.offers.release(loan["offer_tracing_id"])
+            self.free_tokens[loan["borrower"], self._collection(loan)].append(loan["collateral_token_id"])
+
+    def _claim_defaulted_loan_collateral(self):
+        while self.maturities and self.maturities[0][1] not in self.live_index:
+            heapq.heappop(self.maturities)
+        if not self.maturities or self.maturities[0][0] >= boa.env.evm.patch.timestamp:
+            self._settle_loan()
+            return
+        self._claim(self.book.get(self.maturities[0][1]))
+
+    def _claim(self, loan: dict):
+        self._transact("claim_defaulted_loan_collateral", (self._loan_args(loan),), loan["lender"])
+
+    def _replace_loan(self):
+        loan = self._random_loan()
+        if loan is None or loan["maturity"] < boa.env.evm.patch.timestamp:
+            self._create_loan()
+            return
+        index = self.offers.pick(self.rng, self._collection(loan))
+        if index is None:
+            return
+        offer = self.offers.signed_offer(index)
+        args = (self._loan_args(loan), offer, [], *self._borrower_broker_fees(offer[0][0]))
+        if self._transact("replace_loan", args, loan["borrower"], proxy_allowed=True):
+            self.offers.take(index)
+            self.offers.release(loan["offer_tracing_id"])
+
+    def _replace_loan_lender(self):
+        loan = self._random_loan()
+        now = boa.env.evm.patch.timestamp
+        if loan is None or loan["maturity"] < now:
+            self._create_loan()
+            return
+        # lenders only refinance with offers lasting at least until the current maturity
+        for _ in range(8):
+            index = self.offers.pick(self.rng, self._collection(loan))
+            if index is not None and now + self.offers.offer(index)[3] >= loan["maturity"]:
+                break
+        else:
+            return
+        offer = self.offers.signed_offer(index)
+        if self._transact("replace_loan_lender", (self._loan_args(loan), offer, []), loan["lender"]):
+            self.offers.take(index)
+            self.offers.release(loan["offer_tracing_id"])
+
+    def _revoke_offer(self):
+        index = self.offers.pick(self.rng)
+        if index is None:
+            return
+        offer = self.offers.signed_offer(index)
+        if self._transact("revoke_offer", (offer,), offer[0][15]):
+            self.offers.revoked.add(index)
+
+    # helpers
+
+    def _collection(self, loan: dict) -> int:
+        return next(i for i, c in enumerate(self.collections) if c.address == loan["collateral_contract"])
+
+    def _collateral(self, borrower: str, collection: int) -> int:
+        tokens = self.free_tokens[borrower, collection]
+        if tokens:
+            return tokens.pop()
+        self.next_token_id += 1
+        self.collections[collection].mint(borrower, self.next_token_id, sender=self.actors.owner)
+        return self.next_token_id
+
+    def _random_loan(self) -> dict | None:
+        return self.book.get(self.rng.choice(self.live)) if self.live else None
+
+    @staticmethod
+    def _loan_args(loan: dict) -> tuple:
+        values = []
+        for name in LOAN_FIELDS:
+            value = loan[name]
+            if name == "fees":
+                value = [tuple(fee.values()) for fee in value]
+            elif isinstance(value, str) and len(value) == 66:  # bytes32 ids, addresses are kept as is
+                value = bytes.fromhex(value[2:])
+            values.append(value)
+        return tuple(values)
+
+    def _transact(self, function_name: str, args: tuple, sender: str, *, proxy_allowed: bool = False) -> bool:
+        function = getattr(self.p2p_nfts, function_name)
+        if proxy_allowed and self.routers and self.rng.random() < self.config.proxy_share:
+            # calls through a proxy pay for the multicall, so their gas is kept apart
+            target = self.rng.choice(self.routers)
+            call, call_args = target.multicall, ([function.prepare_calldata(*args)],)
+            function_name = f"{function_name}[proxy]"
+        else:
+            target, call, call_args = self.p2p_nfts, function, args
+        calldata = call.prepare_calldata(*call_args)
+
+        # a new transaction: the storage written so far becomes the original one, and every account is cold again
+        state = boa.env.evm.vm.state
+        state.lock_changes()
+        for address in [Address(target.address).canonical_address, Address(sender).canonical_address, *PRECOMPILES]:
+            state._account_db.mark_address_warm(address)
+
+        self.transactions += 1
+        start = time.perf_counter()
+        try:
+            call(*call_args, sender=sender)
+        except boa.BoaError as e:
+            self.reverts[function_name][e.stack_trace.last_frame.pretty_vm_reason or "unknown"] += 1
+            return False
+        finally:
+            self.seconds[function_name] += time.perf_counter() - start
+
+        computation = target._computation
+        gas = TX_BASE_GAS + sum(16 if b else 4 for b in calldata) + computation.get_gas_used()
+        gas -= min(computation.get_gas_refund(), gas // MAX_REFUND_QUOTIENT)
+        self.gas[function_name].append(gas)
+        self._ingest(computation.get_raw_log_entries())
+        return True
+
+    def _ingest(self, log_entries):
+        block_number = boa.env.evm.patch.block_number
+        logs = []
+        for _, address, topics, data in sorted(log_entries):
+            topic = topics[0].to_bytes(32, "big")
+            self.events[self.event_names.get(address, {}).get(topic, "0x" + topic.hex())] += 1
+            self.event_data_bytes += len(data)
+            logs.append(
+                {
+                    "address": "0x" + address.hex(),
+                    "topics": [t.to_bytes(32, "big") for t in topics],
+                    "data": data,
+                    "blockNumber": block_number,
+                    "blockHash": block_number.to_bytes(32, "big"),
+                    "transactionHash": self.transactions.to_bytes(32, "big"),
+                    "logIndex": len(logs),
+                }
+            )
+
+        start = time.perf_counter()
+        events = list(self.decoder.decode_all(logs))
+        closed = self.book.apply_all(events)
+        self.tooling_seconds += time.perf_counter() - start
+
+        for loan_id in closed:
+            position = self.live_index.pop(loan_id)
+            last = self.live.pop()
+            if last != loan_id:
+                self.live[position] = last
+                self.live_index[last] = position
+        for event in events:
+            if event.name in OPENING_EVENTS:
+                self.live_index[event["id"]] = len(self.live)
+                self.live.append(event["id"])
+                heapq.heappush(self.maturities, (event["maturity"], event["id"]))
+                self.loans_opened += 1
+
+    def _check_state(self):
+        # the loans tracked from the events must match the contract state
+        assert len(self.book) == len(self.live), "loan book out of sync with the simulation"
+        for loan_id in self.rng.sample(self.live, min(100, len(self.live))):
+            assert self.p2p_nfts.loans(bytes.fromhex(loan_id[2:])) != b"\0" * 32, f"loan {loan_id} not in the contract"
+
+    def report(self, seconds: float) -> dict:
+        execution_seconds = sum(self.seconds.values())
+        executed = sum(len(gas) for gas in self.gas.values())
+        events = sum(self.events.values())
+        functions = {}
+        for name in sorted(self.gas.keys() | self.reverts.keys()):
+            reverted = sum(self.reverts.get(name, {}).values())
+            count = len(self.gas.get(name, ())) + reverted
+            functions[name] = {
+                "transactions": count,
+                "reverted": reverted,
+                "transactions_per_second": count / self.seconds[name] if self.seconds[name] else None,
+                "gas": percentiles(self.gas.get(name, [])),
+            }
+        return {
+            "config": asdict(self.config),
+            "versions": {"vyper": version("vyper"), "titanoboa": version("titanoboa")},
+            "seconds": seconds,
+            "blocks": self.blocks,
+            "simulated_seconds": self.blocks * self.config.seconds_per_block,
+            "phases": self.phases,
+            "transactions": {
+                "total": self.transactions,
+                "reverted": self.transactions - executed,
+                "transactions_per_second": self.transactions / execution_seconds if execution_seconds else None,
+                "wall_transactions_per_second": self.transactions / seconds if seconds else None,
+            },
+            "functions": functions,
+            "reverts": {name: dict(reasons) for name, reasons in sorted(self.reverts.items())},
+            "gas": percentiles([gas for values in self.gas.values() for gas in values]),
+            "events": {
+                "total": events,
+                "data_bytes": self.event_data_bytes,
+                "per_transaction": events / executed if executed else None,
+                "by_name": dict(self.events.most_common()),
+            },
+            "state": {
+                "loans": len(self.live),
+                "loans_opened": self.loans_opened,
+                "offer_count": len(self.offers.offer_count),
+                "offer_count_keys": len(self.offers.used),
+                "revoked_offers": len(self.offers.revoked),
+                "signed_offers": len(self.offers.signed),
+                "published_offers": len(self.offers),
+            },
+            "tooling": {
+                "loan_book": len(self.book),
+                "seconds": self.tooling_seconds,
+                "events_per_second": events / self.tooling_seconds if self.tooling_seconds else None,
+            },
+            "timeline": self.timeline,
+        }
+
+
+def write_report(path: str | Path, report: dict):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2) + "\n")
@@ -0,0 +1,22 @@
+import click
+from rich import print
+
+from ._helpers.artifacts import ARTIFACTS_DIR, build_artifacts, source_paths
+
+
+@click.command()
+@click.argument("paths", nargs=-1)
+@click.option("--jobs", type=int, default=None, help="Parallel compilations, the number of CPUs by default")
+def cli(paths, jobs):
+    """
+    Compiles the contracts, all of them by default, whose source changed since their last artifact. The boa fixtures and
+    the ape contract containers load the artifacts instead of compiling the contracts.
+    """
+    compiled = build_artifacts(paths or None, jobs)
+    for path in compiled:
+        print(f"compiled [blue]{path}[/]")
+    print(f"{len(paths or source_paths())} artifacts in {ARTIFACTS_DIR}, {len(compiled)} compiled")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,62 @@
+import os
+import time
+from collections.abc import Callable
+
+import click
+from rich import print
+from web3 import Web3
+
+from ._helpers.events import load_abi, load_contract_address
+
+ENV = os.environ.get("ENV", "local")
+
+
+def keys_per_second(read: Callable[[list[bytes]], list], keys: list[bytes]) -> float:
+    start = time.perf_counter()
+    result = read(keys)
+    elapsed = time.perf_counter() - start
+    assert len(result) == len(keys)
+    return len(keys) / elapsed
+
+
+def batched(read: Callable[[list[bytes]], list], batch_size: int) -> Callable[[list[bytes]], list]:
+    return lambda keys: [value for i in range(0, len(keys), batch_size) for value in read(keys[i : i + batch_size])]
+
+
+@click.command()
+@click.option("--rpc-url", envvar="RPC_URL", default="http://127.0.0.1:8545", help="Usually a local node, eg anvil")
+@click.option("--contract-key", default="eth_nfts", help="P2PLendingNfts key in configs/<env>/p2p.json")
+@click.option("--lens-address", required=True, help="P2PLendingLens address")
+@click.option("--keys", "key_count", type=int, default=1024, help="Number of keys read by each method")
+@click.option("--batch-size", type=int, default=1024, help="Keys per lens call, up to 1024 (128 for collections)")
+def cli(rpc_url, contract_key, lens_address, key_count, batch_size):
+    """
+    Compares the keys per second read with the P2PLendingNfts getters, one eth_call per key, and with the
+    P2PLendingLens and P2PLendingControl bulk views. Keys are random, as reading a missing key costs the same.
+    """
+    w3 = Web3(Web3.HTTPProvider(rpc_url))
+    p2p_address = load_contract_address(ENV, contract_key)
+    p2p = w3.eth.contract(address=p2p_address, abi=load_abi("P2PLendingNfts")).functions
+    control_address = p2p.p2p_control().call()
+    control = w3.eth.contract(address=control_address, abi=load_abi("P2PLendingControl")).functions
+    lens = w3.eth.contract(address=Web3.to_checksum_address(lens_address), abi=load_abi("P2PLendingLens")).functions
+    keys = [os.urandom(32) for _ in range(key_count)]
+
+    readers = {
+        "loans": (p2p.loans, lambda ks: lens.get_loans(p2p_address, ks).call(), batch_size),
+        "offer_count": (p2p.offer_count, lambda ks: lens.get_offer_counts(p2p_address, ks).call(), batch_size),
+        "revoked_offers": (p2p.revoked_offers, lambda ks: lens.get_revoked_offers(p2p_address, ks).call(), batch_size),
+        "collection_status": (
+            control.get_collection_status,
+            lambda ks: control.get_collections_status(ks).call(),
+            min(batch_size, 128),
+        ),
+    }
+    for name, (getter, batch_getter, size) in readers.items():
+        single = keys_per_second(lambda ks, getter=getter: [getter(k).call() for k in ks], keys)
+        bulk = keys_per_second(batched(batch_getter, size), keys)
+        print(f"{name}: {single:.0f} keys/s single, {bulk:.0f} keys/s bulk ({bulk / single:.1f}x), batch {size}")
+
+
+if __name__ == "__main__":
+    cli()
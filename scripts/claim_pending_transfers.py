@@ -0,0 +1,69 @@
+import logging
+import os
+import warnings
+
+import click
+from ape import accounts, networks
+from ape.cli import ConnectedProviderCommand
+from rich import print
+
+from ._helpers.contracts import ArtifactContainer
+from ._helpers.events import EventDecoder, iter_logs, load_contract_address
+from ._helpers.pending_transfers import PENDING_TRANSFERS_EVENTS, PendingTransfersTracker, read_pending_transfers
+
+ENV = os.environ.get("ENV", "local")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+warnings.filterwarnings("ignore")
+
+
+@click.command(cls=ConnectedProviderCommand)
+@click.option("--contract-key", default="eth_nfts", help="P2PLendingNfts key in configs/<env>/p2p.json")
+@click.option("--account", "account_aliases", multiple=True, help="ape account alias of an operational wallet to claim for")
+@click.option("--from-block", type=int, default=None, help="Also report the pending transfers of all wallets since this block")
+@click.option("--min-amount", type=int, default=1, help="Only claim pending transfers of at least this amount")
+@click.option("--dryrun", is_flag=True, default=False)
+def cli(network, contract_key, account_aliases, from_block, min_amount, dryrun):  # noqa: PLR0917
+    print(f"Connected to {network}")
+    w3 = networks.provider.web3
+    address = load_contract_address(ENV, contract_key)
+    p2p = ArtifactContainer("contracts/P2PLendingNfts.vy").at(address)
+    operational_accounts = {account.address: account for account in map(accounts.load, account_aliases)}
+
+    # the balances are read at the last block of the history, so that its events aren't counted twice
+    tracker = PendingTransfersTracker()
+    to_block = w3.eth.block_number
+    if from_block is not None:
+        decoder = EventDecoder.for_contract("P2PLendingNfts", PENDING_TRANSFERS_EVENTS)
+        tracker.apply_all(decoder.decode_all(iter_logs(w3, address, from_block, to_block, topics=decoder.topics)))
+
+    wallets = sorted(set(tracker.balances) | set(operational_accounts))
+    onchain = read_pending_transfers(w3, address, wallets, block_identifier=to_block)
+    for mismatch in tracker.verify(onchain) if from_block is not None else []:
+        print(f"[dark_orange bold]WARNING[/] {mismatch.wallet} tracked {mismatch.tracked}, on-chain {mismatch.onchain}")
+    tracker.reconcile(onchain)
+
+    for wallet, amount in sorted(tracker.pending().items()):
+        tag = " [blue](operational)[/]" if wallet in operational_accounts else ""
+        print(f"{wallet}{tag}: {amount} pending")
+
+    to_claim = [wallet for wallet in operational_accounts if tracker.balances.get(wallet, 0) >= min_amount]
+    if not to_claim:
+        print("No pending transfers to claim")
+        return
+    if dryrun:
+        print(f"Dry run, would claim for {', '.join(to_claim)}")
+        return
+
+    # the claims are sent from different accounts, so they are all submitted before waiting for any receipt
+    receipts = [
+        p2p.claim_pending_transfers(sender=operational_accounts[wallet], required_confirmations=0) for wallet in to_claim
+    ]
+    for wallet, receipt in zip(to_claim, receipts):
+        receipt.await_confirmations()
+        print(f"Claimed {tracker.balances[wallet]} for {wallet} in {receipt.txn_hash}")
+
+
+if __name__ == "__main__":
+    cli()
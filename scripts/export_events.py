@@ -0,0 +1,51 @@
+import logging
+import os
+import warnings
+from functools import lru_cache
+from pathlib import Path
+
+import click
+from rich import print
+from web3 import Web3
+
+from ._helpers.events import EventDecoder, iter_logs, load_contract_address
+from ._helpers.export import LIFECYCLE_EVENTS, ParquetExporter
+
+ENV = os.environ.get("ENV", "local")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+warnings.filterwarnings("ignore")
+
+
+@click.command()
+@click.option("--rpc-url", envvar="RPC_URL", required=True)
+@click.option("--contract-key", default="eth_nfts", help="P2PLendingNfts key in configs/<env>/p2p.json")
+@click.option("--output-dir", type=click.Path(path_type=Path), default=Path("exports/p2p_events"))
+@click.option("--from-block", type=int, default=0, help="Only used in the first run, later runs resume from the state file")
+@click.option("--to-block", type=int, default=None)
+@click.option("--row-group-size", type=int, default=50_000)
+def cli(rpc_url, contract_key, output_dir, from_block, to_block, row_group_size):  # noqa: PLR0917
+    w3 = Web3(Web3.HTTPProvider(rpc_url))
+    address = load_contract_address(ENV, contract_key)
+    decoder = EventDecoder.for_contract("P2PLendingNfts", LIFECYCLE_EVENTS)
+    exporter = ParquetExporter(output_dir, row_group_size=row_group_size)
+
+    start = exporter.next_block(from_block)
+    end = to_block if to_block is not None else w3.eth.block_number
+    if start > end:
+        print(f"Nothing to export, {output_dir} is up to date at block {exporter.last_block}")
+        return
+
+    @lru_cache(maxsize=4096)
+    def block_timestamp(block_number: int) -> int:
+        return w3.eth.get_block(block_number)["timestamp"]
+
+    print(f"Exporting {contract_key} ({address}) events from block {start} to {end} into {output_dir}")
+    logs = iter_logs(w3, address, start, end, topics=decoder.topics)
+    exporter.export(decoder.decode_all(logs), block_timestamp, end)
+    print(f"Exported {exporter.rows_written} events, {len(exporter.active_loans)} loans active at block {end}")
+
+
+if __name__ == "__main__":
+    cli()
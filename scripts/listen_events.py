@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import os
+import warnings
+
+import click
+from rich import print
+from web3 import AsyncHTTPProvider, AsyncWeb3, WebsocketProviderV2
+
+from ._helpers.events import EventDecoder, load_contract_address
+from ._helpers.listener import DEFAULT_QUEUE_SIZE, BlockEvents, BlockListener
+
+ENV = os.environ.get("ENV", "local")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+warnings.filterwarnings("ignore")
+
+
+def print_events(item: BlockEvents):
+    for event in item.events:
+        print(f"[{item.block.number}] {event.name} {event.args}")
+
+
+async def report_metrics(listener: BlockListener, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        print(listener.metrics())
+
+
+async def run_listener(w3, address: str, from_block: int | None, poll_interval: float, metrics_interval: float):
+    decoder = EventDecoder.for_contract("P2PLendingNfts")
+    listener = BlockListener(w3, address, decoder, from_block=from_block, poll_interval=poll_interval)
+    listener.register("print", print_events, DEFAULT_QUEUE_SIZE)
+    reporter = asyncio.create_task(report_metrics(listener, metrics_interval))
+    try:
+        await listener.run()
+    finally:
+        reporter.cancel()
+
+
+async def listen(rpc_url: str, *args):
+    if rpc_url.startswith("ws"):
+        async with AsyncWeb3.persistent_websocket(WebsocketProviderV2(rpc_url)) as w3:
+            await run_listener(w3, *args)
+    else:
+        await run_listener(AsyncWeb3(AsyncHTTPProvider(rpc_url)), *args)
+
+
+@click.command()
+@click.option("--rpc-url", envvar="RPC_URL", required=True, help="ws(s):// urls use a newHeads subscription, http(s):// poll")
+@click.option("--contract-key", default="eth_nfts", help="P2PLendingNfts key in configs/<env>/p2p.json")
+@click.option("--address", default=None, help="P2PLendingNfts address, overrides --contract-key")
+@click.option("--from-block", type=int, default=None, help="Defaults to the current head")
+@click.option("--poll-interval", type=float, default=1.0)
+@click.option("--metrics-interval", type=float, default=60.0)
+def cli(rpc_url, contract_key, address, from_block, poll_interval, metrics_interval):  # noqa: PLR0917
+    address = address or load_contract_address(ENV, contract_key)
+    asyncio.run(listen(rpc_url, address, from_block, poll_interval, metrics_interval))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import os
+import warnings
+
+import click
+from aiohttp import web
+from rich import print
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3, WebsocketProviderV2
+
+from ._helpers.events import EventDecoder, iter_logs, load_contract_address
+from ._helpers.listener import BlockListener
+from ._helpers.loan_api import DEFAULT_CACHE_SIZE, apply_events, block_consumer, create_app
+from ._helpers.loans import LOAN_EVENTS, LoanBook
+
+ENV = os.environ.get("ENV", "local")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+warnings.filterwarnings("ignore")
+
+
+async def serve(w3, app: web.Application, address: str, from_block: int, host: str, port: int):  # noqa: PLR0917
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Serving loans on http://{host}:{port}, following blocks from {from_block}")
+    listener = BlockListener(w3, address, EventDecoder.for_contract("P2PLendingNfts", LOAN_EVENTS), from_block=from_block)
+    listener.register("loans", block_consumer(app))
+    try:
+        await listener.run()
+    finally:
+        await runner.cleanup()
+
+
+async def run(rpc_url: str, *args):
+    if rpc_url.startswith("ws"):
+        async with AsyncWeb3.persistent_websocket(WebsocketProviderV2(rpc_url)) as w3:
+            await serve(w3, *args)
+    else:
+        await serve(AsyncWeb3(AsyncHTTPProvider(rpc_url)), *args)
+
+
+@click.command()
+@click.option("--rpc-url", envvar="RPC_URL", required=True, help="ws(s):// urls use a newHeads subscription, http(s):// poll")
+@click.option(
+    "--backfill-rpc-url", envvar="BACKFILL_RPC_URL", default=None, help="http(s) url for the history, defaults to --rpc-url"
+)
+@click.option("--contract-key", default="eth_nfts", help="P2PLendingNfts key in configs/<env>/p2p.json")
+@click.option("--from-block", type=int, default=0, help="Block where the history starts, eg the contract deployment block")
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", type=int, default=8080)
+@click.option("--cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+def cli(rpc_url, backfill_rpc_url, contract_key, from_block, host, port, cache_size):  # noqa: PLR0917
+    address = load_contract_address(ENV, contract_key)
+    decoder = EventDecoder.for_contract("P2PLendingNfts", LOAN_EVENTS)
+    book = LoanBook()
+    app = create_app(book, cache_size)
+
+    w3 = Web3(Web3.HTTPProvider(backfill_rpc_url or rpc_url))
+    head = w3.eth.block_number
+    print(f"Loading {contract_key} ({address}) loans from block {from_block} to {head}")
+    apply_events(app, decoder.decode_all(iter_logs(w3, address, from_block, head, topics=decoder.topics)))
+    book.last_block = head
+    print(f"Loaded {len(book)} active loans")
+
+    asyncio.run(run(rpc_url, app, address, head + 1, host, port))
+
+
+if __name__ == "__main__":
+    cli()
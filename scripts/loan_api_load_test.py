@@ -0,0 +1,83 @@
+import asyncio
+import random
+import sys
+import time
+
+import aiohttp
+import click
+from rich import print
+
+from ._helpers.listener import LatencyStats
+
+
+async def load_targets(session: aiohttp.ClientSession, url: str, sample_size: int) -> list[str]:
+    async with session.get(f"{url}/loans", params={"limit": sample_size}) as response:
+        loan_ids = await response.json()
+    if not loan_ids:
+        raise click.ClickException(f"no active loans in {url}")
+
+    targets = []
+    for loan_id in loan_ids:
+        async with session.get(f"{url}/loans/{loan_id}") as response:
+            loan = await response.json()
+        targets += [
+            f"/loans/{loan_id}",
+            f"/borrowers/{loan['borrower']}/loans",
+            f"/lenders/{loan['lender']}/loans",
+            f"/collateral/{loan['collateral_contract']}/{loan['collateral_token_id']}",
+        ]
+    return targets
+
+
+async def worker(session: aiohttp.ClientSession, url: str, targets: list[str], deadline: float, stats: LatencyStats):
+    while time.perf_counter() < deadline:
+        path = random.choice(targets)
+        start = time.perf_counter()
+        async with session.get(url + path) as response:
+            await response.read()
+            if response.status != 200:
+                raise click.ClickException(f"{path} returned {response.status}")
+        stats.add(time.perf_counter() - start)
+
+
+async def load_test(url: str, concurrency: int, duration: float, sample_size: int) -> tuple[LatencyStats, dict]:
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        targets = await load_targets(session, url, sample_size)
+        stats = LatencyStats(window=10_000_000)
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(worker(session, url, targets, deadline, stats) for _ in range(concurrency)))
+        async with session.get(f"{url}/status") as response:
+            status = await response.json()
+    return stats, status
+
+
+def _ms(seconds: float | None) -> str:
+    return f"{seconds * 1000:.2f}ms" if seconds is not None else "-"
+
+
+def _latency(summary: dict) -> str:
+    return " ".join(f"{key} {_ms(summary[key])}" for key in ("p50", "p95", "p99", "max"))
+
+
+@click.command()
+@click.option("--url", default="http://127.0.0.1:8080")
+@click.option("--concurrency", type=int, default=32)
+@click.option("--duration", type=float, default=30.0, help="Seconds")
+@click.option("--sample-size", type=int, default=1000, help="Number of active loans used to build the requests")
+@click.option("--max-p99-ms", type=float, default=5.0, help="Fails if the server side p99 latency is above this value")
+def cli(url, concurrency, duration, sample_size, max_p99_ms):
+    stats, status = asyncio.run(load_test(url.rstrip("/"), concurrency, duration, sample_size))
+    client = stats.summary()
+    server = status["latency"]
+    print(f"{client['count']} requests in {duration}s ({client['count'] / duration:.0f} req/s), {concurrency} clients")
+    print(f"client latency {_latency(client)}")
+    print(f"server latency {_latency(server)}")
+    print(f"cache {status['cache']}")
+    if server["p99"] > max_p99_ms / 1000:
+        print(f"[red]server p99 latency above {max_p99_ms}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,66 @@
+import click
+from rich import print
+
+from ._helpers.simulation import DEFAULT_MIX, Simulation, SimulationConfig, write_report
+
+
+def _mix(_ctx, _param, value) -> dict[str, int]:
+    mix = dict(DEFAULT_MIX)
+    for item in value:
+        name, _, weight = item.partition("=")
+        if name not in mix or not weight.isdigit():
+            raise click.BadParameter(f"expected <operation>=<weight>, operations are {', '.join(DEFAULT_MIX)}")
+        mix[name] = int(weight)
+    return mix
+
+
+def _gas(summary: dict) -> str:
+    return " ".join(f"{key} {summary[key]}" for key in ("p50", "p90", "p99", "max")) if summary["count"] else "-"
+
+
+@click.command()
+@click.option("--borrowers", type=int, default=100)
+@click.option("--lenders", type=int, default=50)
+@click.option("--brokers", type=int, default=10, help="Lender and borrower brokers")
+@click.option("--proxies", type=int, default=2, help="P2PLendingRouter deployments used by the borrowers")
+@click.option("--collections", type=int, default=4)
+@click.option("--loans", type=int, default=1_000, help="Live loans to reach before the steady state")
+@click.option("--offers", type=int, default=10_000, help="Published offers, signed when first taken")
+@click.option("--transactions", type=int, default=2_000, help="Transactions in the steady state")
+@click.option("--transactions-per-block", type=int, default=10)
+@click.option("--seconds-per-block", type=int, default=3_600, help="Simulated time between blocks")
+@click.option("--proxy-share", type=float, default=0.25, help="Share of borrower transactions sent through a proxy")
+@click.option("--broker-share", type=float, default=0.5, help="Share of offers and loans with broker fees")
+@click.option("--mix", multiple=True, callback=_mix, help="Weight of a steady state operation, eg settle_loan=20")
+@click.option("--sample-every", type=int, default=100, help="Blocks between state growth samples")
+@click.option("--seed", type=int, default=0)
+@click.option("--output", default=".cache/simulation/report.json", help="JSON report, for trend tracking")
+def cli(output, **kwargs):
+    """
+    Simulates actor populations using P2PLendingNfts on boa: ramps up to the given live loans, then runs a mix of
+    creations, settlements, replacements, claims and revocations while time moves forward, and reports throughput,
+    gas, events and state growth.
+    """
+    config = SimulationConfig(**kwargs)
+    report = Simulation(config).run()
+    write_report(output, report)
+
+    transactions, events, state, tooling = report["transactions"], report["events"], report["state"], report["tooling"]
+    print(
+        f"{transactions['total']} transactions in {report['blocks']} blocks, {transactions['reverted']} reverted, "
+        f"{transactions['transactions_per_second']:.0f} tx/s executing, "
+        f"{transactions['wall_transactions_per_second']:.0f} tx/s overall"
+    )
+    for name, function in report["functions"].items():
+        print(f"{name}: {function['transactions']} tx, {function['reverted']} reverted, gas {_gas(function['gas'])}")
+    print(f"{events['total']} events, {events['data_bytes']} bytes of data, {events['per_transaction']:.1f} per transaction")
+    print(
+        f"state: {state['loans']} loans, {state['offer_count']} offer counts ({state['offer_count_keys']} written), "
+        f"{state['revoked_offers']} revoked offers, {state['signed_offers']} of {state['published_offers']} offers taken"
+    )
+    print(f"loan book: {tooling['loan_book']} loans, {tooling['events_per_second']:.0f} events/s ingested")
+    print(f"report written to {output}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import os
+import warnings
+
+import click
+from rich import print
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3, WebsocketProviderV2
+
+from ._helpers.events import EventDecoder, iter_logs, load_abi, load_contract_address
+from ._helpers.listener import BlockEvents, BlockListener
+from ._helpers.pending_transfers import PENDING_TRANSFERS_EVENTS, PendingTransfersTracker, read_pending_transfers
+
+ENV = os.environ.get("ENV", "local")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+warnings.filterwarnings("ignore")
+
+
+def verify(tracker: PendingTransfersTracker, w3: Web3, address: str, wallets):
+    onchain = read_pending_transfers(w3, address, sorted(wallets), block_identifier=tracker.last_block)
+    for mismatch in tracker.verify(onchain):
+        print(f"[dark_orange bold]WARNING[/] {mismatch.wallet} tracked {mismatch.tracked}, on-chain {mismatch.onchain}")
+    tracker.reconcile(onchain)
+
+
+def tracker_consumer(tracker: PendingTransfersTracker, w3: Web3, address: str, operational_wallets: set[str]):
+    async def _consume(item: BlockEvents):
+        changed = tracker.apply_all(item.events, to_block=item.block.number)
+        for event in item.events:
+            if event.name == "TransferFailed":
+                tag = "[red bold]OPERATIONAL WALLET[/] " if event["_to"] in operational_wallets else ""
+                print(f"[{item.block.number}] {tag}transfer of {event['amount']} to {event['_to']} failed")
+        if changed:
+            await asyncio.to_thread(verify, tracker, w3, address, changed)
+            print(f"Pending transfers: {tracker.pending()}")
+
+    return _consume
+
+
+async def follow(w3, consumer, address: str, from_block: int):
+    decoder = EventDecoder.for_contract("P2PLendingNfts", PENDING_TRANSFERS_EVENTS)
+    listener = BlockListener(w3, address, decoder, from_block=from_block)
+    listener.register("pending_transfers", consumer)
+    await listener.run()
+
+
+async def watch(ws_url: str | None, rpc_url: str, *args):
+    if ws_url:
+        async with AsyncWeb3.persistent_websocket(WebsocketProviderV2(ws_url)) as w3:
+            await follow(w3, *args)
+    else:
+        await follow(AsyncWeb3(AsyncHTTPProvider(rpc_url)), *args)
+
+
+@click.command()
+@click.option("--rpc-url", envvar="RPC_URL", required=True, help="http(s) url used for the history and on-chain reads")
+@click.option("--ws-url", envvar="WS_URL", default=None, help="Follows new blocks with a newHeads subscription if set")
+@click.option("--contract-key", default="eth_nfts", help="P2PLendingNfts key in configs/<env>/p2p.json")
+@click.option("--from-block", type=int, default=0, help="Block where the history starts, eg the contract deployment block")
+@click.option("--wallet", "wallets", multiple=True, help="Operational wallets to highlight, besides the protocol wallet")
+def cli(rpc_url, ws_url, contract_key, from_block, wallets):
+    w3 = Web3(Web3.HTTPProvider(rpc_url))
+    address = load_contract_address(ENV, contract_key)
+    p2p = w3.eth.contract(address=address, abi=load_abi("P2PLendingNfts"))
+    operational_wallets = {Web3.to_checksum_address(w) for w in wallets} | {p2p.functions.protocol_wallet().call()}
+
+    tracker = PendingTransfersTracker()
+    decoder = EventDecoder.for_contract("P2PLendingNfts", PENDING_TRANSFERS_EVENTS)
+    head = w3.eth.block_number
+    tracker.apply_all(decoder.decode_all(iter_logs(w3, address, from_block, head, topics=decoder.topics)), to_block=head)
+    verify(tracker, w3, address, set(tracker.balances) | operational_wallets)
+    print(f"Pending transfers at block {head}: {tracker.pending()}")
+
+    consumer = tracker_consumer(tracker, w3, address, operational_wallets)
+    asyncio.run(watch(ws_url, rpc_url, consumer, address, head + 1))
+
+
+if __name__ == "__main__":
+    cli()
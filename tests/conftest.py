@@ -0,0 +1,72 @@
+from pathlib import Path
+
+import pytest
+
+from scripts._helpers.artifacts import build_artifacts
+
+from .gas_attribution import GasAttribution
+
+GAS_ATTRIBUTION_PROPERTY = "gas_attribution"
+
+_attribution = GasAttribution()
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--gas-attribution",
+        metavar="DIR",
+        default=None,
+        help="attribute the gas of each test, or of each measured gas scenario, to the internal functions and external "
+        "calls, writing collapsed stacks and a per-function table to DIR",
+    )
+
+
+def pytest_configure(config):
+    config.gas_attribution = _attribution
+    # the contracts are compiled once, before the xdist workers start and load their artifacts
+    if not hasattr(config, "workerinput"):
+        build_artifacts()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    if not item.config.getoption("gas_attribution"):
+        yield
+        return
+
+    # the gas benchmarks profile only their measured calls, under the scenario name
+    item.gas_attribution = GasAttribution()
+    if "gas" in item.fixturenames:
+        yield
+    else:
+        with item.gas_attribution.profile(item.nodeid):
+            yield
+    # sent as a user property, so that xdist workers report it to the controller
+    item.user_properties.append((GAS_ATTRIBUTION_PROPERTY, item.gas_attribution.to_dict()))
+
+
+def pytest_runtest_logreport(report):
+    # the user properties are also in the teardown report
+    for name, value in report.user_properties if report.when == "call" else []:
+        if name == GAS_ATTRIBUTION_PROPERTY:
+            _attribution.merge(value)
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    path = config.getoption("gas_attribution")
+    if not path or hasattr(config, "workerinput") or not config.gas_attribution.stacks:
+        return
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "gas.folded").write_text(config.gas_attribution.collapsed_stacks())
+    (path / "gas_functions.txt").write_text(config.gas_attribution.table())
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    path = config.getoption("gas_attribution")
+    if not path or not config.gas_attribution.stacks:
+        return
+    terminalreporter.section("gas attribution")
+    terminalreporter.write(config.gas_attribution.table(limit=25))
+    terminalreporter.write_line(f"collapsed stacks and the full table written to {path}")
@@ -5,14 +5,13 @@ from enum import IntEnum
 from functools import cached_property
 from hashlib import sha3_256
 from itertools import starmap
-from textwrap import dedent
 from typing import NamedTuple
 
 import boa
 import eth_abi
 import vyper
 from boa.contracts.vyper.event import Event
-from boa.contracts.vyper.vyper_contract import VyperContract
+from boa.contracts.vyper.vyper_contract import VyperContract, VyperDeployer
 from eth.exceptions import Revert
 from eth_abi import encode
 from eth_account import Account
@@ -20,8 +19,11 @@ from eth_account.messages import encode_structured_data
 from eth_utils import keccak
 from web3 import Web3
 
+from scripts._helpers.artifacts import load_artifact
+
 ZERO_ADDRESS = boa.eval("empty(address)")
 ZERO_BYTES32 = boa.eval("empty(bytes32)")
+MAX_FEES = 4
 
 
 def get_last_event(contract: VyperContract, name: str | None = None):
@@ -67,6 +69,24 @@ class EventWrapper:
         return f"<EventWrapper {self.event_name} {self.args_dict}>"
 
 
+def load_partial(source_path: str) -> VyperDeployer:
+    # same as boa.load_partial, from the precompiled artifact of the contract
+    return VyperDeployer(load_artifact(source_path).compiler_data(), filename=source_path)
+
+
+def read_storage(contract: VyperContract, name: str, *keys) -> int:
+    # reads the raw storage word instead of calling the getter, which is much faster when reading many keys
+    slot = contract.compiler_data.storage_layout["storage_layout"][name]["slot"]
+    for key in keys:
+        word = int(key, 16) if isinstance(key, str) else int.from_bytes(key) if isinstance(key, bytes) else key
+        slot = int.from_bytes(keccak(encode(["uint256", "uint256"], [slot, word])))
+    return boa.env.evm.vm.state.get_storage(bytes.fromhex(contract.address[2:]), slot)
+
+
+def revert_reason(error: boa.BoaError) -> str | None:
+    return error.stack_trace.last_frame.pretty_vm_reason
+
+
 @contextlib.contextmanager
 def deploy_reverts():
     try:
@@ -109,6 +129,7 @@ class Offer(NamedTuple):
     pro_rata: bool = False
     size: int = 1
     tracing_id: bytes = ZERO_BYTES32
+    nonce: int = 0
 
 
 Signature = namedtuple("Signature", ["v", "r", "s"], defaults=[0, ZERO_BYTES32, ZERO_BYTES32])
@@ -191,7 +212,7 @@ class Loan(NamedTuple):
     def calc_borrower_broker_settlement_fee(self, timestamp):
         interest = self.get_interest(timestamp)
         fee = self.get_borrower_broker_fee()
-        return interest * fee.settlement_bps // 10000
+        return interest * fee.settlement_bps // 10000 if fee else 0
 
 
 BrokerLock = namedtuple("BrokerLock", ["broker", "expiration"], defaults=[ZERO_ADDRESS, 0])
@@ -225,20 +246,11 @@ def compute_loan_hash(loan: Loan):
         ],
         [loan],
     )
-    return boa.eval(f"""keccak256({encoded})""")
+    return keccak(encoded)
 
 
 def compute_signed_offer_id(offer: SignedOffer):
-    return boa.eval(
-        dedent(
-            f"""keccak256(
-            concat(
-                convert({offer.signature.v}, bytes32),
-                convert({offer.signature.r}, bytes32),
-                convert({offer.signature.s}, bytes32),
-            ))"""
-        )
-    )
+    return keccak(encode(["uint256", "uint256", "uint256"], offer.signature))
 
 
 def sign_offer(offer: Offer, lender_key: str, verifying_contract: str) -> SignedOffer:
@@ -270,13 +282,14 @@ def sign_offer(offer: Offer, lender_key: str, verifying_contract: str) -> Signed
                 {"name": "pro_rata", "type": "bool"},
                 {"name": "size", "type": "uint256"},
                 {"name": "tracing_id", "type": "bytes32"},
+                {"name": "nonce", "type": "uint256"},
             ],
         },
         "primaryType": "Offer",
         "domain": {
             "name": "Zharta",
             "version": "1",
-            "chainId": boa.eval("chain.id"),
+            "chainId": boa.env.evm.patch.chain_id,
             "verifyingContract": verifying_contract,
         },
         "message": offer._asdict(),
@@ -296,43 +309,71 @@ def replace_list_element(lst, index, value):
     return lst[:index] + [value] + lst[index + 1 :]
 
 
-def get_loan_mutations(loan):
-    random_address = boa.env.generate_address("random")
-
-    yield replace_namedtuple_field(loan, id=ZERO_BYTES32)
-    yield replace_namedtuple_field(loan, amount=loan.amount + 1)
-    yield replace_namedtuple_field(loan, interest=loan.interest + 1)
-    yield replace_namedtuple_field(loan, payment_token=random_address)
-    yield replace_namedtuple_field(loan, maturity=loan.maturity - 1)
-    yield replace_namedtuple_field(loan, start_time=loan.start_time - 1)
-    yield replace_namedtuple_field(loan, borrower=random_address)
-    yield replace_namedtuple_field(loan, lender=random_address)
-    yield replace_namedtuple_field(loan, collateral_contract=random_address)
-    yield replace_namedtuple_field(loan, collateral_token_id=loan.collateral_token_id + 1)
-    yield replace_namedtuple_field(loan, pro_rata=not loan.pro_rata)
-
-    fees = loan.fees
-    if len(fees) < 4:
-        yield replace_namedtuple_field(loan, fees=[*fees, Fee(FeeType.PROTOCOL, 0, 0, random_address)])
-
-    for i, fee in enumerate(fees):
-        yield replace_namedtuple_field(loan, fees=fees[:i] + fees[i + 1 :])
-        yield replace_namedtuple_field(
-            loan,
-            fees=replace_list_element(fees, i, replace_namedtuple_field(fee, type=next(t for t in FeeType if t != fee.type))),
-        )
-        yield replace_namedtuple_field(
-            loan, fees=replace_list_element(fees, i, replace_namedtuple_field(fee, upfront_amount=fee.upfront_amount + 1))
-        )
-        yield replace_namedtuple_field(
-            loan, fees=replace_list_element(fees, i, replace_namedtuple_field(fee, settlement_bps=fee.settlement_bps + 1))
-        )
-        yield replace_namedtuple_field(
-            loan, fees=replace_list_element(fees, i, replace_namedtuple_field(fee, wallet=random_address))
-        )
+class Mutation(NamedTuple):
+    path: str
+    value: object
+
+
+def _mutate_scalar(value):
+    if isinstance(value, bool):
+        return not value
+    if isinstance(value, IntEnum):
+        return next(v for v in type(value) if v != value)
+    if isinstance(value, int):
+        return value ^ 1
+    if isinstance(value, str) and value.startswith("0x"):
+        return Web3.to_checksum_address(f"{value[:-1]}{int(value[-1], 16) ^ 1:x}")
+    if isinstance(value, bytes):
+        return value[:-1] + bytes([value[-1] ^ 1])
+    raise TypeError(f"can't mutate {value!r}")
+
+
+def get_mutations(value, path="", max_list_length=MAX_FEES):
+    """
+    Yields a Mutation for every field of a struct (a NamedTuple, possibly holding other structs and lists of structs),
+    changed in turn while the others are kept. Lists also lose each of their elements and, up to `max_list_length`,
+    gain a copy of the last one. Fees are the only lists in the contract structs, hence the default.
+    """
+
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        for name in value._fields:
+            field_path = f"{path}.{name}" if path else name
+            for mutation in get_mutations(getattr(value, name), field_path, max_list_length):
+                yield Mutation(mutation.path, replace_namedtuple_field(value, **{name: mutation.value}))
+    elif isinstance(value, list):
+        for i, element in enumerate(value):
+            yield Mutation(f"{path}[{i}] removed", value[:i] + value[i + 1 :])
+            for mutation in get_mutations(element, f"{path}[{i}]", max_list_length):
+                yield Mutation(mutation.path, replace_list_element(value, i, mutation.value))
+        if value and len(value) < max_list_length:
+            yield Mutation(f"{path}[{len(value)}] added", [*value, value[-1]])
+    else:
+        yield Mutation(path, _mutate_scalar(value))
+
+
+def get_surviving_mutations(call, value, reason, **kwargs) -> list[str]:
+    """
+    Calls `call` with every mutation of `value`, each from the same state, and returns the paths of those that didn't
+    revert with `reason`, along with how they ended. The state is rolled back to an anchor instead of being set up
+    again, so that all the mutations of a struct run in one test.
+    """
+
+    survivors = []
+    for path, mutation in get_mutations(value, **kwargs):
+        with boa.env.anchor():
+            try:
+                call(mutation)
+            except boa.BoaError as e:
+                if revert_reason(e) != reason:
+                    survivors.append(f"{path}: reverted with {revert_reason(e)!r}")
+            else:
+                survivors.append(f"{path}: succeeded")
+    return survivors
 
 
 class TokenTraitTree:
+    version = 1
+
     def __init__(self, token_with_traits: list[tuple[str, str, str, int]]):
         self.token_nodes = sorted(set(starmap(self.token_node, token_with_traits)))
         size = len(self.token_nodes)
@@ -354,6 +395,13 @@ class TokenTraitTree:
             index //= 2
         return proof_list
 
+    @classmethod
+    def root_from_proof(cls, token_node, proof):
+        node = token_node
+        for p in proof:
+            node = cls._merge(node, p)
+        return node
+
     @staticmethod
     def _merge(b1, b2):
         h1 = keccak(b1)
@@ -369,3 +417,11 @@ class TokenTraitTree:
         return keccak(
             encode(["address", "bytes32", "uint256"], [contract, TokenTraitTree.trait_hash(trait_name, trait_value), token_id])
         )
+
+
+class TokenTraitTreeV2(TokenTraitTree):
+    version = 2
+
+    @staticmethod
+    def _merge(b1, b2):
+        return keccak(min(b1, b2) + max(b1, b2))
@@ -0,0 +1,256 @@
+import json
+from contextlib import contextmanager, nullcontext, suppress
+from importlib.metadata import version
+from pathlib import Path
+
+import boa
+import pytest
+from boa.environment import Address
+from eth_account import Account
+from eth_utils import keccak
+
+from ..conftest_base import CollectionContract, load_partial
+
+GAS_PROPERTY_PREFIX = "gas:"
+TX_BASE_GAS = 21000
+MAX_REFUND_QUOTIENT = 5  # EIP-3529
+GENESIS_TIMESTAMP = 1_700_000_000
+PRECOMPILES = [f"0x{i:040x}" for i in range(1, 10)]
+
+_scenarios = {}
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--gas-baseline", default="tests/gas/baseline.json", help="committed gas baseline the scenarios are compared with"
+    )
+    parser.addoption(
+        "--gas-snapshot", default=".cache/gas/snapshot.json", help="where to write the gas snapshot of the current run"
+    )
+    parser.addoption(
+        "--gas-threshold", type=float, default=1.0, help="max allowed increase, in percent, of any scenario over the baseline"
+    )
+    parser.addoption(
+        "--update-gas-baseline",
+        action="store_true",
+        default=False,
+        help="update the baseline with the scenarios of the current run",
+    )
+
+
+def _load_snapshot(path):
+    path = Path(path)
+    return json.loads(path.read_text())["scenarios"] if path.exists() else {}
+
+
+def _write_snapshot(path, scenarios):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    snapshot = {
+        "vyper": version("vyper"),
+        "titanoboa": version("titanoboa"),
+        "py-evm": version("py-evm"),
+        "scenarios": dict(sorted(scenarios.items())),
+    }
+    path.write_text(json.dumps(snapshot, indent=2) + "\n")
+
+
+def pytest_configure(config):
+    config.gas_scenarios = _scenarios
+    config.gas_baseline = _load_snapshot(config.getoption("gas_baseline"))
+
+
+def pytest_runtest_logreport(report):
+    # gas values are reported as user properties, which xdist sends back from the workers to the controller. Scenarios
+    # failing the threshold are kept, so the snapshot also shows the regressions
+    if report.when == "call":
+        for name, value in report.user_properties:
+            if name.startswith(GAS_PROPERTY_PREFIX):
+                _scenarios[name.removeprefix(GAS_PROPERTY_PREFIX)] = value
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    if hasattr(config, "workerinput") or not config.gas_scenarios:
+        return
+    _write_snapshot(config.getoption("gas_snapshot"), config.gas_scenarios)
+    if config.getoption("update_gas_baseline"):
+        _write_snapshot(config.getoption("gas_baseline"), config.gas_baseline | config.gas_scenarios)
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    scenarios, baseline = config.gas_scenarios, config.gas_baseline
+    if not scenarios:
+        return
+    changed = {name: gas for name, gas in scenarios.items() if name in baseline and gas != baseline[name]}
+    added = sorted(scenarios.keys() - baseline.keys())
+    terminalreporter.section("gas")
+    terminalreporter.write_line(f"{len(scenarios)} scenarios, snapshot written to {config.getoption('gas_snapshot')}")
+    for name, gas in sorted(changed.items()):
+        delta = gas - baseline[name]
+        terminalreporter.write_line(f"{name}: {baseline[name]} -> {gas} ({delta:+d}, {delta / baseline[name]:+.2%})")
+    for name in added:
+        terminalreporter.write_line(f"{name}: {scenarios[name]} (not in baseline)")
+
+
+@contextmanager
+def _new_transaction(to, sender):
+    """
+    Prices the next call as a transaction of its own. boa never ends a transaction, so every account and slot touched
+    in the session would stay warm (EIP-2929) and slot writes would be priced against their values before the session
+    (EIP-2200). boa.env.reset_gas_used() replaces the access journal, which breaks the anchors that are open at this
+    point, so the journal is cleared instead, and the current storage is made the original one until the call returns.
+    """
+
+    account_db = boa.env.evm.vm.state._account_db
+    account_db._journal_accessed_state.clear()
+    for address in [to, sender, *PRECOMPILES]:
+        account_db.mark_address_warm(Address(address).canonical_address)
+
+    checkpoints = []
+    for store in account_db._account_stores.values():
+        checkpoints.append((store, store._locked_changes.record()))
+        changes = store._journal_storage.diff()
+        for key, value in changes.pending_items():
+            store._locked_changes[key] = value
+        for key in changes.deleted_keys():
+            with suppress(KeyError):
+                del store._locked_changes[key]
+    try:
+        yield
+    finally:
+        for store, checkpoint in checkpoints:
+            store._locked_changes.discard(checkpoint)
+
+
+class GasRecorder:
+    def __init__(self, request):
+        self.node = request.node
+        self.baseline = request.config.gas_baseline
+        self.threshold = request.config.getoption("gas_threshold")
+        self.update = request.config.getoption("update_gas_baseline")
+
+    def measure(self, scenario, function, *args, **kwargs):
+        """Calls a contract function as a transaction and records the gas paid for it under the scenario name"""
+
+        attribution = getattr(self.node, "gas_attribution", None)
+        with (
+            attribution.profile(scenario) if attribution else nullcontext(),
+            _new_transaction(function.contract.address, kwargs.get("sender", boa.env.eoa)),
+        ):
+            result = function(*args, **kwargs)
+        computation = function.contract._computation
+        calldata = function.prepare_calldata(*args)
+        gas = TX_BASE_GAS + sum(16 if b else 4 for b in calldata) + computation.get_gas_used()
+        gas -= min(computation.get_gas_refund(), gas // MAX_REFUND_QUOTIENT)
+
+        self.node.user_properties.append((GAS_PROPERTY_PREFIX + scenario, gas))
+        if not self.update and scenario in self.baseline:
+            limit = self.baseline[scenario] * (1 + self.threshold / 100)
+            assert gas <= limit, f"{scenario} used {gas} gas, baseline is {self.baseline[scenario]} (+{self.threshold}%)"
+        return result
+
+
+@pytest.fixture
+def gas(request):
+    return GasRecorder(request)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def boa_env():
+    boa.interpret.set_cache_dir(cache_dir=".cache/titanoboa")
+    # timestamps end up in calldata and loan ids, so a fixed start keeps the zero byte count, and the gas, stable
+    boa.env.evm.patch.timestamp = GENESIS_TIMESTAMP
+    return boa
+
+
+def _deploy(source_path, *args):
+    # contracts are deployed at addresses derived from their name, as the owner nonce depends on which tests, and
+    # therefore which fixtures, ran before in the xdist worker, and addresses end up in calldata and storage
+    address = Address(keccak(text=source_path)[-20:])
+    return load_partial(source_path).deploy(*args, override_address=address)
+
+
+def _wallets(name, count):
+    # deterministic keys keep signatures, and therefore calldata costs, stable across runs
+    return [Account.from_key(keccak(text=f"{name}{i}")) for i in range(count)]
+
+
+@pytest.fixture(scope="session")
+def owner():
+    owner = _wallets("owner", 1)[0].address
+    boa.env.eoa = owner
+    return owner
+
+
+@pytest.fixture(scope="session")
+def borrower():
+    return _wallets("borrower", 1)[0].address
+
+
+@pytest.fixture(scope="session")
+def lenders():
+    return _wallets("lender", 2)
+
+
+@pytest.fixture(scope="session")
+def fee_wallets():
+    return [wallet.address for wallet in _wallets("fee_wallet", 3)]
+
+
+@pytest.fixture(scope="session")
+def usdc(owner):
+    return _deploy("contracts/auxiliary/WETH9Mock.vy", "USDC", "USDC", 9, 0)
+
+
+@pytest.fixture(scope="session")
+def cryptopunks(owner):
+    return _deploy("contracts/auxiliary/CryptoPunksMarketMock.vy")
+
+
+@pytest.fixture(scope="session")
+def bayc(owner):
+    return _deploy("contracts/auxiliary/ERC721.vy")
+
+
+@pytest.fixture(scope="session")
+def delegation_registry(owner):
+    return _deploy("contracts/auxiliary/DelegationRegistryMock.vy")
+
+
+@pytest.fixture(scope="session")
+def collections(bayc, cryptopunks):
+    return {"erc721": (keccak(text="bayc"), bayc), "punk": (keccak(text="cryptopunks"), cryptopunks)}
+
+
+@pytest.fixture(scope="session")
+def p2p_control(owner, collections):
+    p2p_control = _deploy("contracts/P2PLendingControl.vy")
+    p2p_control.change_collections_contracts([CollectionContract(k, c.address) for k, c in collections.values()])
+    return p2p_control
+
+
+@pytest.fixture(scope="session")
+def p2p_nfts(owner, usdc, p2p_control, delegation_registry, cryptopunks, fee_wallets, borrower, lenders):
+    p2p_nfts = _deploy(
+        "contracts/P2PLendingNfts.vy",
+        usdc,
+        p2p_control,
+        delegation_registry,
+        cryptopunks,
+        0,
+        0,
+        owner,
+        10000,
+        10000,
+        10000,
+        10000,
+        False,
+    )
+    # balances and allowances are set beforehand so that the scenarios don't pay for zero to non-zero writes
+    for wallet in [borrower, *(lender.address for lender in lenders)]:
+        usdc.mint(wallet, 10**18)
+        usdc.approve(p2p_nfts, 10**18, sender=wallet)
+    for wallet in fee_wallets:
+        usdc.mint(wallet, 1)
+    return p2p_nfts
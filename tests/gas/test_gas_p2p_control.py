@@ -0,0 +1,87 @@
+import pytest
+from eth_utils import keccak
+
+from ..conftest_base import CollectionContract
+
+BATCHES = [1, 16, 128]
+
+
+def _key_hashes(batch):
+    return [keccak(text=f"new_collection{i}") for i in range(batch)]
+
+
+def _roots(batch):
+    return [keccak(text=f"root{i}") for i in range(batch)]
+
+
+@pytest.mark.parametrize("batch", BATCHES)
+def test_change_collections_contracts(p2p_control, gas, owner, bayc, batch):
+    collections = [CollectionContract(key_hash, bayc.address) for key_hash in _key_hashes(batch)]
+
+    gas.measure(
+        f"P2PLendingControl.change_collections_contracts[batch_{batch}]",
+        p2p_control.change_collections_contracts,
+        collections,
+        sender=owner,
+    )
+
+
+def test_change_collections_contracts_update(p2p_control, gas, owner, collections, cryptopunks):
+    key_hash, _ = collections["erc721"]
+
+    gas.measure(
+        "P2PLendingControl.change_collections_contracts[update]",
+        p2p_control.change_collections_contracts,
+        [CollectionContract(key_hash, cryptopunks.address)],
+        sender=owner,
+    )
+
+
+@pytest.mark.parametrize("batch", BATCHES)
+def test_change_collections_trait_roots(p2p_control, gas, owner, bayc, batch):
+    key_hashes = _key_hashes(batch)
+    p2p_control.change_collections_contracts([CollectionContract(k, bayc.address) for k in key_hashes], sender=owner)
+
+    gas.measure(
+        f"P2PLendingControl.change_collections_trait_roots[batch_{batch}]",
+        p2p_control.change_collections_trait_roots,
+        list(zip(key_hashes, _roots(batch))),
+        sender=owner,
+    )
+
+
+@pytest.mark.parametrize("batch", BATCHES)
+def test_change_collections_versioned_trait_roots(p2p_control, gas, owner, bayc, batch):
+    key_hashes = _key_hashes(batch)
+    p2p_control.change_collections_contracts([CollectionContract(k, bayc.address) for k in key_hashes], sender=owner)
+
+    gas.measure(
+        f"P2PLendingControl.change_collections_versioned_trait_roots[batch_{batch}]",
+        p2p_control.change_collections_versioned_trait_roots,
+        [(key_hash, root, 2) for key_hash, root in zip(key_hashes, _roots(batch))],
+        sender=owner,
+    )
+
+
+def test_get_collection_status(p2p_control, gas, collections):
+    key_hash, _ = collections["erc721"]
+
+    gas.measure("P2PLendingControl.get_collection_status", p2p_control.get_collection_status, key_hash)
+
+
+@pytest.mark.parametrize("batch", BATCHES)
+def test_get_collections_status(p2p_control, gas, owner, bayc, batch):
+    key_hashes = _key_hashes(batch)
+    p2p_control.change_collections_contracts([CollectionContract(k, bayc.address) for k in key_hashes], sender=owner)
+
+    gas.measure(f"P2PLendingControl.get_collections_status[batch_{batch}]", p2p_control.get_collections_status, key_hashes)
+
+
+def test_propose_owner(p2p_control, gas, owner, borrower):
+    gas.measure("P2PLendingControl.propose_owner", p2p_control.propose_owner, borrower, sender=owner)
+
+
+def test_claim_ownership(p2p_control, gas, owner, borrower):
+    p2p_control.propose_owner(borrower, sender=owner)
+
+    gas.measure("P2PLendingControl.claim_ownership", p2p_control.claim_ownership, sender=borrower)
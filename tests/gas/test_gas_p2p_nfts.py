@@ -0,0 +1,394 @@
+from itertools import count
+from typing import NamedTuple
+
+import boa
+import pytest
+from eth_utils import keccak
+
+from ..conftest_base import (
+    ZERO_ADDRESS,
+    Fee,
+    Loan,
+    Offer,
+    OfferType,
+    TokenTraitTree,
+    TokenTraitTreeV2,
+    compute_loan_hash,
+    compute_signed_offer_id,
+    sign_offer,
+)
+from ..gas_attribution import GasAttribution
+
+DURATION = 30 * 86400
+PRINCIPAL = 1000 * 10**9
+INTEREST = 50 * 10**9
+ORIGINATION_FEE = 10 * 10**9
+BROKER_UPFRONT_FEE = 5 * 10**9
+BROKER_SETTLEMENT_FEE_BPS = 1000
+PROTOCOL_UPFRONT_FEE_BPS = 100
+PROTOCOL_SETTLEMENT_FEE_BPS = 1000
+TRAIT = ("Fur", "Golden")
+TRAIT_PROOF_DEPTH = 10
+
+
+class Fees(NamedTuple):
+    protocol: bool = False
+    origination: bool = False
+    lender_broker: bool = False
+    borrower_broker: bool = False
+
+
+FEES = {
+    "no_fees": Fees(),
+    "protocol": Fees(protocol=True),
+    "origination": Fees(origination=True),
+    "lender_broker": Fees(lender_broker=True),
+    "borrower_broker": Fees(borrower_broker=True),
+    "all_fees": Fees(True, True, True, True),
+}
+
+OFFER_TYPES = {"token": OfferType.TOKEN, "collection": OfferType.COLLECTION, "trait": OfferType.TRAIT}
+TRAIT_TREES = {1: TokenTraitTree, 2: TokenTraitTreeV2}
+
+
+class Lending:
+    """Builds the offers and loans the scenarios start from, none of which is measured"""
+
+    def __init__(self, p2p_nfts, p2p_control, usdc, collections, owner, borrower, lenders, fee_wallets):
+        self.p2p_nfts = p2p_nfts
+        self.p2p_control = p2p_control
+        self.usdc = usdc
+        self.collections = collections
+        self.owner = owner
+        self.borrower = borrower
+        self.lenders = lenders
+        self.fee_wallets = fee_wallets
+        self.ids = count(1)
+
+    @staticmethod
+    def now():
+        return boa.env.evm.patch.timestamp
+
+    def set_fees(self, fees):
+        if fees.protocol:
+            self.p2p_nfts.set_protocol_fee(PROTOCOL_UPFRONT_FEE_BPS, PROTOCOL_SETTLEMENT_FEE_BPS, sender=self.owner)
+            self.p2p_nfts.change_protocol_wallet(self.fee_wallets[0], sender=self.owner)
+
+    def collateral(self, collateral, offer_type="token", proof_depth=TRAIT_PROOF_DEPTH, trait_version=2):
+        """Mints a new token to the borrower, ready to be used as collateral, and returns its id and proof"""
+
+        key_hash, contract = self.collections[collateral]
+        token_id = next(self.ids)
+        contract.mint(self.borrower, token_id)
+        if collateral == "punk":
+            contract.offerPunkForSaleToAddress(token_id, 0, self.p2p_nfts.address, sender=self.borrower)
+        else:
+            contract.approve(self.p2p_nfts.address, token_id, sender=self.borrower)
+        if offer_type != "trait":
+            return token_id, []
+
+        tree = TRAIT_TREES[trait_version]
+        proof = [keccak(text=f"sibling{i}") for i in range(proof_depth)]
+        root = tree.root_from_proof(tree.token_node(contract.address, *TRAIT, token_id), proof)
+        self.p2p_control.change_collections_versioned_trait_roots([(key_hash, root, trait_version)], sender=self.owner)
+        return token_id, proof
+
+    def offer(self, fees, collateral="erc721", offer_type="token", *, token_id=0, lender=0, pro_rata=False, size=1):
+        lender = self.lenders[lender]
+        offer = Offer(
+            principal=PRINCIPAL,
+            interest=INTEREST,
+            payment_token=self.usdc.address,
+            duration=DURATION,
+            origination_fee_amount=ORIGINATION_FEE if fees.origination else 0,
+            broker_upfront_fee_amount=BROKER_UPFRONT_FEE if fees.lender_broker else 0,
+            broker_settlement_fee_bps=BROKER_SETTLEMENT_FEE_BPS if fees.lender_broker else 0,
+            broker_address=self.fee_wallets[1] if fees.lender_broker else ZERO_ADDRESS,
+            offer_type=OFFER_TYPES[offer_type],
+            token_id=token_id if offer_type == "token" else 0,
+            collection_key_hash=self.collections[collateral][0],
+            trait_hash=TokenTraitTree.trait_hash(*TRAIT) if offer_type == "trait" else b"\0" * 32,
+            expiration=self.now() + DURATION,
+            lender=lender.address,
+            pro_rata=pro_rata,
+            size=size,
+            tracing_id=next(self.ids).to_bytes(32, "big"),
+        )
+        return sign_offer(offer, lender.key, self.p2p_nfts.address)
+
+    def borrower_broker_fee(self, fees):
+        if fees.borrower_broker:
+            return Fee.borrower_broker(self.fee_wallets[2], BROKER_UPFRONT_FEE, BROKER_SETTLEMENT_FEE_BPS)
+        return Fee.borrower_broker(ZERO_ADDRESS)
+
+    def loan(self, loan_id, signed_offer, collateral, token_id, fees, delegate, start_time=None):
+        offer = signed_offer.offer
+        start_time = start_time or self.now()
+        loan = Loan(
+            id=loan_id,
+            offer_id=compute_signed_offer_id(signed_offer),
+            offer_tracing_id=offer.tracing_id,
+            amount=offer.principal,
+            interest=offer.interest,
+            payment_token=offer.payment_token,
+            maturity=start_time + offer.duration,
+            start_time=start_time,
+            borrower=self.borrower,
+            lender=offer.lender,
+            collateral_contract=self.collections[collateral][1].address,
+            collateral_token_id=token_id,
+            fees=[
+                Fee.protocol(self.p2p_nfts, offer.principal),
+                Fee.origination(offer),
+                Fee.lender_broker(offer),
+                self.borrower_broker_fee(fees),
+            ],
+            pro_rata=offer.pro_rata,
+            delegate=delegate,
+        )
+        assert compute_loan_hash(loan) == self.p2p_nfts.loans(loan_id)
+        return loan
+
+    def create_loan(self, fees, collateral="erc721", *, lender=0, pro_rata=False, delegate=ZERO_ADDRESS):
+        token_id, _ = self.collateral(collateral)
+        signed_offer = self.offer(fees, collateral, token_id=token_id, lender=lender, pro_rata=pro_rata)
+        loan_id = self.p2p_nfts.create_loan(
+            *_create_loan_args(self, signed_offer, token_id, [], fees, delegate), sender=self.borrower
+        )
+        return self.loan(loan_id, signed_offer, collateral, token_id, fees, delegate)
+
+
+@pytest.fixture
+def lending(p2p_nfts, p2p_control, usdc, collections, owner, borrower, lenders, fee_wallets):
+    return Lending(p2p_nfts, p2p_control, usdc, collections, owner, borrower, lenders, fee_wallets)
+
+
+def _create_loan_args(lending, signed_offer, token_id, proof, fees, delegate=ZERO_ADDRESS):
+    broker_fee = lending.borrower_broker_fee(fees)
+    return signed_offer, token_id, proof, delegate, broker_fee.upfront_amount, broker_fee.settlement_bps, broker_fee.wallet
+
+
+@pytest.mark.parametrize("fees", FEES)
+@pytest.mark.parametrize("collateral", ["erc721", "punk"])
+@pytest.mark.parametrize("offer_type", OFFER_TYPES)
+def test_create_loan(p2p_nfts, lending, gas, borrower, offer_type, collateral, fees):
+    lending.set_fees(FEES[fees])
+    token_id, proof = lending.collateral(collateral, offer_type)
+    signed_offer = lending.offer(FEES[fees], collateral, offer_type, token_id=token_id)
+
+    gas.measure(
+        f"P2PLendingNfts.create_loan[{offer_type}-{collateral}-{fees}]",
+        p2p_nfts.create_loan,
+        *_create_loan_args(lending, signed_offer, token_id, proof, FEES[fees]),
+        sender=borrower,
+    )
+
+
+@pytest.mark.parametrize("collateral", ["erc721", "punk"])
+def test_create_loan_with_delegate(p2p_nfts, lending, gas, borrower, collateral):
+    token_id, proof = lending.collateral(collateral)
+    signed_offer = lending.offer(FEES["no_fees"], collateral, token_id=token_id)
+
+    gas.measure(
+        f"P2PLendingNfts.create_loan[token-{collateral}-no_fees-delegate]",
+        p2p_nfts.create_loan,
+        *_create_loan_args(lending, signed_offer, token_id, proof, FEES["no_fees"], borrower),
+        sender=borrower,
+    )
+
+
+@pytest.mark.parametrize("proof_depth", [0, 1, 4, 8, 16, 32])
+@pytest.mark.parametrize("trait_version", [1, 2])
+def test_create_loan_trait_proof(p2p_nfts, lending, gas, borrower, trait_version, proof_depth):
+    token_id, proof = lending.collateral("erc721", "trait", proof_depth, trait_version)
+    signed_offer = lending.offer(FEES["no_fees"], "erc721", "trait")
+
+    gas.measure(
+        f"P2PLendingNfts.create_loan[trait_v{trait_version}-depth_{proof_depth}]",
+        p2p_nfts.create_loan,
+        *_create_loan_args(lending, signed_offer, token_id, proof, FEES["no_fees"]),
+        sender=borrower,
+    )
+
+
+@pytest.mark.parametrize("batch", [1, 5, 20])
+@pytest.mark.parametrize("fees", ["no_fees", "all_fees"])
+@pytest.mark.parametrize("collateral", ["erc721", "punk"])
+def test_create_loans(p2p_nfts, lending, gas, borrower, collateral, fees, batch):
+    lending.set_fees(FEES[fees])
+    collaterals = [(lending.collateral(collateral)[0], [], ZERO_ADDRESS) for _ in range(batch)]
+    signed_offer = lending.offer(FEES[fees], collateral, "collection", size=batch)
+    broker_fee = lending.borrower_broker_fee(FEES[fees])
+
+    gas.measure(
+        f"P2PLendingNfts.create_loans[{collateral}-{fees}-batch_{batch}]",
+        p2p_nfts.create_loans,
+        signed_offer,
+        collaterals,
+        broker_fee.upfront_amount,
+        broker_fee.settlement_bps,
+        broker_fee.wallet,
+        sender=borrower,
+    )
+
+
+@pytest.mark.parametrize("fees", FEES)
+@pytest.mark.parametrize("interest", ["fixed", "pro_rata"])
+@pytest.mark.parametrize("collateral", ["erc721", "punk"])
+def test_settle_loan(p2p_nfts, lending, gas, borrower, collateral, interest, fees):
+    lending.set_fees(FEES[fees])
+    loan = lending.create_loan(FEES[fees], collateral, pro_rata=interest == "pro_rata")
+    boa.env.time_travel(seconds=DURATION // 2)
+
+    gas.measure(f"P2PLendingNfts.settle_loan[{collateral}-{interest}-{fees}]", p2p_nfts.settle_loan, loan, sender=borrower)
+
+
+def test_settle_loan_with_pending_transfer(p2p_nfts, lending, gas, usdc, owner, borrower):
+    loan = lending.create_loan(FEES["no_fees"])
+    usdc.blacklist(loan.lender, True, sender=owner)
+
+    gas.measure(
+        "P2PLendingNfts.settle_loan[erc721-fixed-no_fees-pending_transfer]", p2p_nfts.settle_loan, loan, sender=borrower
+    )
+
+
+@pytest.mark.parametrize("batch", [1, 5, 20, 32])
+@pytest.mark.parametrize("interest", ["fixed", "pro_rata"])
+def test_settle_loans(p2p_nfts, lending, gas, borrower, interest, batch):
+    lending.set_fees(FEES["all_fees"])
+    loans = [lending.create_loan(FEES["all_fees"], pro_rata=interest == "pro_rata", lender=i % 2) for i in range(batch)]
+    boa.env.time_travel(seconds=DURATION // 2)
+
+    gas.measure(f"P2PLendingNfts.settle_loans[{interest}-batch_{batch}]", p2p_nfts.settle_loans, loans, sender=borrower)
+
+
+@pytest.mark.parametrize("delegate", [False, True])
+@pytest.mark.parametrize("collateral", ["erc721", "punk"])
+def test_claim_defaulted_loan_collateral(p2p_nfts, lending, gas, borrower, collateral, delegate):
+    loan = lending.create_loan(FEES["all_fees"], collateral, delegate=borrower if delegate else ZERO_ADDRESS)
+    boa.env.time_travel(seconds=DURATION + 1)
+
+    gas.measure(
+        f"P2PLendingNfts.claim_defaulted_loan_collateral[{collateral}{'-delegate' if delegate else ''}]",
+        p2p_nfts.claim_defaulted_loan_collateral,
+        loan,
+        sender=loan.lender,
+    )
+
+
+@pytest.mark.parametrize("batch", [1, 5, 32])
+@pytest.mark.parametrize("batch_revocation", [False, True])
+def test_claim_defaulted_loans_collateral(p2p_nfts, lending, gas, borrower, batch_revocation, batch):
+    loans = [lending.create_loan(FEES["all_fees"], delegate=borrower) for _ in range(batch)]
+    boa.env.time_travel(seconds=DURATION + 1)
+
+    revocation = "batch_revocation" if batch_revocation else "single_revocations"
+    gas.measure(
+        f"P2PLendingNfts.claim_defaulted_loans_collateral[{revocation}-batch_{batch}]",
+        p2p_nfts.claim_defaulted_loans_collateral,
+        loans,
+        batch_revocation,
+        sender=loans[0].lender,
+    )
+
+
+@pytest.mark.parametrize("new_lender", ["same_lender", "other_lender"])
+@pytest.mark.parametrize("fees", FEES)
+@pytest.mark.parametrize("interest", ["fixed", "pro_rata"])
+def test_replace_loan(p2p_nfts, lending, gas, borrower, interest, fees, new_lender):
+    lending.set_fees(FEES[fees])
+    loan = lending.create_loan(FEES[fees], pro_rata=interest == "pro_rata")
+    boa.env.time_travel(seconds=DURATION // 2)
+    lender = 0 if new_lender == "same_lender" else 1
+    offer = lending.offer(FEES[fees], token_id=loan.collateral_token_id, lender=lender, pro_rata=interest == "pro_rata")
+    broker_fee = lending.borrower_broker_fee(FEES[fees])
+
+    gas.measure(
+        f"P2PLendingNfts.replace_loan[{interest}-{fees}-{new_lender}]",
+        p2p_nfts.replace_loan,
+        loan,
+        offer,
+        [],
+        broker_fee.upfront_amount,
+        broker_fee.settlement_bps,
+        broker_fee.wallet,
+        sender=borrower,
+    )
+
+
+@pytest.mark.parametrize("new_lender", ["same_lender", "other_lender"])
+@pytest.mark.parametrize("fees", FEES)
+@pytest.mark.parametrize("interest", ["fixed", "pro_rata"])
+def test_replace_loan_lender(p2p_nfts, lending, gas, interest, fees, new_lender):
+    lending.set_fees(FEES[fees])
+    loan = lending.create_loan(FEES[fees], pro_rata=interest == "pro_rata")
+    boa.env.time_travel(seconds=DURATION // 2)
+    lender = 0 if new_lender == "same_lender" else 1
+    offer = lending.offer(FEES[fees], token_id=loan.collateral_token_id, lender=lender, pro_rata=interest == "pro_rata")
+
+    gas.measure(
+        f"P2PLendingNfts.replace_loan_lender[{interest}-{fees}-{new_lender}]",
+        p2p_nfts.replace_loan_lender,
+        loan,
+        offer,
+        [],
+        sender=loan.lender,
+    )
+
+
+def test_revoke_offer(p2p_nfts, lending, gas):
+    offer = lending.offer(FEES["all_fees"], "erc721", "collection")
+
+    gas.measure("P2PLendingNfts.revoke_offer", p2p_nfts.revoke_offer, offer, sender=offer.offer.lender)
+
+
+def test_set_min_offer_nonce(p2p_nfts, gas, lenders):
+    gas.measure("P2PLendingNfts.set_min_offer_nonce", p2p_nfts.set_min_offer_nonce, 1, sender=lenders[0].address)
+
+
+def test_claim_pending_transfers(p2p_nfts, lending, gas, usdc, owner, borrower):
+    loan = lending.create_loan(FEES["no_fees"])
+    usdc.blacklist(loan.lender, True, sender=owner)
+    p2p_nfts.settle_loan(loan, sender=borrower)
+    usdc.blacklist(loan.lender, False, sender=owner)
+
+    gas.measure("P2PLendingNfts.claim_pending_transfers", p2p_nfts.claim_pending_transfers, sender=loan.lender)
+
+
+def test_set_protocol_fee(p2p_nfts, gas, owner):
+    gas.measure("P2PLendingNfts.set_protocol_fee", p2p_nfts.set_protocol_fee, 100, 1000, sender=owner)
+
+
+def test_change_protocol_wallet(p2p_nfts, gas, owner, fee_wallets):
+    gas.measure("P2PLendingNfts.change_protocol_wallet", p2p_nfts.change_protocol_wallet, fee_wallets[0], sender=owner)
+
+
+def test_set_proxy_authorization(p2p_nfts, gas, owner, fee_wallets):
+    gas.measure("P2PLendingNfts.set_proxy_authorization", p2p_nfts.set_proxy_authorization, fee_wallets[1], True, sender=owner)
+
+
+def test_propose_owner(p2p_nfts, gas, owner, lenders):
+    gas.measure("P2PLendingNfts.propose_owner", p2p_nfts.propose_owner, lenders[0].address, sender=owner)
+
+
+def test_claim_ownership(p2p_nfts, gas, owner, lenders):
+    p2p_nfts.propose_owner(lenders[0].address, sender=owner)
+
+    gas.measure("P2PLendingNfts.claim_ownership", p2p_nfts.claim_ownership, sender=lenders[0].address)
+
+
+def test_gas_attribution(p2p_nfts, lending, borrower):
+    lending.set_fees(FEES["all_fees"])
+    loan = lending.create_loan(FEES["all_fees"], "punk")
+    boa.env.time_travel(seconds=100)
+    attribution = GasAttribution()
+
+    with attribution.profile("settle"):
+        p2p_nfts.settle_loan(loan, sender=borrower)
+
+    assert sum(attribution.stacks.values()) == p2p_nfts._computation.get_gas_used()
+    payment = "P2PLendingNfts._pay_funds;P2PLendingNfts._call_payment_token;WETH9Mock.transferFrom"
+    assert f"settle;P2PLendingNfts.settle_loan;{payment}" in attribution.stacks
+    functions = {frame: (calls, self_gas, gas) for frame, calls, self_gas, gas in attribution.functions()}
+    assert functions["P2PLendingNfts.settle_loan"][2] == p2p_nfts._computation.get_gas_used()
+    assert functions["CryptoPunksMarketMock.transferPunk"][0] == 1
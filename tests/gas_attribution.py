@@ -0,0 +1,158 @@
+from collections import Counter
+from contextlib import contextmanager
+from functools import cache
+from pathlib import Path
+
+import boa
+from boa.contracts.vyper.ast_utils import get_fn_ancestor_from_node
+from boa.contracts.vyper.vyper_contract import VyperContract
+from eth.vm.gas_meter import GasMeter
+from eth_utils import to_checksum_address
+
+CALL_OPCODES = {0xF0, 0xF1, 0xF2, 0xF4, 0xF5, 0xFA}  # CREATE, CALL, CALLCODE, DELEGATECALL, CREATE2, STATICCALL
+PRECOMPILES = {1: "ecrecover", 2: "sha256", 3: "ripemd160", 4: "identity", 5: "modexp"}
+
+
+class StepGasMeter(GasMeter):
+    """Gas meter keeping the gas used by each executed instruction, in execution order"""
+
+    def _set_code(self, code):
+        self._code = code
+        self.gas_of_step = {}
+
+    def _record(self, amount):
+        step = len(self._code._trace) - 1
+        self.gas_of_step[step] = self.gas_of_step.get(step, 0) + amount
+
+    def consume_gas(self, amount, reason):
+        super().consume_gas(amount, reason)
+        self._record(amount)
+
+    def return_gas(self, amount):
+        super().return_gas(amount)
+        self._record(-amount)
+
+
+@cache
+def _contract_functions(contract):
+    # the source map only covers part of the instructions, the others are charged to the function running before them
+    functions = {}
+    for pc, pos in contract.source_map["pc_pos_map"].items():
+        node = get_fn_ancestor_from_node(contract.ast_map.get(pos))
+        if node is not None:
+            functions[pc] = node.name
+    selectors = {
+        method_id: fn.name
+        for fn in contract.compiler_data.function_signatures.values()
+        if fn.is_external
+        for method_id in fn.method_ids.values()
+    }
+    return functions, selectors
+
+
+class GasAttribution:
+    """
+    Attributes the execution gas of the calls made while profiling to the stacks of internal functions and external
+    calls they ran, eg `P2PLendingNfts.replace_loan_lender;P2PLendingNfts._receive_funds;WETH9Mock.transferFrom`.
+    The intrinsic and calldata gas, which depend only on the transaction, are not included
+    """
+
+    def __init__(self):
+        self.stacks = Counter()
+        self.calls = Counter()
+
+    @contextmanager
+    def profile(self, label):
+        """Profiles every call executed in the context, under a root frame with the label"""
+
+        execute_code = boa.env.execute_code
+        patched = "execute_code" in vars(boa.env)
+
+        def _execute_code(*args, **kwargs):
+            computation = execute_code(*args, **kwargs)
+            # code run with override_bytecode, eg by contract.eval(), doesn't match the source map of the contract
+            self._attribute(computation, (label,), evaluated=kwargs.get("override_bytecode") is not None)
+            return computation
+
+        boa.env.execute_code = _execute_code
+        try:
+            with boa.env.gas_meter_class(StepGasMeter):
+                yield self
+        finally:
+            if patched:  # nested profiles
+                boa.env.execute_code = execute_code
+            else:
+                del boa.env.execute_code
+
+    def merge(self, data):
+        self.stacks.update(data["stacks"])
+        self.calls.update(data["calls"])
+
+    def to_dict(self):
+        return {"stacks": dict(self.stacks), "calls": dict(self.calls)}
+
+    def _attribute(self, computation, prefix, *, evaluated=False):
+        address = computation.msg.code_address
+        contract = boa.env.lookup_contract(address)
+        if not isinstance(contract, VyperContract) or not isinstance(computation._gas_meter, StepGasMeter):
+            name = PRECOMPILES.get(int.from_bytes(address, "big"), to_checksum_address(address))
+            self.calls[name] += 1
+            self.stacks[";".join((*prefix, name))] += computation.get_gas_used()
+            return
+
+        contract_name = Path(contract.compiler_data.contract_name).stem
+        functions, selectors = _contract_functions(contract)
+        if evaluated:
+            functions, entry = {}, "<eval>"
+        else:
+            selector = computation.msg.data[:4]
+            entry = selectors.get(
+                int.from_bytes(selector, "big"), "__default__" if len(selector) < 4 else f"0x{selector.hex()}"
+            )
+        stack = [f"{contract_name}.{entry}"]
+        self.calls[stack[0]] += 1
+        code = computation.code._raw_code_bytes
+        gas_of_step = computation._gas_meter.gas_of_step
+        children = iter(computation.children)
+
+        for step, pc in enumerate(computation.code._trace):
+            function = functions.get(pc)
+            if function is not None and f"{contract_name}.{function}" != stack[-1]:
+                frame = f"{contract_name}.{function}"
+                if frame in stack:  # vyper has no recursion, so a function already in the stack is returning
+                    del stack[stack.index(frame) + 1 :]
+                else:
+                    stack.append(frame)
+                    self.calls[frame] += 1
+
+            gas = gas_of_step.get(step, 0)
+            if code[pc] in CALL_OPCODES and (child := next(children, None)) is not None:
+                gas -= child.get_gas_used()
+                self._attribute(child, (*prefix, *stack))
+            self.stacks[";".join((*prefix, *stack))] += gas
+
+    def collapsed_stacks(self):
+        """Stacks in the collapsed format read by flamegraph.pl, speedscope or inferno"""
+
+        return "".join(f"{stack} {gas}\n" for stack, gas in sorted(self.stacks.items()) if gas > 0)
+
+    def functions(self):
+        """Calls, self gas and inclusive gas of each function, sorted by inclusive gas"""
+
+        self_gas, inclusive_gas = Counter(), Counter()
+        for stack, gas in self.stacks.items():
+            frames = stack.split(";")[1:]
+            self_gas[frames[-1]] += gas
+            for frame in set(frames):
+                inclusive_gas[frame] += gas
+        return sorted(
+            ((frame, self.calls[frame], self_gas[frame], gas) for frame, gas in inclusive_gas.items()),
+            key=lambda row: (-row[3], row[0]),
+        )
+
+    def table(self, limit=None):
+        rows = self.functions()[:limit]
+        width = max((len(row[0]) for row in rows), default=8)
+        lines = [f"{'function':<{width}} {'calls':>8} {'self gas':>12} {'inclusive gas':>14}"]
+        lines += [f"{frame:<{width}} {calls:>8} {self_gas:>12} {gas:>14}" for frame, calls, self_gas, gas in rows]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,110 @@
+import os
+
+import boa
+import pytest
+from eth_account import Account
+from eth_utils import keccak
+from hypothesis import HealthCheck, settings
+
+from ..conftest_base import CollectionContract, load_partial
+
+settings.register_profile(
+    "default",
+    max_examples=20,
+    stateful_step_count=25,
+    deadline=None,
+    suppress_health_check=[HealthCheck.too_slow, HealthCheck.data_too_large],
+)
+settings.register_profile("ci", parent=settings.get_profile("default"), max_examples=200)
+settings.load_profile(os.environ.get("HYPOTHESIS_PROFILE", "default"))
+
+
+def pytest_terminal_summary(terminalreporter):
+    # the throughput of each state machine and of the model is reported as user properties, which are also sent back
+    # by xdist workers
+    for report in terminalreporter.stats.get("passed", []):
+        properties = dict(report.user_properties)
+        if "examples_per_second" in properties:
+            terminalreporter.write_line(
+                f"{report.nodeid}: {properties['examples']} examples, {properties['steps']} steps in "
+                f"{properties['duration']:.1f}s, {properties['examples_per_second']:.2f} examples/s, "
+                f"{properties['steps_per_second']:.1f} steps/s"
+            )
+        if "model_steps_per_second" in properties:
+            terminalreporter.write_line(
+                f"{report.nodeid}: {properties['scenarios']} scenarios, {properties['replayed']} replayed on the contract, "
+                f"{properties['model_steps_per_second']:.0f} model steps/s, "
+                f"{properties['contract_steps_per_second']:.1f} contract steps/s ({properties['speedup']:.0f}x)"
+            )
+
+
+@pytest.fixture(scope="session", autouse=True)
+def boa_env():
+    boa.interpret.set_cache_dir(cache_dir=".cache/titanoboa")
+    return boa
+
+
+def _wallets(name, count):
+    # deterministic keys keep the failing examples saved by hypothesis reproducible
+    return [Account.from_key(keccak(text=f"{name}{i}")) for i in range(count)]
+
+
+@pytest.fixture(scope="session")
+def owner():
+    owner = _wallets("owner", 1)[0].address
+    boa.env.eoa = owner
+    return owner
+
+
+@pytest.fixture(scope="session")
+def borrowers():
+    return [wallet.address for wallet in _wallets("borrower", 3)]
+
+
+@pytest.fixture(scope="session")
+def lenders():
+    return _wallets("lender", 3)
+
+
+@pytest.fixture(scope="session")
+def fee_wallets():
+    return [wallet.address for wallet in _wallets("fee_wallet", 3)]
+
+
+@pytest.fixture(scope="session")
+def usdc(owner):
+    return load_partial("contracts/auxiliary/WETH9Mock.vy").deploy("USDC", "USDC", 9, 0)
+
+
+@pytest.fixture(scope="session")
+def cryptopunks(owner):
+    return load_partial("contracts/auxiliary/CryptoPunksMarketMock.vy").deploy()
+
+
+@pytest.fixture(scope="session")
+def erc721_collections(owner):
+    erc721_contract_def = load_partial("contracts/auxiliary/ERC721.vy")
+    return [erc721_contract_def.deploy() for _ in range(2)]
+
+
+@pytest.fixture(scope="session")
+def collections(erc721_collections, cryptopunks):
+    return {keccak(text=f"collection{i}"): c for i, c in enumerate([*erc721_collections, cryptopunks])}
+
+
+@pytest.fixture(scope="session")
+def p2p_control(owner, collections):
+    p2p_control = load_partial("contracts/P2PLendingControl.vy").deploy()
+    p2p_control.change_collections_contracts([CollectionContract(k, c.address) for k, c in collections.items()])
+    return p2p_control
+
+
+@pytest.fixture(scope="session")
+def p2p_nfts_usdc(owner, usdc, p2p_control, cryptopunks, fee_wallets):
+    delegation_registry = load_partial("contracts/auxiliary/DelegationRegistryMock.vy").deploy()
+    p2p_nfts_usdc = load_partial("contracts/P2PLendingNfts.vy").deploy(
+        usdc, p2p_control, delegation_registry, cryptopunks, 0, 0, owner, 10000, 10000, 10000, 10000, False
+    )
+    p2p_nfts_usdc.set_protocol_fee(100, 1000)
+    p2p_nfts_usdc.change_protocol_wallet(fee_wallets[0])
+    return p2p_nfts_usdc
@@ -0,0 +1,675 @@
+from collections import Counter
+from copy import copy
+from typing import NamedTuple
+
+from eth_utils import keccak
+
+from ..conftest_base import (
+    ZERO_ADDRESS,
+    Fee,
+    FeeAmount,
+    FeeType,
+    Loan,
+    OfferType,
+    SignedOffer,
+)
+
+BPS = 10000
+UINT256_MAX = 2**256 - 1
+
+
+class Revert(Exception):  # noqa: N818
+    """
+    Raised by the model where the contract reverts. The reason is None for the reverts without a reason string, ie the
+    payment token failures and the arithmetic checks.
+    """
+
+    def __init__(self, reason: str | None = None):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class ModelEvent(NamedTuple):
+    name: str
+    args: dict
+
+
+def _uint(value: int) -> int:
+    # the contract checks every intermediate uint256 value, so the model checks them in the same evaluation order
+    if not 0 <= value <= UINT256_MAX:
+        raise Revert
+    return value
+
+
+def _div(a: int, b: int) -> int:
+    if b == 0:
+        raise Revert
+    return a // b
+
+
+def _words(*values) -> bytes:
+    # abi encoding of static values, built directly as eth_abi validates every value and dominates the model run time
+    return b"".join(
+        value if isinstance(value, bytes) else (int(value, 16) if isinstance(value, str) else value).to_bytes(32, "big")
+        for value in values
+    )
+
+
+def loan_id(loan: Loan) -> bytes:
+    return keccak(_words(loan.borrower, loan.lender, loan.start_time, loan.collateral_contract, loan.collateral_token_id))
+
+
+def loan_hash(loan: Loan) -> bytes:
+    # keccak256(_abi_encode(loan)): the offset of the loan tuple, its head with the offset of the fees and the fees
+    head = _words(
+        32,
+        loan.id,
+        loan.offer_id,
+        loan.offer_tracing_id,
+        loan.amount,
+        loan.interest,
+        loan.payment_token,
+        loan.maturity,
+        loan.start_time,
+        loan.borrower,
+        loan.lender,
+        loan.collateral_contract,
+        loan.collateral_token_id,
+        15 * 32,
+        loan.pro_rata,
+        loan.delegate,
+    )
+    return keccak(head + _words(len(loan.fees), *(value for fee in loan.fees for value in fee)))
+
+
+def signed_offer_id(offer: SignedOffer) -> bytes:
+    return keccak(_words(*offer.signature))
+
+
+class P2PLendingNftsModel:
+    """
+    Executable model of the P2PLendingNfts state transitions, including the payment token balances and the collateral
+    holders, so scenarios can be explored far faster than on the EVM. The external methods have the same arguments as
+    the contract ones and either return the same value or raise `Revert` with the contract revert reason, leaving the
+    state untouched. The events logged by the last call are kept in `events`.
+
+    Some parts of the contract are out of the model: offer signatures are assumed valid, trait offers and proofs are
+    not supported, the delegations aren't tracked, the borrowers are expected to have approved the collaterals and
+    the payment token allowances are unlimited. There are no authorized proxies, so every call is made by the user.
+    """
+
+    def __init__(
+        self,
+        *,
+        address: str,
+        payment_token: str,
+        collections: dict[bytes, str],
+        protocol_upfront_fee: int,
+        protocol_settlement_fee: int,
+        protocol_wallet: str,
+        max_lender_broker_settlement_fee: int = BPS,
+        max_borrower_broker_settlement_fee: int = BPS,
+        sparse_fees: bool = False,
+        balances: dict[str, int] | None = None,
+        collateral_holders: dict[tuple[str, int], str] | None = None,
+        now: int = 0,
+    ):
+        self.address = address
+        self.payment_token = payment_token
+        self.collections = dict(collections)
+        self.protocol_upfront_fee = protocol_upfront_fee
+        self.protocol_settlement_fee = protocol_settlement_fee
+        self.protocol_wallet = protocol_wallet
+        self.max_lender_broker_settlement_fee = max_lender_broker_settlement_fee
+        self.max_borrower_broker_settlement_fee = max_borrower_broker_settlement_fee
+        self.sparse_fees = sparse_fees
+        self.now = now
+
+        # contract state
+        self.loans: dict[bytes, bytes] = {}
+        self.offer_count: Counter = Counter()
+        self.revoked_offers: set[bytes] = set()
+        self.min_offer_nonce: Counter = Counter()
+        self.pending_transfers: Counter = Counter()
+
+        # payment token and collateral state
+        self.balances: Counter = Counter(balances or {})
+        self.blacklisted: set[str] = set()
+        self.collateral_holders: dict[tuple[str, int], str] = dict(collateral_holders or {})
+
+        self.events: list[ModelEvent] = []
+
+    _STATE = (
+        "loans",
+        "offer_count",
+        "revoked_offers",
+        "min_offer_nonce",
+        "pending_transfers",
+        "balances",
+        "collateral_holders",
+    )
+
+    def _call(self, fn, *args, **kwargs):
+        # runs an external call as a transaction, restoring the state if it reverts
+        snapshot = {name: copy(getattr(self, name)) for name in self._STATE}
+        self.events = []
+        try:
+            return fn(*args, **kwargs)
+        except Revert:
+            self.__dict__.update(snapshot)
+            self.events = []
+            raise
+
+    def _log(self, name: str, **args):
+        self.events.append(ModelEvent(name, args))
+
+    # payment token
+
+    def _token_transfer(self, _from: str, _to: str, amount: int) -> bool:
+        if _from in self.blacklisted or _to in self.blacklisted or self.balances[_from] < amount:
+            return False
+        self.balances[_from] -= amount
+        self.balances[_to] += amount
+        return True
+
+    def _transfer_funds(self, _from: str, _to: str, amount: int):
+        if not self._token_transfer(_from, _to, amount):
+            raise Revert
+
+    def _receive_funds(self, _from: str, amount: int):
+        self._transfer_funds(_from, self.address, amount)
+
+    def _send_funds(self, _to: str, amount: int):
+        if not self._token_transfer(self.address, _to, amount):
+            self._log("TransferFailed", _to=_to, amount=amount)
+            self.pending_transfers[_to] += amount
+
+    def _pay_funds(self, _from: str, _to: str, amount: int):
+        if not self._token_transfer(_from, _to, amount):
+            self._receive_funds(_from, amount)
+            self._send_funds(_to, amount)
+
+    def blacklist(self, wallet: str, value: bool):  # noqa: FBT001
+        if value:
+            self.blacklisted.add(wallet)
+        else:
+            self.blacklisted.discard(wallet)
+
+    # validations
+
+    def _validate_offer_terms(self, offer: SignedOffer) -> str:
+        terms = offer.offer
+        if terms.expiration <= self.now:
+            raise Revert("offer expired")
+        if terms.payment_token != self.payment_token:
+            raise Revert("invalid payment token")
+        if terms.origination_fee_amount > terms.principal:
+            raise Revert("origination fee gt principal")
+        if terms.nonce < self.min_offer_nonce[terms.lender]:
+            raise Revert("offer nonce revoked")
+        if terms.collection_key_hash not in self.collections:
+            raise Revert("collateral not whitelisted")
+        return self.collections[terms.collection_key_hash]
+
+    @staticmethod
+    def _validate_token_ids(offer: SignedOffer, token_id: int):
+        terms = offer.offer
+        if terms.offer_type == OfferType.TOKEN:
+            if terms.token_id != token_id:
+                raise Revert("token id not in offer")
+        elif terms.offer_type == OfferType.COLLECTION:
+            if token_id < terms.token_range_min:
+                raise Revert("tokenid below offer range")
+            if token_id > terms.token_range_max:
+                raise Revert("tokenid above offer range")
+        else:
+            raise NotImplementedError("trait offers are not supported by the model")
+
+    def _validate_offer(self, offer: SignedOffer, token_id: int) -> str:
+        collateral_contract = self._validate_offer_terms(offer)
+        self._validate_token_ids(offer, token_id)
+        return collateral_contract
+
+    def _validate_loan(self, loan: Loan):
+        if self.loans.get(loan.id, bytes(32)) != loan_hash(loan):
+            raise Revert("invalid loan")
+
+    @staticmethod
+    def _check_user(sender: str, user: str, reason: str):
+        if sender != user:
+            raise Revert(reason)
+
+    def _check_and_update_offer_state(self, offer: SignedOffer):
+        offer_id = signed_offer_id(offer)
+        if offer_id in self.revoked_offers:
+            raise Revert("offer revoked")
+        count = self.offer_count[offer.offer.tracing_id] + 1
+        if count > offer.offer.size:
+            raise Revert("offer fully utilized")
+        self.offer_count[offer.offer.tracing_id] = count
+        if offer.offer.offer_type == OfferType.TOKEN:
+            self._revoke_offer(offer_id, offer)
+
+    def _revoke_offer(self, offer_id: bytes, offer: SignedOffer):
+        self.revoked_offers.add(offer_id)
+        self._log(
+            "OfferRevoked",
+            offer_id=offer_id,
+            lender=offer.offer.lender,
+            collection_key_hash=offer.offer.collection_key_hash,
+            offer_type=offer.offer.offer_type,
+        )
+
+    def _reduce_offer_count(self, tracing_id: bytes):
+        self.offer_count[tracing_id] = _uint(self.offer_count[tracing_id] - 1)
+
+    # fees and interest
+
+    def _get_loan_fees(self, offer, bb_upfront_fee_amount, bb_settlement_fee_bps, bb):
+        if offer.broker_settlement_fee_bps > self.max_lender_broker_settlement_fee:
+            raise Revert("lender broker fee exceeds max")
+        if bb_settlement_fee_bps > self.max_borrower_broker_settlement_fee:
+            raise Revert("borrower broker fee exceeds max")
+        if self.protocol_settlement_fee + offer.broker_settlement_fee_bps > BPS:
+            raise Revert("settlement fees gt principal")
+
+        protocol_upfront_fee_amount = self.protocol_upfront_fee * offer.principal // BPS
+        all_fees = [
+            Fee(FeeType.PROTOCOL, protocol_upfront_fee_amount, self.protocol_settlement_fee, self.protocol_wallet),
+            Fee.origination(offer),
+            Fee.lender_broker(offer),
+            Fee.borrower_broker(bb, bb_upfront_fee_amount, bb_settlement_fee_bps),
+        ]
+        fees = []
+        for fee in all_fees:
+            if fee.upfront_amount > 0 or fee.settlement_bps > 0:
+                if fee.wallet == ZERO_ADDRESS:
+                    raise Revert("broker fee without address")
+                fees.append(fee)
+        return fees if self.sparse_fees else all_fees
+
+    @staticmethod
+    def _total_upfront_fees(fees: list[Fee]) -> int:
+        return sum(fee.upfront_amount for fee in fees)
+
+    def _compute_settlement_interest(self, loan: Loan) -> int:
+        if loan.pro_rata:
+            return _div(loan.interest * (self.now - loan.start_time), loan.maturity - loan.start_time)
+        return loan.interest
+
+    @staticmethod
+    def _get_settlement_fees(loan: Loan, interest: int) -> tuple[list[FeeAmount], int, int]:
+        settlement_fees = []
+        borrower_broker_fee_amount = 0
+        for fee in loan.fees:
+            if fee.settlement_bps > 0:
+                amount = interest * fee.settlement_bps // BPS
+                settlement_fees.append(FeeAmount(fee.type, amount, fee.wallet))
+                if fee.type == FeeType.BORROWER_BROKER:
+                    borrower_broker_fee_amount = amount
+        return settlement_fees, sum(fee.amount for fee in settlement_fees), borrower_broker_fee_amount
+
+    def _compute_max_interest_delta(self, loan: Loan, offer, interest: int) -> int:
+        borrower_broker_fee_bps = next((fee.settlement_bps for fee in loan.fees if fee.type == FeeType.BORROWER_BROKER), 0)
+        loan_interest_delta_at_maturity = loan.interest - interest
+        if offer.pro_rata:
+            delta_at_refinance = 0
+            borrower_broker_fee_delta_at_maturity = loan_interest_delta_at_maturity * borrower_broker_fee_bps // BPS
+            offer_interest_at_loan_maturity = _div(offer.interest * (loan.maturity - self.now), offer.duration)
+        else:
+            delta_at_refinance = offer.interest
+            borrower_broker_fee_delta_at_maturity = 0
+            offer_interest_at_loan_maturity = offer.interest
+        return max(
+            delta_at_refinance,
+            offer_interest_at_loan_maturity - loan_interest_delta_at_maturity - borrower_broker_fee_delta_at_maturity,
+        )
+
+    # loans
+
+    def _store_new_loan(self, offer, borrower, collateral_contract, collateral_token_id, fees, delegate) -> Loan:
+        loan = Loan(
+            offer_id=signed_offer_id(offer),
+            offer_tracing_id=offer.offer.tracing_id,
+            amount=offer.offer.principal,
+            interest=offer.offer.interest,
+            payment_token=offer.offer.payment_token,
+            maturity=_uint(self.now + offer.offer.duration),
+            start_time=self.now,
+            borrower=borrower,
+            lender=offer.offer.lender,
+            collateral_contract=collateral_contract,
+            collateral_token_id=collateral_token_id,
+            fees=fees,
+            pro_rata=offer.offer.pro_rata,
+            delegate=delegate,
+        )
+        loan = loan._replace(id=loan_id(loan))
+        if loan.id in self.loans:
+            raise Revert("loan already exists")
+        self.loans[loan.id] = loan_hash(loan)
+        return loan
+
+    def _store_collateral(self, wallet: str, collateral_contract: str, token_id: int):
+        if self.collateral_holders.get((collateral_contract, token_id)) != wallet:
+            raise Revert("collateral not owned by wallet")
+        self.collateral_holders[collateral_contract, token_id] = self.address
+
+    def _release_collateral(self, loan: Loan, wallet: str):
+        self.collateral_holders[loan.collateral_contract, loan.collateral_token_id] = wallet
+
+    def _close_settled_loan(self, loan: Loan, sender: str):
+        self._validate_loan(loan)
+        if self.now > loan.maturity:
+            raise Revert("loan defaulted")
+        self._check_user(sender, loan.borrower, "not borrower")
+
+        interest = self._compute_settlement_interest(loan)
+        settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+
+        del self.loans[loan.id]
+        self._reduce_offer_count(loan.offer_tracing_id)
+        return interest, settlement_fees, settlement_fees_total, borrower_broker_fee_amount
+
+    def _close_replaced_loan(self, loan: Loan, offer: SignedOffer):
+        if self.now > loan.maturity:
+            raise Revert("loan defaulted")
+        if self._validate_offer(offer, loan.collateral_token_id) != loan.collateral_contract:
+            raise Revert("collateral contract mismatch")
+
+        self._check_and_update_offer_state(offer)
+        self._reduce_offer_count(loan.offer_tracing_id)
+
+        interest = self._compute_settlement_interest(loan)
+        settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+
+        del self.loans[loan.id]
+        return interest, settlement_fees, settlement_fees_total, borrower_broker_fee_amount
+
+    def _send_replacement_fees(self, settlement_fees: list[FeeAmount], new_loan_fees: list[Fee]):
+        for fee in settlement_fees:
+            self._send_funds(fee.wallet, fee.amount)
+        for fee in new_loan_fees:
+            if fee.type != FeeType.ORIGINATION and fee.upfront_amount > 0:
+                self._send_funds(fee.wallet, fee.upfront_amount)
+
+    def _log_replacement(self, name, new_loan, loan, interest, settlement_fees, **extra):
+        self._log(
+            name,
+            id=new_loan.id,
+            amount=new_loan.amount,
+            interest=new_loan.interest,
+            payment_token=new_loan.payment_token,
+            maturity=new_loan.maturity,
+            start_time=new_loan.start_time,
+            collateral_contract=new_loan.collateral_contract,
+            collateral_token_id=new_loan.collateral_token_id,
+            borrower=new_loan.borrower,
+            lender=new_loan.lender,
+            fees=new_loan.fees,
+            pro_rata=new_loan.pro_rata,
+            original_loan_id=loan.id,
+            paid_principal=loan.amount,
+            paid_interest=interest,
+            paid_settlement_fees=settlement_fees,
+            **extra,
+            offer_id=new_loan.offer_id,
+            offer_tracing_id=new_loan.offer_tracing_id,
+        )
+
+    # external methods
+
+    def create_loan(
+        self,
+        offer: SignedOffer,
+        collateral_token_id: int,
+        collateral_proof: list,  # noqa: ARG002
+        delegate: str,
+        borrower_broker_upfront_fee_amount: int,
+        borrower_broker_settlement_fee_bps: int,
+        borrower_broker: str,
+        *,
+        sender: str,
+    ) -> bytes:
+        return self._call(
+            self._create_loan,
+            offer,
+            collateral_token_id,
+            delegate,
+            borrower_broker_upfront_fee_amount,
+            borrower_broker_settlement_fee_bps,
+            borrower_broker,
+            sender,
+        )
+
+    def _create_loan(self, offer, collateral_token_id, delegate, bb_upfront_fee_amount, bb_settlement_fee_bps, bb, sender):
+        collateral_contract = self._validate_offer(offer, collateral_token_id)
+        fees = self._get_loan_fees(offer.offer, bb_upfront_fee_amount, bb_settlement_fee_bps, bb)
+        self._check_and_update_offer_state(offer)
+
+        loan = self._store_new_loan(offer, sender, collateral_contract, collateral_token_id, fees, delegate)
+        self._store_collateral(sender, collateral_contract, collateral_token_id)
+        self._log(
+            "LoanCreated",
+            id=loan.id,
+            amount=loan.amount,
+            interest=loan.interest,
+            payment_token=loan.payment_token,
+            maturity=loan.maturity,
+            start_time=loan.start_time,
+            borrower=loan.borrower,
+            lender=loan.lender,
+            collateral_contract=loan.collateral_contract,
+            collateral_token_id=loan.collateral_token_id,
+            fees=loan.fees,
+            pro_rata=loan.pro_rata,
+            offer_id=loan.offer_id,
+            offer_tracing_id=loan.offer_tracing_id,
+            delegate=delegate,
+        )
+
+        terms = offer.offer
+        self._transfer_funds(
+            terms.lender, sender, _uint(terms.principal - self._total_upfront_fees(fees)) + terms.broker_upfront_fee_amount
+        )
+        for fee in fees:
+            if fee.type != FeeType.ORIGINATION and fee.upfront_amount > 0:
+                self._transfer_funds(terms.lender, fee.wallet, fee.upfront_amount)
+        return loan.id
+
+    def settle_loan(self, loan: Loan, *, sender: str):
+        return self._call(self._settle_loan, loan, sender)
+
+    def _settle_loan(self, loan: Loan, sender: str):
+        interest, settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._close_settled_loan(loan, sender)
+
+        self._pay_funds(
+            loan.borrower, loan.lender, _uint(loan.amount + interest - settlement_fees_total) + borrower_broker_fee_amount
+        )
+        for fee in settlement_fees:
+            self._pay_funds(loan.borrower, fee.wallet, fee.amount)
+        self._release_collateral(loan, loan.borrower)
+        self._log(
+            "LoanPaid",
+            id=loan.id,
+            borrower=loan.borrower,
+            lender=loan.lender,
+            payment_token=loan.payment_token,
+            paid_principal=loan.amount,
+            paid_interest=interest,
+            paid_settlement_fees=settlement_fees,
+        )
+
+    def claim_defaulted_loan_collateral(self, loan: Loan, *, sender: str):
+        return self._call(self._claim_defaulted_loan_collateral, loan, sender)
+
+    def _claim_defaulted_loan_collateral(self, loan: Loan, sender: str):
+        self._validate_loan(loan)
+        if self.now <= loan.maturity:
+            raise Revert("loan not defaulted")
+        self._check_user(sender, loan.lender, "not lender")
+
+        del self.loans[loan.id]
+        self._release_collateral(loan, loan.lender)
+        self._log(
+            "LoanCollateralClaimed",
+            id=loan.id,
+            borrower=loan.borrower,
+            lender=loan.lender,
+            collateral_contract=loan.collateral_contract,
+            collateral_token_id=loan.collateral_token_id,
+        )
+
+    def replace_loan(
+        self,
+        loan: Loan,
+        offer: SignedOffer,
+        collateral_proof: list,  # noqa: ARG002
+        borrower_broker_upfront_fee_amount: int,
+        borrower_broker_settlement_fee_bps: int,
+        borrower_broker: str,
+        *,
+        sender: str,
+    ) -> bytes:
+        return self._call(
+            self._replace_loan,
+            loan,
+            offer,
+            borrower_broker_upfront_fee_amount,
+            borrower_broker_settlement_fee_bps,
+            borrower_broker,
+            sender,
+        )
+
+    def _replace_loan(self, loan, offer, bb_upfront_fee_amount, bb_settlement_fee_bps, bb, sender):
+        self._validate_loan(loan)
+        self._check_user(sender, loan.borrower, "not borrower")
+        interest, settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._close_replaced_loan(loan, offer)
+
+        terms = offer.offer
+        new_loan_fees = self._get_loan_fees(terms, bb_upfront_fee_amount, bb_settlement_fee_bps, bb)
+        total_upfront_fees = self._total_upfront_fees(new_loan_fees)
+
+        borrower_delta = (
+            terms.principal
+            - loan.amount
+            - (total_upfront_fees + interest + borrower_broker_fee_amount)
+            + terms.broker_upfront_fee_amount
+        )
+        current_lender_delta = _uint(loan.amount + interest - settlement_fees_total) + borrower_broker_fee_amount
+        new_lender_delta_abs = terms.principal - terms.origination_fee_amount + terms.broker_upfront_fee_amount
+
+        if borrower_delta < 0:
+            self._receive_funds(loan.borrower, -borrower_delta)
+
+        if loan.lender != terms.lender:
+            self._receive_funds(terms.lender, new_lender_delta_abs)
+            self._send_funds(loan.lender, current_lender_delta)
+        elif current_lender_delta > new_lender_delta_abs:
+            self._send_funds(loan.lender, current_lender_delta - new_lender_delta_abs)
+        elif current_lender_delta < new_lender_delta_abs:
+            self._receive_funds(loan.lender, new_lender_delta_abs - current_lender_delta)
+
+        if borrower_delta > 0:
+            self._send_funds(loan.borrower, borrower_delta)
+
+        self._send_replacement_fees(settlement_fees, new_loan_fees)
+
+        new_loan = self._store_new_loan(
+            offer, loan.borrower, loan.collateral_contract, loan.collateral_token_id, new_loan_fees, loan.delegate
+        )
+        self._log_replacement("LoanReplaced", new_loan, loan, interest, settlement_fees)
+        return new_loan.id
+
+    def replace_loan_lender(
+        self,
+        loan: Loan,
+        offer: SignedOffer,
+        collateral_proof: list,  # noqa: ARG002
+        *,
+        sender: str,
+    ) -> bytes:
+        return self._call(self._replace_loan_lender, loan, offer, sender)
+
+    def _replace_loan_lender(self, loan, offer, sender):
+        self._validate_loan(loan)
+        self._check_user(sender, loan.lender, "not lender")
+        interest, settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._close_replaced_loan(loan, offer)
+
+        terms = offer.offer
+        if self.now + terms.duration < loan.maturity:
+            raise Revert("maturity before loan maturity")
+
+        principal_delta = terms.principal - loan.amount
+        new_loan_fees = self._get_loan_fees(terms, 0, 0, ZERO_ADDRESS)
+        total_upfront_fees = self._total_upfront_fees(new_loan_fees)
+
+        max_interest_delta = self._compute_max_interest_delta(loan, terms, interest)
+        borrower_compensation = max(max_interest_delta, interest + borrower_broker_fee_amount - principal_delta)
+
+        borrower_delta = principal_delta - interest - borrower_broker_fee_amount + borrower_compensation
+        current_lender_delta = (loan.amount + interest + borrower_broker_fee_amount + terms.broker_upfront_fee_amount) - (
+            total_upfront_fees + settlement_fees_total + borrower_compensation
+        )
+        new_lender_delta_abs = terms.principal - terms.origination_fee_amount + terms.broker_upfront_fee_amount
+
+        if borrower_delta < 0:
+            raise Revert("borrower delta < 0")
+
+        if loan.lender != terms.lender:
+            if current_lender_delta < 0:
+                raise Revert("lender delta < 0")
+            self._receive_funds(terms.lender, new_lender_delta_abs)
+            if current_lender_delta > 0:
+                self._send_funds(loan.lender, current_lender_delta)
+        else:
+            lender_delta = current_lender_delta - new_lender_delta_abs
+            if lender_delta > 0:
+                raise Revert("lender delta > 0")
+            if lender_delta < 0:
+                self._receive_funds(loan.lender, -lender_delta)
+
+        if borrower_delta > 0:
+            self._send_funds(loan.borrower, borrower_delta)
+
+        self._send_replacement_fees(settlement_fees, new_loan_fees)
+
+        new_loan = self._store_new_loan(
+            offer, loan.borrower, loan.collateral_contract, loan.collateral_token_id, new_loan_fees, loan.delegate
+        )
+        self._log_replacement(
+            "LoanReplacedByLender", new_loan, loan, interest, settlement_fees, borrower_compensation=borrower_compensation
+        )
+        return new_loan.id
+
+    def revoke_offer(self, offer: SignedOffer, *, sender: str):
+        return self._call(self._revoke_offer_by_lender, offer, sender)
+
+    def _revoke_offer_by_lender(self, offer: SignedOffer, sender: str):
+        self._check_user(sender, offer.offer.lender, "not lender")
+        if offer.offer.expiration <= self.now:
+            raise Revert("offer expired")
+        offer_id = signed_offer_id(offer)
+        if offer_id in self.revoked_offers:
+            raise Revert("offer already revoked")
+        self._revoke_offer(offer_id, offer)
+
+    def set_min_offer_nonce(self, nonce: int, *, sender: str):
+        return self._call(self._set_min_offer_nonce, nonce, sender)
+
+    def _set_min_offer_nonce(self, nonce: int, sender: str):
+        if nonce <= self.min_offer_nonce[sender]:
+            raise Revert("nonce not increased")
+        self._log("MinOfferNonceSet", lender=sender, old_nonce=self.min_offer_nonce[sender], new_nonce=nonce)
+        self.min_offer_nonce[sender] = nonce
+
+    def claim_pending_transfers(self, *, sender: str):
+        return self._call(self._claim_pending_transfers, sender)
+
+    def _claim_pending_transfers(self, sender: str):
+        amount = self.pending_transfers[sender]
+        if amount == 0:
+            raise Revert("no pending transfers")
+        self.pending_transfers[sender] = 0
+        self._transfer_funds(self.address, sender, amount)
+        self._log("PendingTransfersClaimed", _to=sender, amount=amount)
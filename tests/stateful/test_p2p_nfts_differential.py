@@ -0,0 +1,433 @@
+import os
+import random
+import time
+from collections import Counter
+from functools import cache
+from typing import NamedTuple
+
+import boa
+import pytest
+from boa.contracts.vyper.event import Event
+from eth_utils import keccak
+
+from ..conftest_base import (
+    ZERO_ADDRESS,
+    Loan,
+    Offer,
+    OfferType,
+    Signature,
+    SignedOffer,
+    read_storage,
+    revert_reason,
+    sign_offer,
+)
+from .p2p_nfts_model import ModelEvent, P2PLendingNftsModel, Revert, signed_offer_id
+
+SCENARIOS = int(os.environ.get("DIFFERENTIAL_SCENARIOS", "200"))
+STEPS = int(os.environ.get("DIFFERENTIAL_STEPS", "40"))
+REPLAY_RATE = float(os.environ.get("DIFFERENTIAL_REPLAY_RATE", "0.05"))
+SEED = int(os.environ.get("DIFFERENTIAL_SEED", "0"))
+
+TOKENS_PER_COLLECTION = 4
+INITIAL_BALANCE = 10**15
+
+OPERATIONS = {
+    "create_loan": 25,
+    "settle_loan": 12,
+    "claim_defaulted_loan_collateral": 6,
+    "replace_loan": 10,
+    "replace_loan_lender": 10,
+    "revoke_offer": 4,
+    "set_min_offer_nonce": 2,
+    "time_travel": 12,
+    "blacklist": 4,
+    "claim_pending_transfers": 3,
+}
+
+cached_sign_offer = cache(sign_offer)
+
+
+class World(NamedTuple):
+    p2p: object
+    usdc: object
+    cryptopunks: object
+    owner: str
+    borrowers: list
+    lenders: list
+    fee_wallets: list
+    collections: dict
+    holders: dict
+
+    @property
+    def funded_wallets(self):
+        return [*self.borrowers, *(lender.address for lender in self.lenders)]
+
+    @property
+    def users(self):
+        return [*self.funded_wallets, *self.fee_wallets]
+
+
+class Step(NamedTuple):
+    name: str
+    args: tuple
+    sender: str | None = None
+
+
+class Outcome(NamedTuple):
+    reverted: bool
+    reason: str | None = None
+    result: object = None
+    events: tuple = ()
+
+
+def fake_sign_offer(offer: Offer, lender_key: str, verifying_contract: str) -> SignedOffer:  # noqa: ARG001
+    # the model doesn't check signatures, so any signature works as long as the same offer gets the same offer id
+    return SignedOffer(offer, Signature(27, int.from_bytes(keccak(text=repr(offer))), 1))
+
+
+def covers(offer: Offer, collection_key: bytes, token_id: int) -> bool:
+    if offer.collection_key_hash != collection_key:
+        return False
+    if offer.offer_type == OfferType.TOKEN:
+        return offer.token_id == token_id
+    return offer.token_range_min <= token_id <= offer.token_range_max
+
+
+def new_model(world: World) -> P2PLendingNftsModel:
+    p2p = world.p2p
+    return P2PLendingNftsModel(
+        address=p2p.address,
+        payment_token=world.usdc.address,
+        collections={key: collection.address for key, collection in world.collections.items()},
+        protocol_upfront_fee=p2p.protocol_upfront_fee(),
+        protocol_settlement_fee=p2p.protocol_settlement_fee(),
+        protocol_wallet=p2p.protocol_wallet(),
+        max_lender_broker_settlement_fee=p2p.max_lender_broker_settlement_fee(),
+        max_borrower_broker_settlement_fee=p2p.max_borrower_broker_settlement_fee(),
+        balances=dict.fromkeys(world.funded_wallets, INITIAL_BALANCE),
+        collateral_holders={(world.collections[key].address, token_id): h for (key, token_id), h in world.holders.items()},
+        now=boa.env.evm.patch.timestamp,
+    )
+
+
+class ScenarioGenerator:
+    """
+    Generates the steps of a random scenario from the model state: mostly operations expected to succeed, with some
+    wrong callers, closed loans, unusable offers and blocked wallets in between. The steps depend only on the seed and
+    on the model outcomes, so the same seed generates the same scenario whether it runs on the model alone or in
+    lockstep with the contract.
+    """
+
+    def __init__(self, seed: int, world: World, model: P2PLendingNftsModel, sign):
+        self.rng = random.Random(seed)
+        self.world = world
+        self.model = model
+        self.sign = sign
+        self.collection_keys = {collection.address: key for key, collection in world.collections.items()}
+        self.offers: list[SignedOffer] = []
+        self.loans: dict[bytes, Loan] = {}
+        self.closed_loans: list[Loan] = []
+
+    def steps(self, count: int):
+        for _ in range(self.rng.randint(1, 4)):
+            self.sign_offer()
+        for _ in range(count):
+            if self._chance(0.25):
+                self.sign_offer()
+            yield self.next_step()
+
+    def next_step(self) -> Step:
+        available = {
+            "create_loan": True,
+            "settle_loan": self.loans,
+            "claim_defaulted_loan_collateral": self.loans,
+            "replace_loan": self.loans,
+            "replace_loan_lender": self.loans,
+        }
+        operations = [op for op in OPERATIONS if available.get(op, True)]
+        operation = self.rng.choices(operations, [OPERATIONS[op] for op in operations])[0]
+        return getattr(self, f"_{operation}")()
+
+    def _chance(self, probability: float) -> bool:
+        return self.rng.random() < probability
+
+    def sign_offer(self):
+        rng = self.rng
+        world = self.world
+        lender = rng.choice(world.lenders)
+        principal = rng.randint(10**6, 10**9)
+        offer_type = rng.choice([OfferType.TOKEN, OfferType.COLLECTION])
+        token_range = sorted(rng.randint(1, TOKENS_PER_COLLECTION) for _ in range(2))
+        offer = Offer(
+            principal=principal,
+            interest=principal * rng.randint(0, 20) // 100,
+            payment_token=world.usdc.address if not self._chance(0.02) else world.cryptopunks.address,
+            duration=rng.randint(1, 10**4) if not self._chance(0.02) else 0,
+            origination_fee_amount=principal * rng.randint(0, 10) // 100 if not self._chance(0.02) else principal + 1,
+            broker_upfront_fee_amount=principal * rng.randint(0, 5) // 100,
+            broker_settlement_fee_bps=rng.randint(0, 2000) if not self._chance(0.02) else rng.randint(9000, 12000),
+            broker_address=rng.choice(world.fee_wallets[1:]) if not self._chance(0.03) else ZERO_ADDRESS,
+            offer_type=offer_type,
+            token_id=token_range[0],
+            token_range_min=token_range[0],
+            token_range_max=token_range[1],
+            collection_key_hash=rng.choice(list(world.collections)) if not self._chance(0.02) else keccak(text="unknown"),
+            expiration=self.model.now + rng.randint(10**3, 10**5),
+            lender=lender.address,
+            pro_rata=self._chance(0.5),
+            size=1 if offer_type == OfferType.TOKEN else rng.randint(1, 3),
+            tracing_id=rng.randint(0, 3).to_bytes(32, "big"),
+            nonce=self.model.min_offer_nonce[lender.address] + rng.randint(0, 1),
+        )
+        self.offers.append(self.sign(offer, lender.key, world.p2p.address))
+
+    def _sender(self, expected: str) -> str:
+        return expected if not self._chance(0.1) else self.rng.choice(self.world.users)
+
+    def _borrower_broker(self, principal: int) -> tuple[int, int, str]:
+        if self._chance(0.5):
+            return 0, 0, ZERO_ADDRESS
+        wallet = self.rng.choice(self.world.fee_wallets) if not self._chance(0.05) else ZERO_ADDRESS
+        return principal * self.rng.randint(0, 5) // 100, self.rng.randint(0, 2000), wallet
+
+    def _loan(self) -> Loan:
+        if self.closed_loans and self._chance(0.1):
+            return self.rng.choice(self.closed_loans)
+        loan = self.rng.choice(list(self.loans.values()))
+        return loan if not self._chance(0.03) else loan._replace(amount=loan.amount + 1)
+
+    def _replacement_offer(self, loan: Loan) -> SignedOffer:
+        key = self.collection_keys[loan.collateral_contract]
+        offers = [o for o in self.offers if covers(o.offer, key, loan.collateral_token_id)]
+        return self.rng.choice(offers) if offers and not self._chance(0.1) else self.rng.choice(self.offers)
+
+    def _create_loan(self) -> Step:
+        offer = self.rng.choice(self.offers)
+        key = offer.offer.collection_key_hash
+        tokens = [token_id for token_id in range(1, TOKENS_PER_COLLECTION + 1) if covers(offer.offer, key, token_id)]
+        token_id = self.rng.choice(tokens) if tokens and not self._chance(0.1) else self.rng.randint(1, TOKENS_PER_COLLECTION)
+        collection = self.world.collections.get(key)
+        holder = self.model.collateral_holders.get((collection.address, token_id)) if collection else None
+        borrower = (
+            holder if holder in self.world.borrowers and not self._chance(0.1) else self.rng.choice(self.world.borrowers)
+        )
+        delegate = borrower if self._chance(0.5) else ZERO_ADDRESS
+        return Step("create_loan", (offer, token_id, [], delegate, *self._borrower_broker(offer.offer.principal)), borrower)
+
+    def _settle_loan(self) -> Step:
+        loan = self._loan()
+        return Step("settle_loan", (loan,), self._sender(loan.borrower))
+
+    def _claim_defaulted_loan_collateral(self) -> Step:
+        loan = self._loan()
+        return Step("claim_defaulted_loan_collateral", (loan,), self._sender(loan.lender))
+
+    def _replace_loan(self) -> Step:
+        loan = self._loan()
+        offer = self._replacement_offer(loan)
+        args = (loan, offer, [], *self._borrower_broker(offer.offer.principal))
+        return Step("replace_loan", args, self._sender(loan.borrower))
+
+    def _replace_loan_lender(self) -> Step:
+        loan = self._loan()
+        return Step("replace_loan_lender", (loan, self._replacement_offer(loan), []), self._sender(loan.lender))
+
+    def _revoke_offer(self) -> Step:
+        offer = self.rng.choice(self.offers)
+        return Step("revoke_offer", (offer,), self._sender(offer.offer.lender))
+
+    def _set_min_offer_nonce(self) -> Step:
+        lender = self.rng.choice(self.world.lenders).address
+        return Step("set_min_offer_nonce", (self.model.min_offer_nonce[lender] + self.rng.randint(0, 1),), lender)
+
+    def _time_travel(self) -> Step:
+        seconds = self.rng.randint(1, 500) if self._chance(0.7) else self.rng.randint(500, 10**4)
+        return Step("time_travel", (seconds,))
+
+    def _blacklist(self) -> Step:
+        # mostly the brokers, which only receive funds, but also the protocol wallet, lenders and borrowers
+        world = self.world
+        wallet = self.rng.choice([*world.fee_wallets[1:], *world.fee_wallets[1:], *world.users])
+        return Step("blacklist", (wallet, wallet not in self.model.blacklisted))
+
+    def _claim_pending_transfers(self) -> Step:
+        pending = [wallet for wallet, amount in self.model.pending_transfers.items() if amount > 0]
+        wallet = self.rng.choice(pending) if pending and not self._chance(0.2) else self.rng.choice(self.world.users)
+        return Step("claim_pending_transfers", (), wallet)
+
+    def observe(self, outcome: Outcome):
+        # keeps the loans as an indexer would, from the events of the successful calls
+        for name, args in outcome.events:
+            if name in {"LoanPaid", "LoanCollateralClaimed"}:
+                self.closed_loans.append(self.loans.pop(args["id"]))
+            elif name in {"LoanCreated", "LoanReplaced", "LoanReplacedByLender"}:
+                if name == "LoanCreated":
+                    delegate = args["delegate"]
+                else:
+                    original_loan = self.loans.pop(args["original_loan_id"])
+                    self.closed_loans.append(original_loan)
+                    delegate = original_loan.delegate
+                loan = Loan(**{field: args[field] for field in Loan._fields if field in args} | {"delegate": delegate})
+                self.loans[loan.id] = loan
+
+
+def run_on_model(model: P2PLendingNftsModel, step: Step) -> Outcome:
+    if step.name == "time_travel":
+        model.now += step.args[0]
+        return Outcome(reverted=False)
+    if step.name == "blacklist":
+        model.blacklist(*step.args)
+        return Outcome(reverted=False)
+    try:
+        result = getattr(model, step.name)(*step.args, sender=step.sender)
+    except Revert as e:
+        return Outcome(reverted=True, reason=e.reason)
+    return Outcome(reverted=False, result=result, events=tuple(model.events))
+
+
+def _normalize(value):
+    if isinstance(value, list | tuple):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, str):
+        return value.lower()
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return int(value)
+    return value
+
+
+def _decode_event(event: Event) -> ModelEvent:
+    event_type = event.event_type
+    topics = iter(event.topics)
+    args = iter(event.args)
+    values = [next(topics) if indexed else next(args) for indexed in event_type.indexed]
+    return ModelEvent(event_type.name, dict(zip(event_type.arguments.keys(), values, strict=True)))
+
+
+def run_on_contract(world: World, step: Step) -> Outcome:
+    p2p = world.p2p
+    if step.name == "time_travel":
+        boa.env.time_travel(seconds=step.args[0])
+        return Outcome(reverted=False)
+    if step.name == "blacklist":
+        world.usdc.blacklist(*step.args, sender=world.owner)
+        return Outcome(reverted=False)
+    if step.name == "create_loan":
+        # the borrower offers the punk to the contract before the loan, as the erc721 collections are already approved
+        offer, token_id = step.args[:2]
+        punks = world.cryptopunks
+        is_punk = world.collections.get(offer.offer.collection_key_hash) == punks
+        if is_punk and read_storage(punks, "punkIndexToAddress", token_id) == int(step.sender, 16):
+            punks.offerPunkForSaleToAddress(token_id, 0, p2p.address, sender=step.sender)
+    try:
+        result = getattr(p2p, step.name)(*step.args, sender=step.sender)
+    except boa.BoaError as e:
+        reason = revert_reason(e)
+        # reverts without a reason string, from the payment token or the arithmetic checks
+        return Outcome(reverted=True, reason=None if reason is None or reason.startswith("Revert(") else reason)
+    events = tuple(_decode_event(e) for e in p2p.get_logs() if isinstance(e, Event) and e.address == p2p.address)
+    return Outcome(reverted=False, result=result, events=events)
+
+
+def assert_same_outcome(model_outcome: Outcome, contract_outcome: Outcome):
+    assert contract_outcome.reverted == model_outcome.reverted, f"{contract_outcome=}, {model_outcome=}"
+    assert contract_outcome.reason == model_outcome.reason
+    assert contract_outcome.result == model_outcome.result
+    assert [e.name for e in contract_outcome.events] == [e.name for e in model_outcome.events]
+    for contract_event, model_event in zip(contract_outcome.events, model_outcome.events, strict=True):
+        assert _normalize(list(contract_event.args.items())) == _normalize(list(model_event.args.items())), contract_event.name
+
+
+def assert_same_state(world: World, model: P2PLendingNftsModel, generator: ScenarioGenerator):
+    p2p, usdc = world.p2p, world.usdc
+    for wallet in [*world.users, p2p.address]:
+        assert read_storage(usdc, "balanceOf", wallet) == model.balances[wallet], wallet
+        assert read_storage(p2p, "pending_transfers", wallet) == model.pending_transfers[wallet], wallet
+    for lender in world.lenders:
+        assert read_storage(p2p, "min_offer_nonce", lender.address) == model.min_offer_nonce[lender.address]
+    for offer in generator.offers:
+        offer_id = signed_offer_id(offer)
+        assert read_storage(p2p, "offer_count", offer.offer.tracing_id) == model.offer_count[offer.offer.tracing_id]
+        assert read_storage(p2p, "revoked_offers", offer_id) == (offer_id in model.revoked_offers)
+    for loan in [*generator.loans.values(), *generator.closed_loans]:
+        assert read_storage(p2p, "loans", loan.id) == int.from_bytes(model.loans.get(loan.id, bytes(32)))
+    collections = {collection.address: collection for collection in world.collections.values()}
+    for (contract, token_id), holder in model.collateral_holders.items():
+        owners = "punkIndexToAddress" if contract == world.cryptopunks.address else "idToOwner"
+        assert read_storage(collections[contract], owners, token_id) == int(holder, 16)
+
+
+def check_model_invariants(world: World, model: P2PLendingNftsModel, generator: ScenarioGenerator):
+    assert sum(model.balances.values()) == INITIAL_BALANCE * len(world.funded_wallets)
+    assert model.balances[model.address] == sum(model.pending_transfers.values())
+    assert set(generator.loans) == set(model.loans)
+    for loan in generator.loans.values():
+        assert model.collateral_holders[loan.collateral_contract, loan.collateral_token_id] == model.address
+
+
+class Stats(Counter):
+    def timed(self, name: str, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self[f"{name}_time"] += time.perf_counter() - start
+        self[f"{name}_steps"] += 1
+        return result
+
+
+def run_scenario(world: World, seed: int, stats: Stats, *, replay: bool):
+    model = new_model(world)
+    generator = ScenarioGenerator(seed, world, model, cached_sign_offer if replay else fake_sign_offer)
+    for index, step in enumerate(generator.steps(STEPS)):
+        outcome = stats.timed("model", run_on_model, model, step)
+        stats[f"{step.name}:{'reverted:' + str(outcome.reason) if outcome.reverted else 'ok'}"] += 1
+        if replay:
+            contract_outcome = stats.timed("contract", run_on_contract, world, step)
+            try:
+                assert_same_outcome(outcome, contract_outcome)
+                assert_same_state(world, model, generator)
+            except AssertionError as e:
+                raise AssertionError(f"scenario {seed} step {index} {step.name} differs from the model: {e}") from e
+        generator.observe(outcome)
+        check_model_invariants(world, model, generator)
+
+
+@pytest.fixture
+def world(p2p_nfts_usdc, usdc, collections, cryptopunks, borrowers, lenders, fee_wallets, owner):
+    holders = {}
+    for key, collection in collections.items():
+        for token_id in range(1, TOKENS_PER_COLLECTION + 1):
+            borrower = borrowers[token_id % len(borrowers)]
+            collection.mint(borrower, token_id)
+            holders[key, token_id] = borrower
+    for borrower in borrowers:
+        for collection in collections.values():
+            if collection != cryptopunks:
+                collection.setApprovalForAll(p2p_nfts_usdc.address, True, sender=borrower)
+    world = World(p2p_nfts_usdc, usdc, cryptopunks, owner, borrowers, lenders, fee_wallets, collections, holders)
+    for wallet in world.funded_wallets:
+        usdc.mint(wallet, INITIAL_BALANCE)
+        usdc.approve(p2p_nfts_usdc.address, 2**256 - 1, sender=wallet)
+    return world
+
+
+def test_model_matches_contract(world, record_property):
+    # every scenario runs on the model, and a sample of them (at least the first) also on the contract, step by step
+    sampler = random.Random(SEED)
+    stats = Stats()
+    for seed in range(SEED, SEED + SCENARIOS):
+        replay = seed == SEED or sampler.random() < REPLAY_RATE
+        stats["replayed" if replay else "model_only"] += 1
+        with boa.env.anchor():
+            run_scenario(world, seed, stats, replay=replay)
+
+    print({name: count for name, count in sorted(stats.items()) if ":" in name})
+    model_steps_per_second = stats["model_steps"] / stats["model_time"]
+    contract_steps_per_second = stats["contract_steps"] / stats["contract_time"]
+    record_property("scenarios", SCENARIOS)
+    record_property("replayed", stats["replayed"])
+    record_property("model_steps", stats["model_steps"])
+    record_property("contract_steps", stats["contract_steps"])
+    record_property("model_steps_per_second", model_steps_per_second)
+    record_property("contract_steps_per_second", contract_steps_per_second)
+    record_property("speedup", model_steps_per_second / contract_steps_per_second)
@@ -0,0 +1,83 @@
+# @version 0.3.10
+
+# ERC20 with EIP-2612 permit, used to test the router permits
+
+from vyper.interfaces import ERC20
+
+implements: ERC20
+
+event Transfer:
+    sender: indexed(address)
+    receiver: indexed(address)
+    value: uint256
+
+event Approval:
+    owner: indexed(address)
+    spender: indexed(address)
+    value: uint256
+
+DOMAIN_TYPE_HASH: constant(bytes32) = keccak256("EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)")
+PERMIT_TYPE_HASH: constant(bytes32) = keccak256("Permit(address owner,address spender,uint256 value,uint256 nonce,uint256 deadline)")
+
+name: public(String[32])
+balanceOf: public(HashMap[address, uint256])
+allowance: public(HashMap[address, HashMap[address, uint256]])
+totalSupply: public(uint256)
+nonces: public(HashMap[address, uint256])
+DOMAIN_SEPARATOR: public(bytes32)
+
+
+@external
+def __init__(_name: String[32]):
+    self.name = _name
+    self.DOMAIN_SEPARATOR = keccak256(_abi_encode(DOMAIN_TYPE_HASH, keccak256(_name), keccak256("1"), chain.id, self))
+
+
+@external
+def transfer(_to: address, _value: uint256) -> bool:
+    self.balanceOf[msg.sender] -= _value
+    self.balanceOf[_to] += _value
+    log Transfer(msg.sender, _to, _value)
+    return True
+
+
+@external
+def transferFrom(_from: address, _to: address, _value: uint256) -> bool:
+    self.balanceOf[_from] -= _value
+    self.balanceOf[_to] += _value
+    self.allowance[_from][msg.sender] -= _value
+    log Transfer(_from, _to, _value)
+    return True
+
+
+@external
+def approve(_spender: address, _value: uint256) -> bool:
+    self.allowance[msg.sender][_spender] = _value
+    log Approval(msg.sender, _spender, _value)
+    return True
+
+
+@external
+def permit(_owner: address, _spender: address, _value: uint256, _deadline: uint256, _v: uint8, _r: bytes32, _s: bytes32):
+    assert _deadline >= block.timestamp, "permit expired"
+
+    nonce: uint256 = self.nonces[_owner]
+    digest: bytes32 = keccak256(
+        concat(
+            b"\x19\x01",
+            self.DOMAIN_SEPARATOR,
+            keccak256(_abi_encode(PERMIT_TYPE_HASH, _owner, _spender, _value, nonce, _deadline))
+        )
+    )
+    assert ecrecover(digest, _v, _r, _s) == _owner, "invalid permit"
+
+    self.nonces[_owner] = nonce + 1
+    self.allowance[_owner][_spender] = _value
+    log Approval(_owner, _spender, _value)
+
+
+@external
+def mint(_to: address, _value: uint256):
+    self.totalSupply += _value
+    self.balanceOf[_to] += _value
+    log Transfer(empty(address), _to, _value)
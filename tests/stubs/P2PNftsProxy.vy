@@ -27,6 +27,7 @@ interface P2PLendingNfts:
     ) -> bytes32: nonpayable
     def replace_loan_lender(loan: Loan, offer: SignedOffer, collateral_proof: DynArray[bytes32, 32]) -> bytes32: nonpayable
     def revoke_offer(offer: SignedOffer): nonpayable
+    def set_min_offer_nonce(nonce: uint256): nonpayable
     def onERC721Received(_operator: address, _from: address, _tokenId: uint256, _data: Bytes[1024]) -> bytes4: view
 
 
@@ -73,6 +74,7 @@ struct Offer:
     pro_rata: bool
     size: uint256
     tracing_id: bytes32
+    nonce: uint256
 
 
 struct Signature:
@@ -166,3 +168,7 @@ def replace_loan_lender(loan: Loan, offer: SignedOffer, proof: DynArray[bytes32,
 @external
 def revoke_offer(offer: SignedOffer):
     P2PLendingNfts(self.p2p_lending_nfts).revoke_offer(offer)
+
+@external
+def set_min_offer_nonce(nonce: uint256):
+    P2PLendingNfts(self.p2p_lending_nfts).set_min_offer_nonce(nonce)
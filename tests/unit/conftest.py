@@ -1,3 +1,9 @@
+import inspect
+import os
+import pickle
+from hashlib import sha3_256, sha256
+from importlib.metadata import version
+from pathlib import Path
 from textwrap import dedent
 
 import boa
@@ -5,6 +11,11 @@ import pytest
 from boa.vm.py_evm import register_raw_precompile
 from eth_account import Account
 
+from ..conftest_base import CollectionContract, load_partial
+
+GOLDEN_STATE_DIR = Path(".cache/golden_state")
+WALLETS = ["owner", "borrower", "lender", "lender2"]
+
 
 def pytest_addoption(parser):
     parser.addoption("--runslow", action="store_true", default=False, help="run slow tests")
@@ -30,23 +41,26 @@ def boa_env():
     return boa
 
 
+@pytest.fixture(autouse=True)
+def isolation(boa_env):
+    # the session fixtures are set up before any function fixture, so every test starts from the same deployed
+    # contracts and all its state changes, including time travel, are reverted at the end
+    with boa.env.anchor():
+        yield
+
+
 @pytest.fixture(scope="session")
-def accounts(boa_env):
-    _accounts = [boa.env.generate_address() for _ in range(10)]
-    for account in _accounts:
-        boa.env.set_balance(account, 10**21)
-    return _accounts
+def accounts(golden_state):
+    return list(golden_state["accounts"])
 
 
 @pytest.fixture(scope="session")
-def owner_account():
-    return Account.create()
+def owner_account(golden_state):
+    return Account.from_key(golden_state["keys"]["owner"])
 
 
 @pytest.fixture(scope="session")
-def owner(owner_account, boa_env):
-    boa.env.eoa = owner_account.address
-    boa.env.set_balance(owner_account.address, 10**21)
+def owner(owner_account):
     return owner_account.address
 
 
@@ -56,13 +70,12 @@ def owner_key(owner_account):
 
 
 @pytest.fixture(scope="session")
-def borrower_account():
-    return Account.create()
+def borrower_account(golden_state):
+    return Account.from_key(golden_state["keys"]["borrower"])
 
 
 @pytest.fixture(scope="session")
-def borrower(borrower_account, boa_env):
-    boa.env.set_balance(borrower_account.address, 10**21)
+def borrower(borrower_account):
     return borrower_account.address
 
 
@@ -72,13 +85,12 @@ def borrower_key(borrower_account):
 
 
 @pytest.fixture(scope="session")
-def lender_account():
-    return Account.create()
+def lender_account(golden_state):
+    return Account.from_key(golden_state["keys"]["lender"])
 
 
 @pytest.fixture(scope="session")
-def lender(lender_account, boa_env):
-    boa.env.set_balance(lender_account.address, 10**21)
+def lender(lender_account):
     return lender_account.address
 
 
@@ -88,13 +100,12 @@ def lender_key(lender_account):
 
 
 @pytest.fixture(scope="session")
-def lender2_account():
-    return Account.create()
+def lender2_account(golden_state):
+    return Account.from_key(golden_state["keys"]["lender2"])
 
 
 @pytest.fixture(scope="session")
-def lender2(lender2_account, boa_env):
-    boa.env.set_balance(lender2_account.address, 10**21)
+def lender2(lender2_account):
     return lender2_account.address
 
 
@@ -110,47 +121,62 @@ def protocol_wallet(accounts):
 
 @pytest.fixture(scope="session")
 def erc721_contract_def(boa_env):
-    return boa.load_partial("contracts/auxiliary/ERC721.vy")
+    return load_partial("contracts/auxiliary/ERC721.vy")
 
 
 @pytest.fixture(scope="session")
 def weth9_contract_def(boa_env):
-    return boa.load_partial("contracts/auxiliary/WETH9Mock.vy")
+    return load_partial("contracts/auxiliary/WETH9Mock.vy")
 
 
 @pytest.fixture(scope="session")
-def weth(weth9_contract_def, owner):
-    return weth9_contract_def.deploy("Wrapped Ether", "WETH", 18, 10**20)
+def weth(golden_state):
+    return golden_state["contracts"]["weth"]
 
 
 @pytest.fixture(scope="session")
 def cryptopunks_contract_def(boa_env):
-    return boa.load_partial("contracts/auxiliary/CryptoPunksMarketMock.vy")
+    return load_partial("contracts/auxiliary/CryptoPunksMarketMock.vy")
 
 
 @pytest.fixture(scope="session")
-def cryptopunks(cryptopunks_contract_def, owner):
-    return cryptopunks_contract_def.deploy()
+def cryptopunks(golden_state):
+    return golden_state["contracts"]["cryptopunks"]
 
 
 @pytest.fixture(scope="session")
 def delegation_registry_contract_def(boa_env):
-    return boa.load_partial("contracts/auxiliary/DelegationRegistryMock.vy")
+    return load_partial("contracts/auxiliary/DelegationRegistryMock.vy")
 
 
 @pytest.fixture(scope="session")
 def p2p_lending_nfts_contract_def(boa_env):
-    return boa.load_partial("contracts/P2PLendingNfts.vy")
+    return load_partial("contracts/P2PLendingNfts.vy")
 
 
 @pytest.fixture(scope="session")
 def p2p_lending_control_contract_def(boa_env):
-    return boa.load_partial("contracts/P2PLendingControl.vy")
+    return load_partial("contracts/P2PLendingControl.vy")
 
 
 @pytest.fixture(scope="session")
 def p2p_lending_nfts_proxy_contract_def(boa_env):
-    return boa.load_partial("tests/stubs/P2PNftsProxy.vy")
+    return load_partial("tests/stubs/P2PNftsProxy.vy")
+
+
+@pytest.fixture(scope="session")
+def p2p_lending_router_contract_def(boa_env):
+    return load_partial("contracts/P2PLendingRouter.vy")
+
+
+@pytest.fixture(scope="session")
+def p2p_lending_lens_contract_def(boa_env):
+    return load_partial("contracts/P2PLendingLens.vy")
+
+
+@pytest.fixture(scope="session")
+def erc20_permit_contract_def(boa_env):
+    return load_partial("tests/stubs/ERC20Permit.vy")
 
 
 @pytest.fixture(scope="module")
@@ -173,3 +199,154 @@ def debug_bytes32(data: bytes):
 def debug_precompile(boa_env):
     register_raw_precompile("0x0000000000000000000000000000000000011111", debug_bytes32)
     yield
+
+
+@pytest.fixture(scope="session")
+def bayc(golden_state):
+    return golden_state["contracts"]["bayc"]
+
+
+@pytest.fixture(scope="session")
+def usdc(golden_state):
+    return golden_state["contracts"]["usdc"]
+
+
+@pytest.fixture(scope="session")
+def delegation_registry(golden_state):
+    return golden_state["contracts"]["delegation_registry"]
+
+
+@pytest.fixture(scope="session")
+def bayc_key_hash():
+    return sha3_256(b"bayc").digest()
+
+
+@pytest.fixture(scope="session")
+def punks_key_hash():
+    return sha3_256(b"cryptopunks").digest()
+
+
+@pytest.fixture(scope="session")
+def p2p_control(golden_state):
+    return golden_state["contracts"]["p2p_control"]
+
+
+@pytest.fixture(scope="session")
+def p2p_nfts_usdc(golden_state):
+    return golden_state["contracts"]["p2p_nfts_usdc"]
+
+
+def _deploy_world(contract_defs: dict, bayc_key_hash: bytes, punks_key_hash: bytes) -> dict:
+    wallets = {name: Account.create() for name in WALLETS}
+    accounts = [boa.env.generate_address() for _ in range(10)]
+    for address in [*accounts, *(wallet.address for wallet in wallets.values())]:
+        boa.env.set_balance(address, 10**21)
+    owner = wallets["owner"].address
+    boa.env.eoa = owner
+
+    weth = contract_defs["weth"].deploy("Wrapped Ether", "WETH", 18, 10**20)
+    cryptopunks = contract_defs["cryptopunks"].deploy()
+    bayc = contract_defs["bayc"].deploy()
+    usdc = contract_defs["usdc"].deploy("USDC", "USDC", 9, 10**20)
+    delegation_registry = contract_defs["delegation_registry"].deploy()
+    p2p_control = contract_defs["p2p_control"].deploy()
+    p2p_control.change_collections_contracts(
+        [CollectionContract(punks_key_hash, cryptopunks.address), CollectionContract(bayc_key_hash, bayc.address)]
+    )
+    p2p_nfts_usdc = contract_defs["p2p_nfts_usdc"].deploy(
+        usdc, p2p_control, delegation_registry, cryptopunks, 0, 0, owner, 10000, 10000, 10000, 10000, False
+    )
+
+    contracts = [weth, cryptopunks, bayc, usdc, delegation_registry, p2p_control, p2p_nfts_usdc]
+    return {
+        "keys": {name: wallet.key for name, wallet in wallets.items()},
+        "accounts": accounts,
+        "contracts": {name: contract.address for name, contract in zip(contract_defs, contracts)},
+    }
+
+
+def _golden_state_path(*params) -> Path:
+    # any change to the contracts, the deployment or its parameters invalidates the cached state
+    digest = sha256(repr((params, version("titanoboa"), version("vyper"), version("py-evm"))).encode())
+    digest.update(inspect.getsource(_deploy_world).encode())
+    for path in sorted([*Path("contracts").rglob("*.vy"), *Path("tests/stubs").rglob("*.vy")]):
+        digest.update(str(path).encode())
+        digest.update(path.read_bytes())
+    return GOLDEN_STATE_DIR / f"{digest.hexdigest()}.pickle"
+
+
+def _save_golden_state(path: Path, contract_defs: dict, bayc_key_hash: bytes, punks_key_hash: bytes):
+    # the deployment runs in a new environment, as the state can only be persisted without open anchors and the boa
+    # plugin opens one for each fixture
+    with boa.swap_env(boa.Env()):
+        world = _deploy_world(contract_defs, bayc_key_hash, punks_key_hash)
+        account_db = boa.env.evm.vm.state._account_db
+        account_db.persist()
+        state = {
+            "world": world,
+            "db": dict(account_db._raw_store_db.wrapped_db.wrapped_db.kv_store),
+            "state_root": account_db.state_root,
+            "random": boa.env._random.getstate(),
+        }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for stale in path.parent.glob("*.pickle"):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+    # written to a temporary file first, as several xdist workers may save the same state concurrently
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_bytes(pickle.dumps(state))
+    tmp_path.replace(path)
+
+
+def _load_golden_state(path: Path) -> dict:
+    state = pickle.loads(path.read_bytes())  # noqa: S301
+    account_db = boa.env.evm.vm.state._account_db
+    for key, value in state["db"].items():
+        account_db._raw_store_db[key] = value
+    account_db.state_root = state["state_root"]
+    account_db._account_cache.clear()
+    # the accounts generated later must not collide with the ones in the saved state
+    boa.env._random.setstate(state["random"])
+    return state["world"]
+
+
+@pytest.fixture(scope="session")
+def golden_state(
+    erc721_contract_def,
+    weth9_contract_def,
+    cryptopunks_contract_def,
+    delegation_registry_contract_def,
+    p2p_lending_control_contract_def,
+    p2p_lending_nfts_contract_def,
+    bayc_key_hash,
+    punks_key_hash,
+):
+    # the EVM state after the deployment is saved to disk, so later sessions and xdist workers restore it in a few
+    # milliseconds instead of deploying the contracts again
+    contract_defs = {
+        "weth": weth9_contract_def,
+        "cryptopunks": cryptopunks_contract_def,
+        "bayc": erc721_contract_def,
+        "usdc": weth9_contract_def,
+        "delegation_registry": delegation_registry_contract_def,
+        "p2p_control": p2p_lending_control_contract_def,
+        "p2p_nfts_usdc": p2p_lending_nfts_contract_def,
+    }
+    path = _golden_state_path(list(contract_defs), bayc_key_hash, punks_key_hash)
+    try:
+        if not path.exists():
+            _save_golden_state(path, contract_defs, bayc_key_hash, punks_key_hash)
+        world = _load_golden_state(path)
+    except Exception:
+        # the saved state relies on py-evm internals, if it can't be saved or restored the contracts are deployed instead
+        path.unlink(missing_ok=True)
+        world = _deploy_world(contract_defs, bayc_key_hash, punks_key_hash)
+
+    boa.env.eoa = Account.from_key(world["keys"]["owner"]).address
+    contracts = {name: contract_defs[name].at(address) for name, address in world["contracts"].items()}
+    return world | {"contracts": contracts}
+
+
+@pytest.fixture
+def now():
+    return boa.eval("block.timestamp")
@@ -0,0 +1,141 @@
+from itertools import count
+
+import boa
+import pytest
+
+from ...conftest_base import ZERO_ADDRESS, Fee, Loan, Offer, compute_signed_offer_id, sign_offer
+
+
+class LogRecorder:
+    """Keeps the logs emitted by the calls to a contract in the format returned by eth_getLogs"""
+
+    def __init__(self, contract):
+        self.contract = contract
+        self.logs = []
+        self.timestamps = {}
+
+    def record(self):
+        block_number = boa.env.evm.patch.block_number
+        self.timestamps[block_number] = boa.env.evm.patch.timestamp
+        for _, address, topics, data in sorted(self.contract._computation.get_raw_log_entries()):
+            self.logs.append(
+                {
+                    "address": "0x" + address.hex(),
+                    "topics": [t.to_bytes(32, "big") for t in topics],
+                    "data": data,
+                    "blockNumber": block_number,
+                    "blockHash": block_number.to_bytes(32, "big"),
+                    "transactionHash": len(self.logs).to_bytes(32, "big"),
+                    "logIndex": len(self.logs),
+                }
+            )
+
+    def block_timestamp(self, block_number):
+        return self.timestamps[block_number]
+
+
+@pytest.fixture
+def recorder(p2p_nfts_usdc):
+    return LogRecorder(p2p_nfts_usdc)
+
+
+@pytest.fixture(autouse=True)
+def funds(usdc, lender, lender2, borrower):
+    usdc.mint(lender, 10**12)
+    usdc.mint(lender2, 10**12)
+    usdc.mint(borrower, 10**12)
+
+
+@pytest.fixture
+def sign_loan_offer(p2p_nfts_usdc, usdc, bayc_key_hash):
+    tracing_ids = count(1)
+
+    def _sign_loan_offer(token_id, principal, interest, duration, lender, lender_key):
+        offer = Offer(
+            principal=principal,
+            interest=interest,
+            payment_token=usdc.address,
+            duration=duration,
+            collection_key_hash=bayc_key_hash,
+            token_id=token_id,
+            expiration=boa.env.evm.patch.timestamp + 100,
+            lender=lender,
+            tracing_id=next(tracing_ids).to_bytes(32, "big"),
+        )
+        return sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+    return _sign_loan_offer
+
+
+def _loan(loan_id, signed_offer, borrower, collateral_contract, p2p_nfts, delegate):
+    offer = signed_offer.offer
+    now = boa.env.evm.patch.timestamp
+    return Loan(
+        id=loan_id,
+        offer_id=compute_signed_offer_id(signed_offer),
+        offer_tracing_id=offer.tracing_id,
+        amount=offer.principal,
+        interest=offer.interest,
+        payment_token=offer.payment_token,
+        maturity=now + offer.duration,
+        start_time=now,
+        borrower=borrower,
+        lender=offer.lender,
+        collateral_contract=collateral_contract,
+        collateral_token_id=offer.token_id,
+        fees=[
+            Fee.protocol(p2p_nfts, offer.principal),
+            Fee.origination(offer),
+            Fee.lender_broker(offer),
+            Fee.borrower_broker(ZERO_ADDRESS),
+        ],
+        delegate=delegate,
+    )
+
+
+@pytest.fixture
+def create_loan(p2p_nfts_usdc, usdc, bayc, borrower, lender, lender_key, recorder, sign_loan_offer):
+    def _create_loan(token_id, principal=1000, interest=100, duration=86400, delegate=ZERO_ADDRESS):
+        signed_offer = sign_loan_offer(token_id, principal, interest, duration, lender, lender_key)
+        bayc.mint(borrower, token_id)
+        bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+        usdc.approve(p2p_nfts_usdc.address, principal, sender=lender)
+
+        loan_id = p2p_nfts_usdc.create_loan(signed_offer, token_id, [], delegate, 0, 0, ZERO_ADDRESS, sender=borrower)
+        recorder.record()
+        return _loan(loan_id, signed_offer, borrower, bayc.address, p2p_nfts_usdc, delegate)
+
+    return _create_loan
+
+
+@pytest.fixture
+def replace_loan(p2p_nfts_usdc, usdc, lender2, lender2_key, recorder, sign_loan_offer):
+    def _replace_loan(loan, principal=1000, interest=100, duration=86400):
+        signed_offer = sign_loan_offer(loan.collateral_token_id, principal, interest, duration, lender2, lender2_key)
+        usdc.approve(p2p_nfts_usdc.address, principal, sender=lender2)
+        usdc.approve(p2p_nfts_usdc.address, loan.amount + loan.interest, sender=loan.borrower)
+
+        loan_id = p2p_nfts_usdc.replace_loan(loan, signed_offer, [], 0, 0, ZERO_ADDRESS, sender=loan.borrower)
+        recorder.record()
+        return _loan(loan_id, signed_offer, loan.borrower, loan.collateral_contract, p2p_nfts_usdc, loan.delegate)
+
+    return _replace_loan
+
+
+@pytest.fixture
+def settle_loan(p2p_nfts_usdc, usdc, recorder):
+    def _settle_loan(loan):
+        usdc.approve(p2p_nfts_usdc.address, loan.amount + loan.interest, sender=loan.borrower)
+        p2p_nfts_usdc.settle_loan(loan, sender=loan.borrower)
+        recorder.record()
+
+    return _settle_loan
+
+
+@pytest.fixture
+def claim_loan(p2p_nfts_usdc, recorder):
+    def _claim_loan(loan):
+        p2p_nfts_usdc.claim_defaulted_loan_collateral(loan, sender=loan.lender)
+        recorder.record()
+
+    return _claim_loan
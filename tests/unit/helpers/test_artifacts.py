@@ -0,0 +1,37 @@
+import json
+import shutil
+
+import boa
+
+from scripts._helpers import artifacts
+from scripts._helpers.artifacts import ROOT_DIR, build_artifacts, compile_artifact, load_artifact, source_hash
+
+
+def test_artifact_matches_compiler():
+    artifact = load_artifact("contracts/P2PLendingControl.vy")
+    deployer = boa.load_partial(str(ROOT_DIR / "contracts/P2PLendingControl.vy"))
+
+    assert artifact.name == "P2PLendingControl"
+    assert artifact.bytecode == "0x" + deployer.compiler_data.bytecode.hex()
+    assert artifact.bytecode_runtime == "0x" + deployer.compiler_data.bytecode_runtime.hex()
+    assert artifact.compiler_data().bytecode == deployer.compiler_data.bytecode
+    assert json.loads(artifact.path.read_text())["abi"] == artifact.abi
+    assert "owner" in artifact.layout["storage_layout"]
+
+
+def test_build_artifacts_recompiles_changed_sources(tmp_path, monkeypatch):
+    source_path = "tests/stubs/P2PNftsProxy.vy"
+    monkeypatch.setattr(artifacts, "ROOT_DIR", tmp_path)
+    monkeypatch.setattr(artifacts, "ARTIFACTS_DIR", tmp_path / "artifacts")
+    (tmp_path / "tests/stubs").mkdir(parents=True)
+    shutil.copy(ROOT_DIR / source_path, tmp_path / source_path)
+
+    assert build_artifacts([source_path]) == [source_path]
+    assert build_artifacts([source_path]) == []
+
+    with (tmp_path / source_path).open("a") as f:
+        f.write("\n# changed\n")
+    digest = source_hash(source_path)
+    assert build_artifacts([source_path]) == [source_path]
+    assert {p.stem for p in (tmp_path / "artifacts/tests/stubs/P2PNftsProxy").iterdir()} == {digest}
+    assert compile_artifact(source_path).source_hash == digest
@@ -0,0 +1,72 @@
+from datetime import UTC, datetime
+from decimal import Decimal
+
+import boa
+import pyarrow.dataset as ds
+
+from scripts._helpers.events import EventDecoder
+from scripts._helpers.export import LIFECYCLE_EVENTS, ParquetExporter
+
+
+def _export(tmp_path, recorder, from_log=0):
+    decoder = EventDecoder.for_contract("P2PLendingNfts", LIFECYCLE_EVENTS)
+    exporter = ParquetExporter(tmp_path, row_group_size=2)
+    last_block = max(recorder.timestamps)
+    exporter.export(decoder.decode_all(recorder.logs[from_log:]), recorder.block_timestamp, last_block)
+    return exporter
+
+
+def _read(tmp_path):
+    return ds.dataset(tmp_path, format="parquet", partitioning="hive").to_table().to_pylist()
+
+
+def test_export_writes_lifecycle_events(tmp_path, recorder, create_loan, settle_loan, bayc):
+    loan = create_loan(1)
+    boa.env.time_travel(seconds=3600)
+    settle_loan(loan)
+
+    exporter = _export(tmp_path, recorder)
+    rows = _read(tmp_path)
+
+    assert exporter.rows_written == 2
+    assert [r["event"] for r in rows] == ["LoanCreated", "LoanPaid"]
+    created, paid = rows
+    assert created["loan_id"] == paid["loan_id"] == "0x" + loan.id.hex()
+    assert created["amount"] == Decimal(1000)
+    assert created["protocol_fee_upfront_amount"] == Decimal(0)
+    assert created["borrower_broker_fee_wallet"] == loan.fees[3].wallet
+    assert paid["paid_interest"] == Decimal(100)
+    assert paid["collateral_contract"] == created["collateral_contract"] == bayc.address
+    assert paid["collection"] == bayc.address
+    assert exporter.active_loans == {}
+
+
+def test_export_partitions_by_day(tmp_path, recorder, create_loan, claim_loan, now):
+    loan = create_loan(1, duration=100)
+    boa.env.time_travel(seconds=86400)
+    claim_loan(loan)
+
+    _export(tmp_path, recorder)
+
+    dates = sorted(p.name for p in tmp_path.glob("date=*"))
+    assert dates == [
+        f"date={datetime.fromtimestamp(now, tz=UTC).date()}",
+        f"date={datetime.fromtimestamp(now + 86400, tz=UTC).date()}",
+    ]
+
+
+def test_export_appends_on_later_runs(tmp_path, recorder, create_loan, settle_loan):
+    loans = [create_loan(token_id) for token_id in range(1, 4)]
+    first_run_logs = len(recorder.logs)
+    _export(tmp_path, recorder)
+
+    boa.env.time_travel(seconds=60)
+    for loan in loans:
+        settle_loan(loan)
+    exporter = _export(tmp_path, recorder, from_log=first_run_logs)
+
+    rows = _read(tmp_path)
+    assert len(list(tmp_path.rglob("*.parquet"))) == 2
+    assert sorted(r["event"] for r in rows) == ["LoanCreated"] * 3 + ["LoanPaid"] * 3
+    assert all(r["collateral_contract"] is not None for r in rows)
+    assert exporter.active_loans == {}
@@ -0,0 +1,243 @@
+import asyncio
+import shutil
+import socket
+import subprocess
+import time
+
+import boa
+import pytest
+from eth_bloom import BloomFilter
+from hexbytes import HexBytes
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3, WebsocketProviderV2
+
+from scripts._helpers.artifacts import load_artifact
+from scripts._helpers.events import EventDecoder, load_abi
+from scripts._helpers.export import LIFECYCLE_EVENTS
+from scripts._helpers.listener import BlockListener, bloom_contains
+
+
+class FakeEth:
+    """Minimal async `w3.eth` serving the blocks and logs kept by a LogRecorder"""
+
+    def __init__(self, recorder, address, *, bloom=False):
+        self.recorder = recorder
+        self.address = address
+        self.bloom = bloom
+        self.get_logs_calls = 0
+
+    @property
+    async def block_number(self):
+        return max(self.recorder.timestamps)
+
+    async def get_block(self, number):
+        block = {"number": number, "hash": number.to_bytes(32, "big"), "timestamp": self.recorder.timestamps[number]}
+        if self.bloom:
+            bloom = BloomFilter()
+            if any(log["blockNumber"] == number for log in self.recorder.logs):
+                bloom.add(HexBytes(self.address))
+            block["logsBloom"] = int(bloom).to_bytes(256, "big")
+        return block
+
+    async def get_logs(self, log_filter):
+        self.get_logs_calls += 1
+        return [log for log in self.recorder.logs if log["blockHash"] == HexBytes(log_filter["blockHash"])]
+
+
+class FakeWeb3:
+    def __init__(self, eth):
+        self.eth = eth
+
+
+def _listener(recorder, address, decoder, from_block, *, bloom=False):
+    eth = FakeEth(recorder, address, bloom=bloom)
+    return BlockListener(FakeWeb3(eth), address, decoder, from_block=from_block, poll_interval=0.01)
+
+
+def _listen(listener, until_block):
+    async def _run():
+        task = asyncio.create_task(listener.run())
+        while listener.next_block is None or listener.next_block <= until_block:  # noqa: ASYNC110
+            await asyncio.sleep(0.01)
+        listener.stop()
+        await task
+
+    asyncio.run(_run())
+
+
+def _record_empty_block(recorder):
+    boa.env.time_travel(blocks=1)
+    recorder.timestamps[boa.env.evm.patch.block_number] = boa.env.evm.patch.timestamp
+
+
+@pytest.fixture
+def decoder():
+    return EventDecoder.for_contract("P2PLendingNfts", LIFECYCLE_EVENTS)
+
+
+def test_bloom_contains():
+    bloom = BloomFilter()
+    bloom.add(b"\x01" * 20)
+    bloom_bytes = int(bloom).to_bytes(256, "big")
+
+    assert bloom_contains(bloom_bytes, b"\x01" * 20)
+    assert not bloom_contains(bloom_bytes, b"\x02" * 20)
+    assert bloom_contains(b"", b"\x02" * 20)
+
+
+def test_listener_fans_out_events_per_block(p2p_nfts_usdc, recorder, create_loan, settle_loan, decoder):
+    first_block = boa.env.evm.patch.block_number
+    loans = [create_loan(token_id) for token_id in range(1, 4)]
+    _record_empty_block(recorder)
+    _record_empty_block(recorder)
+    settle_loan(loans[0])
+    last_block = boa.env.evm.patch.block_number
+
+    received = {"a": [], "b": [], "sync": []}
+
+    def consumer(name):
+        async def _consume(item):
+            received[name].append(item)
+
+        return _consume
+
+    listener = _listener(recorder, p2p_nfts_usdc.address, decoder, first_block)
+    listener.register("a", consumer("a"))
+    listener.register("b", consumer("b"), queue_size=1)
+    listener.register("sync", received["sync"].append)
+    _listen(listener, last_block)
+
+    assert received["a"] == received["b"] == received["sync"]
+    assert [item.block.number for item in received["a"]] == list(range(first_block, last_block + 1))
+    events = [(e.name, e["id"]) for item in received["a"] for e in item.events]
+    assert events == [("LoanCreated", "0x" + loan.id.hex()) for loan in loans] + [("LoanPaid", "0x" + loans[0].id.hex())]
+    assert [len(item.events) for item in received["a"]] == [3, 0, 1]
+
+    metrics = listener.metrics()
+    assert metrics["blocks_processed"] == last_block - first_block + 1
+    assert metrics["consumers"]["a"]["latency"]["count"] == metrics["blocks_processed"]
+    assert metrics["consumers"]["b"]["errors"] == 0
+
+
+def test_listener_skips_get_logs_for_blocks_filtered_by_bloom(p2p_nfts_usdc, recorder, create_loan, decoder):
+    first_block = boa.env.evm.patch.block_number
+    create_loan(1)
+    for _ in range(5):
+        _record_empty_block(recorder)
+    last_block = boa.env.evm.patch.block_number
+
+    listener = _listener(recorder, p2p_nfts_usdc.address, decoder, first_block, bloom=True)
+    received = []
+
+    async def _consume(item):
+        received.extend(item.events)
+
+    listener.register("events", _consume)
+    _listen(listener, last_block)
+
+    assert [e.name for e in received] == ["LoanCreated"]
+    assert listener.w3.eth.get_logs_calls == 1
+    assert listener.metrics()["logs_requests"] == 1
+
+
+def test_listener_backpressure_on_slow_consumer(p2p_nfts_usdc, recorder, decoder):
+    first_block = boa.env.evm.patch.block_number + 1
+    for _ in range(10):
+        _record_empty_block(recorder)
+    last_block = boa.env.evm.patch.block_number
+
+    listener = _listener(recorder, p2p_nfts_usdc.address, decoder, first_block)
+    lag = []
+
+    async def _slow(item):
+        lag.append(listener.next_block - item.block.number)
+        await asyncio.sleep(0.01)
+
+    listener.register("slow", _slow, queue_size=2)
+    _listen(listener, last_block)
+
+    assert len(lag) == 10
+    # the listener never gets ahead of the consumer by more than the queue size plus the block being fetched
+    assert max(lag) <= 3
+
+
+def test_listener_counts_consumer_errors(p2p_nfts_usdc, recorder, decoder):
+    first_block = boa.env.evm.patch.block_number + 1
+    for _ in range(3):
+        _record_empty_block(recorder)
+    last_block = boa.env.evm.patch.block_number
+
+    async def _failing(item):
+        raise ValueError(item.block.number)
+
+    listener = _listener(recorder, p2p_nfts_usdc.address, decoder, first_block)
+    listener.register("failing", _failing)
+    _listen(listener, last_block)
+
+    assert listener.metrics()["consumers"]["failing"]["errors"] == 3
+    assert listener.metrics()["consumers"]["failing"]["latency"]["count"] == 0
+
+
+@pytest.fixture
+def anvil():
+    if shutil.which("anvil") is None:
+        pytest.skip("anvil is not installed")
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(["anvil", "--port", str(port), "--silent"])  # noqa: S603, S607
+    try:
+        for _ in range(100):
+            with socket.socket() as s:
+                if s.connect_ex(("127.0.0.1", port)) == 0:
+                    break
+            time.sleep(0.1)
+        yield port
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def test_listener_on_anvil(anvil):
+    w3 = Web3(Web3.HTTPProvider(f"http://127.0.0.1:{anvil}"))
+    owner = w3.eth.accounts[0]
+    bytecode = load_artifact("contracts/P2PLendingNfts.vy").bytecode
+    factory = w3.eth.contract(abi=load_abi("P2PLendingNfts"), bytecode=bytecode)
+    tx = factory.constructor(owner, owner, owner, owner, 0, 0, owner, 10000, 10000, 10000, 10000, False).transact(
+        {"from": owner}
+    )
+    address = w3.eth.get_transaction_receipt(tx)["contractAddress"]
+    p2p_nfts = w3.eth.contract(address=address, abi=load_abi("P2PLendingNfts"))
+    from_block = w3.eth.block_number + 1
+
+    async def _run(async_w3):
+        received = []
+
+        async def _consume(item):
+            received.extend(item.events)
+
+        listener = BlockListener(
+            async_w3, address, EventDecoder.for_contract("P2PLendingNfts"), from_block=from_block, poll_interval=0.05
+        )
+        listener.register("events", _consume)
+        task = asyncio.create_task(listener.run())
+        await asyncio.sleep(0.5)
+        p2p_nfts.functions.set_protocol_fee(1, 2).transact({"from": owner})
+        for _ in range(100):
+            if received:
+                break
+            await asyncio.sleep(0.05)
+        listener.stop()
+        w3.provider.make_request("evm_mine", [])
+        await task
+        return received
+
+    received = asyncio.run(_run(AsyncWeb3(AsyncHTTPProvider(f"http://127.0.0.1:{anvil}"))))
+    assert [(e.name, e["new_upfront_fee"], e["new_settlement_fee"]) for e in received] == [("ProtocolFeeSet", 1, 2)]
+
+    async def _run_ws():
+        async with AsyncWeb3.persistent_websocket(WebsocketProviderV2(f"ws://127.0.0.1:{anvil}")) as async_w3:
+            return await _run(async_w3)
+
+    from_block = w3.eth.block_number + 1
+    received = asyncio.run(_run_ws())
+    assert [e.name for e in received] == ["ProtocolFeeSet"]
@@ -0,0 +1,203 @@
+import asyncio
+
+import boa
+from aiohttp.test_utils import TestClient, TestServer
+from hexbytes import HexBytes
+
+from scripts._helpers.events import EventDecoder
+from scripts._helpers.loan_api import CACHE_KEY, LoanCache, apply_events, create_app, encode_loan
+from scripts._helpers.loans import LOAN_EVENTS, LoanBook
+
+from ...conftest_base import Fee, Loan
+
+
+def _decode(recorder, from_log=0):
+    return EventDecoder.for_contract("P2PLendingNfts", LOAN_EVENTS).decode_all(recorder.logs[from_log:])
+
+
+def _to_loan(loan: dict) -> Loan:
+    values = {k: bytes(HexBytes(v)) if k in {"id", "offer_id", "offer_tracing_id"} else v for k, v in loan.items()}
+    values["fees"] = [Fee(*fee.values()) for fee in loan["fees"]]
+    return Loan(**values)
+
+
+async def _get(client, path):
+    response = await client.get(path)
+    return response.status, await response.json() if response.status == 200 else None  # noqa: PLR2004
+
+
+def _request(app, paths):
+    async def _run():
+        async with TestClient(TestServer(app)) as client:
+            return [await _get(client, path) for path in paths]
+
+    return asyncio.run(_run())
+
+
+def test_loan_book_tracks_active_loans(recorder, create_loan, replace_loan, settle_loan, claim_loan):
+    loans = [create_loan(token_id, duration=3600) for token_id in range(1, 4)]
+    boa.env.time_travel(seconds=60)
+    replaced = replace_loan(loans[0])
+    settle_loan(loans[1])
+    boa.env.time_travel(seconds=3600)
+    claim_loan(loans[2])
+
+    book = LoanBook()
+    closed = book.apply_all(_decode(recorder))
+
+    assert closed == ["0x" + loan.id.hex() for loan in loans]
+    assert list(book.loans) == ["0x" + replaced.id.hex()]
+    assert _to_loan(book.get("0x" + replaced.id.hex())) == replaced
+    assert book.borrower_loans(replaced.borrower) == ["0x" + replaced.id.hex()]
+    assert book.lender_loans(loans[0].lender) == []
+    assert book.collateral_loan(replaced.collateral_contract, 1) == "0x" + replaced.id.hex()
+    assert book.collateral_loan(replaced.collateral_contract, 2) is None
+
+
+def test_loan_book_structs_are_accepted_by_contract(p2p_nfts_usdc, recorder, create_loan, replace_loan, settle_loan):
+    loan = create_loan(1, delegate=boa.env.generate_address())
+    boa.env.time_travel(seconds=60)
+    replace_loan(loan)
+
+    book = LoanBook()
+    book.apply_all(_decode(recorder))
+    (active_loan,) = book.loans.values()
+
+    settle_loan(_to_loan(active_loan))
+    assert p2p_nfts_usdc.loans(HexBytes(active_loan["id"])) == b"\0" * 32
+
+
+def test_loan_cache_is_lru(recorder, create_loan):
+    loans = [create_loan(token_id) for token_id in range(1, 4)]
+    book = LoanBook()
+    book.apply_all(_decode(recorder))
+    cache = LoanCache(book, maxsize=2)
+    loan_ids = ["0x" + loan.id.hex() for loan in loans]
+
+    assert cache.get(loan_ids[0]) == encode_loan(book.get(loan_ids[0]))
+    cache.get(loan_ids[1])
+    cache.get(loan_ids[0])
+    cache.get(loan_ids[2])
+
+    assert list(cache.entries) == [loan_ids[0], loan_ids[2]]
+    assert cache.get("0x" + "00" * 32) is None
+    assert cache.metrics() == {"size": 2, "maxsize": 2, "hits": 1, "misses": 4}
+
+
+def test_api_lookups(recorder, create_loan, borrower, lender, bayc):
+    loans = [create_loan(token_id) for token_id in range(1, 3)]
+    book = LoanBook()
+    app = create_app(book)
+    apply_events(app, _decode(recorder))
+    loan_id = "0x" + loans[0].id.hex()
+
+    responses = _request(
+        app,
+        [
+            f"/loans/{loan_id}",
+            f"/borrowers/{borrower.lower()}/loans",
+            f"/lenders/{lender}/loans",
+            f"/collateral/{bayc.address}/2",
+            f"/collateral/{bayc.address}/3",
+            "/loans/0x1234",
+            "/borrowers/0x1234/loans",
+            "/loans?limit=1",
+            "/loans?limit=abc",
+            "/loans?limit=-1",
+        ],
+    )
+
+    status, loan = responses[0]
+    assert status == 200  # noqa: PLR2004
+    assert loan["id"] == loan_id
+    assert loan["amount"] == "1000"
+    assert loan["fees"][0]["type"] == "1"
+    assert loan["pro_rata"] is False
+    assert sorted(r["id"] for r in responses[1][1]) == sorted("0x" + loan.id.hex() for loan in loans)
+    assert len(responses[2][1]) == 2  # noqa: PLR2004
+    assert responses[3][1]["id"] == "0x" + loans[1].id.hex()
+    assert [status for status, _ in responses[4:7]] == [404, 404, 400]
+    assert len(responses[7][1]) == 1
+    assert [status for status, _ in responses[8:]] == [400, 400]
+
+
+def test_api_cache_invalidated_by_loan_events(recorder, create_loan, replace_loan, bayc):
+    loan = create_loan(1)
+    app = create_app(LoanBook())
+    apply_events(app, _decode(recorder))
+    loan_id = "0x" + loan.id.hex()
+
+    async def _run():
+        async with TestClient(TestServer(app)) as client:
+            status, _ = await _get(client, f"/loans/{loan_id}")
+            assert status == 200  # noqa: PLR2004
+            assert loan_id in app[CACHE_KEY].entries
+
+            boa.env.time_travel(seconds=60)
+            from_log = len(recorder.logs)
+            replaced = replace_loan(loan)
+            apply_events(app, _decode(recorder, from_log))
+            assert loan_id not in app[CACHE_KEY].entries
+
+            assert (await _get(client, f"/loans/{loan_id}"))[0] == 404  # noqa: PLR2004
+            assert (await _get(client, f"/collateral/{bayc.address}/1"))[1]["id"] == "0x" + replaced.id.hex()
+            _, status = await _get(client, "/status")
+            assert status["active_loans"] == 1
+            assert status["cache"]["size"] == 1
+            assert status["latency"]["count"] == 3  # noqa: PLR2004
+
+    asyncio.run(_run())
+
+
+def test_collateral_index_follows_replacements(recorder, create_loan, replace_loan, settle_loan, bayc):
+    loan = create_loan(1, duration=3600)
+    other_loan = create_loan(2, duration=3600)
+    boa.env.time_travel(seconds=60)
+    replaced = replace_loan(loan)
+    boa.env.time_travel(seconds=60)
+    replaced_twice = replace_loan(replaced)
+    settle_loan(other_loan)
+
+    book = LoanBook()
+    book.apply_all(_decode(recorder))
+    index = book.collateral
+
+    loan_ids = ["0x" + loan.id.hex() for loan in (loan, replaced, replaced_twice)]
+    assert [book.current_loan(loan_id) for loan_id in loan_ids] == [loan_ids[2]] * 3
+    assert book.current_loan("0x" + other_loan.id.hex()) is None
+    assert index.get(bayc.address, 1) == loan_ids[2]
+    assert index.get(bayc.address, 2) is None
+    assert index.collateral_token_ids(bayc.address) == {1}
+    assert index.flag(bayc.address, [1, 2, 3]) == {1: loan_ids[2], 2: None, 3: None}
+    assert len(index) == 1
+    assert index.chains.keys() == set(loan_ids)
+
+    from_log = len(recorder.logs)
+    settle_loan(replaced_twice)
+    book.apply_all(_decode(recorder, from_log))
+    assert [book.current_loan(loan_id) for loan_id in loan_ids] == [None] * 3
+    assert index.chains == {}
+
+
+def test_api_collateral_bulk_lookups(recorder, create_loan, replace_loan, bayc):
+    loans = [create_loan(token_id) for token_id in range(1, 4)]
+    boa.env.time_travel(seconds=60)
+    replaced = replace_loan(loans[0])
+    app = create_app(LoanBook())
+    apply_events(app, _decode(recorder))
+
+    async def _run():
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(f"/collateral/{bayc.address.lower()}", json=[1, "2", 4])
+            assert await response.json() == {"1": "0x" + replaced.id.hex(), "2": "0x" + loans[1].id.hex(), "4": None}
+
+            for body in ({"json": {"1": "2"}}, {"json": {"token_ids": [1]}}, {"data": "[1,"}):
+                response = await client.post(f"/collateral/{bayc.address}", **body)
+                assert response.status == 400  # noqa: PLR2004
+                assert await response.text() == "expected a list of token ids"
+
+            assert await _get(client, f"/collateral/{bayc.address}") == (200, ["1", "2", "3"])
+            _, current = await _get(client, f"/loans/0x{loans[0].id.hex()}/current")
+            assert current["id"] == "0x" + replaced.id.hex()
+
+    asyncio.run(_run())
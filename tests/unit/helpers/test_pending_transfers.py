@@ -0,0 +1,124 @@
+import boa
+from eth_abi import decode, encode
+
+from scripts._helpers.events import EventDecoder
+from scripts._helpers.pending_transfers import (
+    AGGREGATE3_SELECTOR,
+    MULTICALL3_ADDRESS,
+    PENDING_TRANSFERS_EVENTS,
+    PENDING_TRANSFERS_SELECTOR,
+    Mismatch,
+    PendingTransfersTracker,
+    decode_pending_transfers_results,
+    encode_pending_transfers_calls,
+    read_pending_transfers,
+)
+
+
+def _decode(recorder):
+    return EventDecoder.for_contract("P2PLendingNfts", PENDING_TRANSFERS_EVENTS).decode_all(recorder.logs)
+
+
+def _onchain(p2p_nfts, wallets):
+    return {wallet: p2p_nfts.pending_transfers(wallet) for wallet in wallets}
+
+
+def test_tracker_aggregates_failed_transfers(p2p_nfts_usdc, usdc, recorder, create_loan, settle_loan, lender, borrower):
+    loans = [create_loan(token_id, principal=1000 * token_id) for token_id in range(1, 3)]
+    usdc.blacklist(lender, True)
+    for loan in loans:
+        settle_loan(loan)
+
+    tracker = PendingTransfersTracker()
+    assert tracker.apply_all(_decode(recorder)) == {lender}
+    assert tracker.pending() == {lender: 1000 + 100 + 2000 + 100}
+    assert tracker.failed_transfers[lender] == 2  # noqa: PLR2004
+    assert tracker.verify(_onchain(p2p_nfts_usdc, [lender, borrower])) == []
+
+    usdc.blacklist(lender, False)
+    p2p_nfts_usdc.claim_pending_transfers(sender=lender)
+    recorder.record()
+
+    tracker = PendingTransfersTracker()
+    tracker.apply_all(_decode(recorder))
+    assert tracker.pending() == {}
+    assert tracker.verify(_onchain(p2p_nfts_usdc, [lender])) == []
+
+
+def test_tracker_records_last_scanned_block(p2p_nfts_usdc, usdc, recorder, create_loan, settle_loan, lender):
+    tracker = PendingTransfersTracker()
+    assert tracker.apply_all([], to_block=10) == set()
+    assert tracker.last_block == 10  # noqa: PLR2004
+
+    loan = create_loan(1)
+    usdc.blacklist(lender, True)
+    settle_loan(loan)
+    boa.env.time_travel(blocks=5)
+    head = boa.env.evm.patch.block_number
+    assert tracker.apply_all(_decode(recorder), to_block=head) == {lender}
+    assert tracker.last_block == head
+
+
+def test_tracker_verify_and_reconcile(lender, borrower):
+    tracker = PendingTransfersTracker()
+    tracker.balances[lender] = 100
+
+    mismatches = tracker.verify({lender: 150, borrower: 10})
+    assert mismatches == [Mismatch(lender, 100, 150), Mismatch(borrower, 0, 10)]
+
+    tracker.reconcile({lender: 0, borrower: 10})
+    assert tracker.pending() == {borrower: 10}
+    assert tracker.pending(min_amount=11) == {}
+
+
+def test_multicall_encoding(p2p_nfts_usdc, lender, borrower):
+    data = encode_pending_transfers_calls(p2p_nfts_usdc.address, [lender, borrower])
+
+    assert data[:4] == AGGREGATE3_SELECTOR
+    (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+    assert [(target.lower(), allow_failure) for target, allow_failure, _ in calls] == [
+        (p2p_nfts_usdc.address.lower(), False)
+    ] * 2
+    assert calls[1][2] == PENDING_TRANSFERS_SELECTOR + encode(["address"], [borrower])
+
+    results = encode(["(bool,bytes)[]"], [[(True, encode(["uint256"], [5])), (True, encode(["uint256"], [0]))]])
+    assert decode_pending_transfers_results([lender.lower(), borrower], results) == {lender: 5, borrower: 0}
+
+
+class _Eth:
+    def __init__(self, p2p_nfts):
+        self.p2p_nfts = p2p_nfts
+        self.calls = []
+
+    @staticmethod
+    def get_code(address, _block_identifier):
+        return b"\x01" if address == MULTICALL3_ADDRESS else b""
+
+    def call(self, tx, block_identifier):
+        self.calls.append((tx, block_identifier))
+        (calls,) = decode(["(address,bool,bytes)[]"], tx["data"][4:])
+        wallets = [decode(["address"], call_data[4:])[0] for _, _, call_data in calls]
+        return encode(
+            ["(bool,bytes)[]"], [[(True, encode(["uint256"], [self.p2p_nfts.pending_transfers(w)])) for w in wallets]]
+        )
+
+
+class _Web3:
+    def __init__(self, eth):
+        self.eth = eth
+
+
+def test_read_pending_transfers_in_chunks(p2p_nfts_usdc, usdc, create_loan, settle_loan, lender, borrower):
+    loan = create_loan(1)
+    usdc.blacklist(lender, True)
+    settle_loan(loan)
+
+    w3 = _Web3(_Eth(p2p_nfts_usdc))
+    wallets = [lender, borrower, p2p_nfts_usdc.protocol_wallet()]
+    block_number = boa.env.evm.patch.block_number
+    assert read_pending_transfers(w3, p2p_nfts_usdc.address, wallets, chunk_size=2, block_identifier=block_number) == {
+        lender: 1100,
+        borrower: 0,
+        wallets[2]: 0,
+    }
+    assert [block_identifier for _, block_identifier in w3.eth.calls] == [block_number] * 2
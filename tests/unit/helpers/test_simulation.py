@@ -0,0 +1,55 @@
+import json
+from itertools import pairwise
+
+from scripts._helpers.simulation import Simulation, SimulationConfig, write_report
+
+CONFIG = SimulationConfig(
+    borrowers=4,
+    lenders=3,
+    brokers=1,
+    proxies=1,
+    collections=2,
+    loans=12,
+    offers=40,
+    transactions=40,
+    transactions_per_block=4,
+    seconds_per_block=6 * 3600,
+    sample_every=3,
+)
+
+
+def test_simulation(tmp_path):
+    report = Simulation(CONFIG).run()
+
+    assert report["phases"]["ramp"]["transactions"] >= CONFIG.loans
+    assert report["phases"]["steady"]["transactions"] == CONFIG.transactions
+    assert report["transactions"]["total"] == sum(f["transactions"] for f in report["functions"].values())
+    assert report["transactions"]["reverted"] == sum(f["reverted"] for f in report["functions"].values())
+    assert report["gas"]["count"] == report["transactions"]["total"] - report["transactions"]["reverted"]
+    assert report["functions"]["create_loan"]["gas"]["min"] > 21000
+
+    assert report["tooling"]["loan_book"] == report["state"]["loans"]
+    assert report["state"]["loans_opened"] == (
+        report["events"]["by_name"]["P2PLendingNfts.LoanCreated"]
+        + report["events"]["by_name"].get("P2PLendingNfts.LoanReplaced", 0)
+        + report["events"]["by_name"].get("P2PLendingNfts.LoanReplacedByLender", 0)
+    )
+    assert report["state"]["revoked_offers"] == report["events"]["by_name"].get("P2PLendingNfts.OfferRevoked", 0)
+    assert report["state"]["signed_offers"] <= CONFIG.offers
+
+    timeline = report["timeline"]
+    assert [sample["phase"] for sample in timeline][-1] == "steady"
+    assert all(a["block"] < b["block"] and a["timestamp"] < b["timestamp"] for a, b in pairwise(timeline))
+    assert timeline[-1]["loans"] == report["state"]["loans"]
+
+    write_report(tmp_path / "report.json", report)
+    assert json.loads((tmp_path / "report.json").read_text())["state"] == report["state"]
+
+
+def test_simulation_is_deterministic():
+    config = SimulationConfig(**vars(CONFIG) | {"loans": 4, "transactions": 8})
+    first, second = Simulation(config).run(), Simulation(config).run()
+
+    assert first["functions"].keys() == second["functions"].keys()
+    assert all(first["functions"][name]["gas"] == second["functions"][name]["gas"] for name in first["functions"])
+    assert first["state"] == second["state"]
@@ -10,7 +10,7 @@ from ...conftest_base import (
     compute_loan_hash,
     compute_signed_offer_id,
     get_last_event,
-    get_loan_mutations,
+    get_surviving_mutations,
     sign_offer,
 )
 
@@ -216,10 +216,10 @@ def ongoing_loan_punk(p2p_nfts_usdc, offer_punk, usdc, borrower, lender, cryptop
 
 
 def test_claim_defaulted_reverts_if_loan_invalid(p2p_nfts_usdc, ongoing_loan_bayc):
-    for loan in get_loan_mutations(ongoing_loan_bayc):
-        print(f"{loan=}")
-        with boa.reverts("invalid loan"):
-            p2p_nfts_usdc.claim_defaulted_loan_collateral(loan, sender=ongoing_loan_bayc.borrower)
+    def call(loan):
+        p2p_nfts_usdc.claim_defaulted_loan_collateral(loan, sender=ongoing_loan_bayc.borrower)
+
+    assert get_surviving_mutations(call, ongoing_loan_bayc, "invalid loan") == []
 
 
 def test_claim_defaulted_reverts_if_loan_not_defaulted(p2p_nfts_usdc, ongoing_loan_bayc, now):
@@ -0,0 +1,228 @@
+import boa
+import pytest
+
+from ...conftest_base import (
+    ZERO_ADDRESS,
+    ZERO_BYTES32,
+    Fee,
+    Loan,
+    Offer,
+    compute_loan_hash,
+    compute_signed_offer_id,
+    get_events,
+    get_surviving_mutations,
+    sign_offer,
+)
+
+
+@pytest.fixture(autouse=True)
+def lender_funds(lender, lender2, usdc):
+    usdc.mint(lender, 10**12)
+    usdc.mint(lender2, 10**12)
+
+
+@pytest.fixture(autouse=True)
+def borrower_funds(borrower, usdc):
+    usdc.mint(borrower, 10**12)
+
+
+@pytest.fixture
+def broker():
+    return boa.env.generate_address()
+
+
+@pytest.fixture
+def borrower_broker_fee():
+    return Fee.borrower_broker(boa.env.generate_address(), upfront_amount=15, settlement_bps=300)
+
+
+@pytest.fixture
+def protocol_fees(p2p_nfts_usdc):
+    p2p_nfts_usdc.set_protocol_fee(11, 1000, sender=p2p_nfts_usdc.owner())
+    p2p_nfts_usdc.change_protocol_wallet(p2p_nfts_usdc.owner(), sender=p2p_nfts_usdc.owner())
+
+
+@pytest.fixture
+def create_loan(p2p_nfts_usdc, usdc, bayc, bayc_key_hash, borrower, broker, borrower_broker_fee, now, protocol_fees):
+    def _create_loan(
+        token_id, lender, lender_key, *, principal=1000, interest=100, duration=100, pro_rata=False, delegate=borrower
+    ):
+        offer = Offer(
+            principal=principal,
+            interest=interest,
+            payment_token=usdc.address,
+            duration=duration,
+            origination_fee_amount=10,
+            broker_upfront_fee_amount=15,
+            broker_settlement_fee_bps=200,
+            broker_address=broker,
+            collection_key_hash=bayc_key_hash,
+            token_id=token_id,
+            expiration=now + 100,
+            lender=lender,
+            pro_rata=pro_rata,
+            size=1,
+            tracing_id=token_id.to_bytes(32, "big"),
+        )
+        signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+        bayc.mint(borrower, token_id)
+        bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+        usdc.approve(p2p_nfts_usdc.address, principal - 10 + 15, sender=lender)
+
+        loan_id = p2p_nfts_usdc.create_loan(
+            signed_offer,
+            token_id,
+            [],
+            delegate,
+            borrower_broker_fee.upfront_amount,
+            borrower_broker_fee.settlement_bps,
+            borrower_broker_fee.wallet,
+            sender=borrower,
+        )
+        loan = Loan(
+            id=loan_id,
+            offer_id=compute_signed_offer_id(signed_offer),
+            offer_tracing_id=offer.tracing_id,
+            amount=principal,
+            interest=interest,
+            payment_token=usdc.address,
+            maturity=now + offer.duration,
+            start_time=now,
+            borrower=borrower,
+            lender=lender,
+            collateral_contract=bayc.address,
+            collateral_token_id=token_id,
+            fees=[
+                Fee.protocol(p2p_nfts_usdc, principal),
+                Fee.origination(offer),
+                Fee.lender_broker(offer),
+                borrower_broker_fee,
+            ],
+            pro_rata=pro_rata,
+            delegate=delegate,
+        )
+        assert compute_loan_hash(loan) == p2p_nfts_usdc.loans(loan_id)
+        return loan
+
+    return _create_loan
+
+
+@pytest.fixture
+def loans(create_loan, lender, lender_key):
+    return [
+        create_loan(1, lender, lender_key),
+        create_loan(2, lender, lender_key, delegate=ZERO_ADDRESS),
+        create_loan(3, lender, lender_key, pro_rata=True),
+    ]
+
+
+@pytest.fixture
+def defaulted_loans(loans, now):
+    boa.env.time_travel(seconds=loans[0].maturity - now + 1)
+    return loans
+
+
+def _is_delegated(delegation_registry, p2p_nfts_usdc, loan):
+    return delegation_registry.checkDelegateForERC721(
+        loan.borrower, p2p_nfts_usdc.address, loan.collateral_contract, loan.collateral_token_id, ZERO_BYTES32
+    )
+
+
+def test_claim_defaulted_loans_reverts_if_loan_invalid(p2p_nfts_usdc, defaulted_loans):
+    def call(loan):
+        p2p_nfts_usdc.claim_defaulted_loans_collateral([defaulted_loans[0], loan], False, sender=defaulted_loans[0].lender)
+
+    assert get_surviving_mutations(call, defaulted_loans[1], "invalid loan") == []
+
+
+def test_claim_defaulted_loans_reverts_if_loan_repeated(p2p_nfts_usdc, defaulted_loans):
+    with boa.reverts("invalid loan"):
+        p2p_nfts_usdc.claim_defaulted_loans_collateral(
+            [*defaulted_loans, defaulted_loans[0]], True, sender=defaulted_loans[0].lender
+        )
+
+
+def test_claim_defaulted_loans_reverts_if_loan_not_defaulted(p2p_nfts_usdc, loans, create_loan, lender, lender_key, now):
+    ongoing_loan = create_loan(4, lender, lender_key, duration=1000)
+    boa.env.time_travel(seconds=loans[0].maturity - now + 1)
+
+    with boa.reverts("loan not defaulted"):
+        p2p_nfts_usdc.claim_defaulted_loans_collateral([*loans, ongoing_loan], False, sender=lender)
+
+
+def test_claim_defaulted_loans_reverts_if_not_lender(p2p_nfts_usdc, loans, create_loan, lender2, lender2_key, now):
+    other_lender_loan = create_loan(4, lender2, lender2_key)
+    boa.env.time_travel(seconds=loans[0].maturity - now + 1)
+
+    with boa.reverts("not lender"):
+        p2p_nfts_usdc.claim_defaulted_loans_collateral([other_lender_loan, *loans], False, sender=lender2)
+
+
+@pytest.mark.parametrize("batch_delegation_revocation", [False, True])
+def test_claim_defaulted_loans(p2p_nfts_usdc, defaulted_loans, bayc, delegation_registry, lender, batch_delegation_revocation):
+    assert [_is_delegated(delegation_registry, p2p_nfts_usdc, loan) for loan in defaulted_loans] == [True, False, True]
+
+    p2p_nfts_usdc.claim_defaulted_loans_collateral(defaulted_loans, batch_delegation_revocation, sender=lender)
+
+    for loan in defaulted_loans:
+        assert p2p_nfts_usdc.loans(loan.id) == ZERO_BYTES32
+        assert bayc.ownerOf(loan.collateral_token_id) == lender
+        assert not _is_delegated(delegation_registry, p2p_nfts_usdc, loan)
+
+
+@pytest.mark.parametrize("batch_delegation_revocation", [False, True])
+def test_claim_defaulted_loans_logs_events(p2p_nfts_usdc, defaulted_loans, lender, batch_delegation_revocation):
+    p2p_nfts_usdc.claim_defaulted_loans_collateral(defaulted_loans, batch_delegation_revocation, sender=lender)
+
+    events = get_events(p2p_nfts_usdc, "LoanCollateralClaimed")
+    assert len(events) == len(defaulted_loans)
+    for event, loan in zip(events, defaulted_loans):
+        assert event.id == loan.id
+        assert event.borrower == loan.borrower
+        assert event.lender == loan.lender
+        assert event.collateral_contract == loan.collateral_contract
+        assert event.collateral_token_id == loan.collateral_token_id
+
+    revocations = get_events(p2p_nfts_usdc, "DelegateERC721")
+    assert [(e.tokenId, e.enable) for e in revocations] == [(1, False), (3, False)]
+
+
+def test_claim_defaulted_loans_without_delegations(p2p_nfts_usdc, create_loan, lender, lender_key, now):
+    loans = [create_loan(token_id, lender, lender_key, delegate=ZERO_ADDRESS) for token_id in range(1, 3)]
+    boa.env.time_travel(seconds=loans[0].maturity - now + 1)
+
+    p2p_nfts_usdc.claim_defaulted_loans_collateral(loans, True, sender=lender)
+
+    assert len(get_events(p2p_nfts_usdc, "LoanCollateralClaimed")) == len(loans)
+    assert get_events(p2p_nfts_usdc, "DelegateERC721") == []
+
+
+def _tx_gas(contract, function_name, *args, sender):
+    # execution gas plus the intrinsic gas of the transaction, which is what batching saves the most
+    function = getattr(contract, function_name)
+    function(*args, sender=sender)
+    calldata = function.prepare_calldata(*args)
+    return contract._computation.get_gas_used() + 21000 + sum(16 if byte else 4 for byte in calldata)
+
+
+def test_claim_defaulted_loans_uses_less_gas_than_claim_defaulted_loan(p2p_nfts_usdc, defaulted_loans, lender):
+    with boa.env.anchor():
+        single_gas = sum(
+            _tx_gas(p2p_nfts_usdc, "claim_defaulted_loan_collateral", loan, sender=lender) for loan in defaulted_loans
+        )
+
+    batch_gas = {}
+    for batch_delegation_revocation in [False, True]:
+        with boa.env.anchor():
+            batch_gas[batch_delegation_revocation] = _tx_gas(
+                p2p_nfts_usdc,
+                "claim_defaulted_loans_collateral",
+                defaulted_loans,
+                batch_delegation_revocation,
+                sender=lender,
+            )
+
+    print(f"claim_defaulted_loan_collateral x{len(defaulted_loans)}: {single_gas}, batched: {batch_gas}")
+    assert batch_gas[False] < single_gas
+    assert batch_gas[True] < single_gas
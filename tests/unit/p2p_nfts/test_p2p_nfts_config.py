@@ -283,3 +283,57 @@ def test_change_trait_roots(p2p_control, owner):
     p2p_control.change_collections_trait_roots(list(collection_roots.items()), sender=owner)
     for key, root in collection_roots.items():
         assert p2p_control.trait_roots(key) == root
+
+
+def test_change_versioned_trait_roots(p2p_control, owner):
+    versioned_roots = [
+        (sha3_256(f"collection_{i}".encode()).digest(), sha3_256(f"root_{i}".encode()).digest(), 1 + i % 2) for i in range(128)
+    ]
+    p2p_control.change_collections_versioned_trait_roots(versioned_roots, sender=owner)
+    event = get_last_event(p2p_control, "VersionedTraitRootChanged")
+
+    assert event.changed == versioned_roots
+    for key, root, version in versioned_roots:
+        assert p2p_control.trait_roots(key) == root
+        assert p2p_control.trait_root_versions(key) == version
+        assert p2p_control.get_collection_status(key)[1:] == (root, version)
+
+
+def test_change_versioned_trait_roots_reverts_if_not_owner(p2p_control):
+    root = (sha3_256(b"collection").digest(), sha3_256(b"root").digest(), 2)
+
+    with boa.reverts("sender not owner"):
+        p2p_control.change_collections_versioned_trait_roots([root], sender=boa.env.generate_address())
+
+
+@pytest.mark.parametrize("version", [0, 3])
+def test_change_versioned_trait_roots_reverts_if_invalid_version(p2p_control, owner, version):
+    root = (sha3_256(b"collection").digest(), sha3_256(b"root").digest(), version)
+
+    with boa.reverts("invalid trait root version"):
+        p2p_control.change_collections_versioned_trait_roots([root], sender=owner)
+
+
+def test_change_trait_roots_sets_version_1(p2p_control, owner):
+    key = sha3_256(b"collection").digest()
+    assert p2p_control.get_collection_status(key)[2] == 1
+
+    p2p_control.change_collections_versioned_trait_roots([(key, sha3_256(b"root_v2").digest(), 2)], sender=owner)
+    p2p_control.change_collections_trait_roots([(key, sha3_256(b"root_v1").digest())], sender=owner)
+
+    assert p2p_control.trait_root_versions(key) == 0
+    assert p2p_control.get_collection_status(key)[2] == 1
+
+
+def test_get_collections_status(p2p_control, collections, owner):
+    p2p_control.change_collections_contracts(list(starmap(CollectionContract, collections.items())), sender=owner)
+    key_hashes = list(collections)
+    p2p_control.change_collections_versioned_trait_roots(
+        [(key_hash, sha3_256(key_hash).digest(), 2) for key_hash in key_hashes[:2]], sender=owner
+    )
+    key_hashes.append(sha3_256(b"not whitelisted").digest())
+
+    statuses = p2p_control.get_collections_status(key_hashes)
+
+    assert statuses == [p2p_control.get_collection_status(key_hash) for key_hash in key_hashes]
+    assert p2p_control.get_collections_status([]) == []
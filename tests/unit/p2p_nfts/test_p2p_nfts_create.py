@@ -10,11 +10,11 @@ from ...conftest_base import (
     Loan,
     Offer,
     OfferType,
-    SignedOffer,
     TokenTraitTree,
     compute_loan_hash,
     compute_signed_offer_id,
     get_last_event,
+    get_surviving_mutations,
     replace_namedtuple_field,
     sign_offer,
 )
@@ -66,34 +66,10 @@ def test_create_loan_reverts_if_offer_has_invalid_signature(p2p_nfts_usdc, borro
     )
     signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
 
-    invalid_offers = [
-        replace_namedtuple_field(offer, principal=offer.principal + 1),
-        replace_namedtuple_field(offer, interest=offer.interest + 1),
-        replace_namedtuple_field(offer, payment_token=boa.env.generate_address("random")),
-        replace_namedtuple_field(offer, duration=offer.duration + 1),
-        replace_namedtuple_field(offer, origination_fee_amount=offer.origination_fee_amount + 1),
-        replace_namedtuple_field(offer, broker_upfront_fee_amount=offer.broker_upfront_fee_amount + 1),
-        replace_namedtuple_field(offer, broker_settlement_fee_bps=offer.broker_settlement_fee_bps + 1),
-        replace_namedtuple_field(offer, broker_address=boa.env.generate_address("random")),
-        replace_namedtuple_field(offer, token_id=offer.token_id + 1),
-        replace_namedtuple_field(offer, token_range_min=offer.token_range_min + 1),
-        replace_namedtuple_field(offer, token_range_max=offer.token_range_max - 1),
-        replace_namedtuple_field(offer, trait_hash=b"\1" * 32),
-        replace_namedtuple_field(offer, offer_type=OfferType.COLLECTION),
-        replace_namedtuple_field(offer, offer_type=OfferType.TRAIT),
-        replace_namedtuple_field(offer, expiration=offer.expiration + 1),
-        replace_namedtuple_field(offer, lender=boa.env.generate_address("random")),
-        replace_namedtuple_field(offer, pro_rata=not offer.pro_rata),
-        replace_namedtuple_field(offer, size=offer.size + 1),
-        replace_namedtuple_field(offer, tracing_id=b"\1" * 32),
-    ]
+    def call(signed_offer):
+        p2p_nfts_usdc.create_loan(signed_offer, 1, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
 
-    for invalid_offer in invalid_offers:
-        print(f"{invalid_offer=}")
-        with boa.reverts("offer not signed by lender"):
-            p2p_nfts_usdc.create_loan(
-                SignedOffer(invalid_offer, signed_offer.signature), 1, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower
-            )
+    assert get_surviving_mutations(call, signed_offer, "offer not signed by lender") == []
 
 
 def test_create_loan_reverts_if_offer_expired(p2p_nfts_usdc, borrower, now, lender, lender_key, bayc_key_hash, usdc):
@@ -146,6 +122,40 @@ def test_create_loan_reverts_if_payment_token_invalid(
         p2p_nfts_usdc.create_loan(signed_offer, token_id, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
 
 
+def test_create_loan_reverts_if_offer_nonce_revoked(
+    p2p_nfts_usdc, borrower, now, lender, lender_key, bayc, bayc_key_hash, usdc
+):
+    token_id = 1
+    bayc.mint(borrower, token_id)
+    bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+    usdc.approve(p2p_nfts_usdc.address, 1000, sender=lender)
+    offer = Offer(
+        principal=1000,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        origination_fee_amount=0,
+        broker_upfront_fee_amount=0,
+        broker_settlement_fee_bps=0,
+        broker_address=ZERO_ADDRESS,
+        collection_key_hash=bayc_key_hash,
+        token_id=token_id,
+        expiration=now + 100,
+        lender=lender,
+        pro_rata=False,
+        nonce=1,
+    )
+    signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+    p2p_nfts_usdc.set_min_offer_nonce(2, sender=lender)
+    with boa.reverts("offer nonce revoked"):
+        p2p_nfts_usdc.create_loan(signed_offer, token_id, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+    signed_offer = sign_offer(replace_namedtuple_field(offer, nonce=2), lender_key, p2p_nfts_usdc.address)
+    p2p_nfts_usdc.create_loan(signed_offer, token_id, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
+    assert bayc.ownerOf(token_id) == p2p_nfts_usdc.address
+
+
 def test_create_loan_reverts_if_collateral_not_whitelisted(
     p2p_nfts_usdc, p2p_control, borrower, now, lender, lender_key, bayc, bayc_key_hash, usdc
 ):
@@ -0,0 +1,255 @@
+import boa
+import pytest
+
+from ...conftest_base import (
+    ZERO_ADDRESS,
+    ZERO_BYTES32,
+    Fee,
+    Loan,
+    Offer,
+    OfferType,
+    TokenTraitTree,
+    compute_loan_hash,
+    compute_signed_offer_id,
+    get_events,
+    get_surviving_mutations,
+    sign_offer,
+)
+
+PRINCIPAL = 1000
+ORIGINATION_FEE = 10
+BROKER_UPFRONT_FEE = 15
+PROTOCOL_UPFRONT_FEE = 100
+
+
+@pytest.fixture(autouse=True)
+def lender_funds(lender, usdc, p2p_nfts_usdc):
+    usdc.mint(lender, 10**12)
+    usdc.approve(p2p_nfts_usdc.address, 10**12, sender=lender)
+
+
+@pytest.fixture(autouse=True)
+def protocol_fees(p2p_nfts_usdc):
+    p2p_nfts_usdc.set_protocol_fee(PROTOCOL_UPFRONT_FEE, 1000, sender=p2p_nfts_usdc.owner())
+    p2p_nfts_usdc.change_protocol_wallet(p2p_nfts_usdc.owner(), sender=p2p_nfts_usdc.owner())
+
+
+@pytest.fixture
+def broker():
+    return boa.env.generate_address()
+
+
+@pytest.fixture
+def make_offer(p2p_nfts_usdc, usdc, bayc_key_hash, lender, lender_key, broker, now):
+    def _make_offer(size, **kwargs):
+        offer = Offer(
+            principal=PRINCIPAL,
+            interest=100,
+            payment_token=usdc.address,
+            duration=100,
+            origination_fee_amount=ORIGINATION_FEE,
+            broker_upfront_fee_amount=BROKER_UPFRONT_FEE,
+            broker_settlement_fee_bps=200,
+            broker_address=broker,
+            collection_key_hash=bayc_key_hash,
+            offer_type=OfferType.COLLECTION,
+            token_range_min=1,
+            token_range_max=100,
+            expiration=now + 100,
+            lender=lender,
+            pro_rata=False,
+            size=size,
+        )
+        return sign_offer(offer._replace(**kwargs), lender_key, p2p_nfts_usdc.address)
+
+    return _make_offer
+
+
+@pytest.fixture
+def collaterals(p2p_nfts_usdc, bayc, borrower):
+    def _collaterals(token_ids, delegate=ZERO_ADDRESS, proofs=None):
+        for token_id in token_ids:
+            bayc.mint(borrower, token_id)
+        bayc.setApprovalForAll(p2p_nfts_usdc.address, True, sender=borrower)
+        proofs = proofs or [[] for _ in token_ids]
+        return [(token_id, proof, delegate) for token_id, proof in zip(token_ids, proofs)]
+
+    return _collaterals
+
+
+def _loans(p2p_nfts, signed_offer, collaterals, loan_ids, borrower, bayc, now):
+    offer = signed_offer.offer
+    return [
+        Loan(
+            id=loan_id,
+            offer_id=compute_signed_offer_id(signed_offer),
+            amount=offer.principal,
+            interest=offer.interest,
+            payment_token=offer.payment_token,
+            maturity=now + offer.duration,
+            start_time=now,
+            borrower=borrower,
+            lender=offer.lender,
+            collateral_contract=bayc.address,
+            collateral_token_id=token_id,
+            fees=[
+                Fee.protocol(p2p_nfts, offer.principal),
+                Fee.origination(offer),
+                Fee.lender_broker(offer),
+                Fee.borrower_broker(ZERO_ADDRESS),
+            ],
+            pro_rata=offer.pro_rata,
+            delegate=delegate,
+        )
+        for loan_id, (token_id, _, delegate) in zip(loan_ids, collaterals)
+    ]
+
+
+def test_create_loans_reverts_if_no_collaterals(p2p_nfts_usdc, make_offer, borrower):
+    with boa.reverts("no collaterals"):
+        p2p_nfts_usdc.create_loans(make_offer(5), [], 0, 0, ZERO_ADDRESS, sender=borrower)
+
+
+def test_create_loans_reverts_if_batch_exceeds_offer_size(p2p_nfts_usdc, make_offer, collaterals, borrower):
+    signed_offer = make_offer(3)
+    batch = collaterals([1, 2, 3, 4])
+
+    with boa.reverts("offer fully utilized"):
+        p2p_nfts_usdc.create_loans(signed_offer, batch, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+    p2p_nfts_usdc.create_loans(signed_offer, batch[:2], 0, 0, ZERO_ADDRESS, sender=borrower)
+    with boa.reverts("offer fully utilized"):
+        p2p_nfts_usdc.create_loans(signed_offer, batch[2:], 0, 0, ZERO_ADDRESS, sender=borrower)
+
+
+def test_create_loans_reverts_if_offer_not_signed_by_lender(p2p_nfts_usdc, make_offer, collaterals, borrower):
+    batch = collaterals([1, 2])
+
+    def call(signed_offer):
+        p2p_nfts_usdc.create_loans(signed_offer, batch, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+    assert get_surviving_mutations(call, make_offer(2), "offer not signed by lender") == []
+
+
+def test_create_loans_reverts_if_any_token_id_not_in_offer(p2p_nfts_usdc, make_offer, collaterals, borrower):
+    signed_offer = make_offer(2, token_range_max=10)
+
+    with boa.reverts("tokenid above offer range"):
+        p2p_nfts_usdc.create_loans(signed_offer, collaterals([1, 11]), 0, 0, ZERO_ADDRESS, sender=borrower)
+
+
+def test_create_loans_reverts_if_token_repeated(p2p_nfts_usdc, make_offer, collaterals, borrower):
+    batch = collaterals([1])
+
+    with boa.reverts():
+        p2p_nfts_usdc.create_loans(make_offer(2), batch * 2, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+
+def test_create_loans(p2p_nfts_usdc, make_offer, collaterals, borrower, bayc, delegation_registry, now):
+    signed_offer = make_offer(5)
+    batch = collaterals([1, 2, 3], delegate=borrower)
+
+    loan_ids = p2p_nfts_usdc.create_loans(signed_offer, batch, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+    loans = _loans(p2p_nfts_usdc, signed_offer, batch, loan_ids, borrower, bayc, now)
+    assert len(set(loan_ids)) == len(batch)
+    assert p2p_nfts_usdc.offer_count(signed_offer.offer.tracing_id) == len(batch)
+    for loan in loans:
+        assert compute_loan_hash(loan) == p2p_nfts_usdc.loans(loan.id)
+        assert bayc.ownerOf(loan.collateral_token_id) == p2p_nfts_usdc.address
+        assert delegation_registry.checkDelegateForERC721(
+            borrower, p2p_nfts_usdc.address, bayc.address, loan.collateral_token_id, ZERO_BYTES32
+        )
+
+
+def test_create_loans_logs_events(p2p_nfts_usdc, make_offer, collaterals, borrower, bayc, now):
+    signed_offer = make_offer(3)
+    batch = collaterals([1, 2, 3])
+
+    loan_ids = p2p_nfts_usdc.create_loans(signed_offer, batch, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+    events = get_events(p2p_nfts_usdc, "LoanCreated")
+    loans = _loans(p2p_nfts_usdc, signed_offer, batch, loan_ids, borrower, bayc, now)
+    assert [event.id for event in events] == loan_ids
+    for event, loan in zip(events, loans):
+        assert event.collateral_token_id == loan.collateral_token_id
+        assert event.borrower == borrower
+        assert event.lender == loan.lender
+        assert event.offer_id == loan.offer_id
+        assert event.fees == loan.fees
+
+
+def test_create_loans_aggregates_transfers(p2p_nfts_usdc, make_offer, collaterals, borrower, lender, broker, usdc):
+    signed_offer = make_offer(4)
+    batch = collaterals([1, 2, 3, 4])
+    protocol_wallet = p2p_nfts_usdc.protocol_wallet()
+    borrower_broker_fee = Fee.borrower_broker(boa.env.generate_address(), upfront_amount=5, settlement_bps=100)
+    protocol_upfront_fee = PROTOCOL_UPFRONT_FEE * PRINCIPAL // 10000
+    expected_amounts = {
+        borrower: len(batch) * (PRINCIPAL - ORIGINATION_FEE - protocol_upfront_fee - borrower_broker_fee.upfront_amount),
+        protocol_wallet: len(batch) * protocol_upfront_fee,
+        broker: len(batch) * BROKER_UPFRONT_FEE,
+        borrower_broker_fee.wallet: len(batch) * borrower_broker_fee.upfront_amount,
+    }
+    initial_balances = {wallet: usdc.balanceOf(wallet) for wallet in [*expected_amounts, lender]}
+
+    p2p_nfts_usdc.create_loans(
+        signed_offer,
+        batch,
+        borrower_broker_fee.upfront_amount,
+        borrower_broker_fee.settlement_bps,
+        borrower_broker_fee.wallet,
+        sender=borrower,
+    )
+
+    transfers = [
+        (e.sender, e.receiver, e.value) for e in get_events(p2p_nfts_usdc, "Transfer") if e.receiver in expected_amounts
+    ]
+    assert sorted(transfers) == sorted((lender, wallet, amount) for wallet, amount in expected_amounts.items())
+    for wallet, amount in expected_amounts.items():
+        assert usdc.balanceOf(wallet) == initial_balances[wallet] + amount
+    assert usdc.balanceOf(lender) == initial_balances[lender] - sum(expected_amounts.values())
+
+
+def test_create_loans_with_trait_offer(
+    p2p_nfts_usdc, p2p_control, make_offer, collaterals, borrower, bayc, bayc_key_hash, traits, now, debug_precompile
+):
+    token_ids = [1, 2, 3]
+    trait_name, trait_value = next((k, v[0]) for k, v in traits.items())
+    tree = TokenTraitTree([(bayc.address, trait_name, trait_value, token_id) for token_id in range(1, 20)])
+    p2p_control.change_collections_trait_roots([(bayc_key_hash, tree.root())], sender=p2p_nfts_usdc.owner())
+    signed_offer = make_offer(3, offer_type=OfferType.TRAIT, trait_hash=TokenTraitTree.trait_hash(trait_name, trait_value))
+    proofs = [tree.proof(TokenTraitTree.token_node(bayc.address, trait_name, trait_value, token_id)) for token_id in token_ids]
+    batch = collaterals(token_ids, proofs=proofs)
+
+    with boa.reverts("proof invalid"):
+        p2p_nfts_usdc.create_loans(
+            signed_offer, [*batch[:2], (3, proofs[0], ZERO_ADDRESS)], 0, 0, ZERO_ADDRESS, sender=borrower
+        )
+
+    loan_ids = p2p_nfts_usdc.create_loans(signed_offer, batch, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+    for loan in _loans(p2p_nfts_usdc, signed_offer, batch, loan_ids, borrower, bayc, now):
+        assert compute_loan_hash(loan) == p2p_nfts_usdc.loans(loan.id)
+
+
+def test_create_loans_gas_per_loan(p2p_nfts_usdc, make_offer, collaterals, borrower):
+    max_batch = 20
+    signed_offer = make_offer(max_batch)
+    batch = collaterals(range(1, max_batch + 1), delegate=borrower)
+
+    with boa.env.anchor():
+        p2p_nfts_usdc.create_loan(signed_offer, *batch[0], 0, 0, ZERO_ADDRESS, sender=borrower)
+        single_gas = p2p_nfts_usdc._computation.get_gas_used()
+
+    gas_per_loan = {}
+    for size in range(1, max_batch + 1):
+        with boa.env.anchor():
+            p2p_nfts_usdc.create_loans(signed_offer, batch[:size], 0, 0, ZERO_ADDRESS, sender=borrower)
+            gas_per_loan[size] = p2p_nfts_usdc._computation.get_gas_used() // size
+
+    print(f"create_loan: {single_gas}")
+    for size, gas in gas_per_loan.items():
+        print(f"create_loans x{size}: {gas} per loan")
+    assert all(gas_per_loan[size] < single_gas for size in range(2, max_batch + 1))
+    assert gas_per_loan[max_batch] < gas_per_loan[2]
@@ -0,0 +1,122 @@
+import boa
+import pytest
+
+from ...conftest_base import ZERO_ADDRESS, Fee, Loan, Offer, compute_loan_hash, compute_signed_offer_id, sign_offer
+
+TRANSFER_FROM = bytes.fromhex("23b872dd")
+OWNER_OF = bytes.fromhex("6352211e")
+
+
+@pytest.fixture(autouse=True)
+def lender_funds(lender, usdc):
+    usdc.mint(lender, 10**12)
+
+
+@pytest.fixture(autouse=True)
+def borrower_funds(borrower, usdc):
+    usdc.mint(borrower, 10**12)
+
+
+@pytest.fixture
+def offer(usdc, bayc_key_hash, lender, now):
+    return Offer(
+        principal=1000,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        collection_key_hash=bayc_key_hash,
+        token_id=1,
+        expiration=now + 100,
+        lender=lender,
+        pro_rata=False,
+    )
+
+
+def _erc721_calls(computation, collection):
+    calls = []
+    for child in computation.children:
+        if child.msg.code_address == collection.canonical_address:
+            calls.append(child.msg.data[:4])
+        calls.extend(_erc721_calls(child, collection))
+    return calls
+
+
+@pytest.fixture
+def ongoing_loan(p2p_nfts_usdc, offer, lender, lender_key, borrower, bayc, usdc, now):
+    signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+    bayc.mint(borrower, offer.token_id)
+    bayc.approve(p2p_nfts_usdc.address, offer.token_id, sender=borrower)
+    usdc.approve(p2p_nfts_usdc.address, offer.principal, sender=lender)
+    fees = [
+        Fee.protocol(p2p_nfts_usdc, offer.principal),
+        Fee.origination(offer),
+        Fee.lender_broker(offer),
+        Fee.borrower_broker(ZERO_ADDRESS),
+    ]
+
+    loan_id = p2p_nfts_usdc.create_loan(signed_offer, offer.token_id, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
+    return Loan(
+        id=loan_id,
+        offer_id=compute_signed_offer_id(signed_offer),
+        offer_tracing_id=offer.tracing_id,
+        amount=offer.principal,
+        interest=offer.interest,
+        payment_token=usdc.address,
+        maturity=now + offer.duration,
+        start_time=now,
+        borrower=borrower,
+        lender=lender,
+        collateral_contract=bayc.address,
+        collateral_token_id=offer.token_id,
+        fees=fees,
+        pro_rata=offer.pro_rata,
+    )
+
+
+def test_create_loan_reverts_if_collateral_owned_by_other_wallet(
+    p2p_nfts_usdc, offer, lender, lender_key, lender2, borrower, bayc, usdc
+):
+    signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+    bayc.mint(lender2, offer.token_id)
+    bayc.approve(p2p_nfts_usdc.address, offer.token_id, sender=lender2)
+    usdc.approve(p2p_nfts_usdc.address, offer.principal, sender=lender)
+
+    with boa.reverts("collateral not owned by wallet"):
+        p2p_nfts_usdc.create_loan(signed_offer, offer.token_id, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+
+def test_create_loan_stores_collateral_with_single_call(p2p_nfts_usdc, ongoing_loan, bayc):
+    assert _erc721_calls(p2p_nfts_usdc._computation, bayc.address) == [TRANSFER_FROM]
+    assert compute_loan_hash(ongoing_loan) == p2p_nfts_usdc.loans(ongoing_loan.id)
+    assert bayc.ownerOf(ongoing_loan.collateral_token_id) == p2p_nfts_usdc.address
+
+
+def test_settle_loan_releases_collateral_with_single_call(p2p_nfts_usdc, ongoing_loan, bayc, usdc):
+    usdc.approve(p2p_nfts_usdc.address, ongoing_loan.amount + ongoing_loan.interest, sender=ongoing_loan.borrower)
+    p2p_nfts_usdc.settle_loan(ongoing_loan, sender=ongoing_loan.borrower)
+
+    assert bayc.ownerOf(ongoing_loan.collateral_token_id) == ongoing_loan.borrower
+    assert _erc721_calls(p2p_nfts_usdc._computation, bayc.address) == [TRANSFER_FROM]
+
+
+def test_claim_defaulted_loan_collateral_with_single_call(p2p_nfts_usdc, ongoing_loan, bayc, now):
+    boa.env.time_travel(seconds=ongoing_loan.maturity - now + 1)
+    p2p_nfts_usdc.claim_defaulted_loan_collateral(ongoing_loan, sender=ongoing_loan.lender)
+
+    assert bayc.ownerOf(ongoing_loan.collateral_token_id) == ongoing_loan.lender
+    assert _erc721_calls(p2p_nfts_usdc._computation, bayc.address) == [TRANSFER_FROM]
+
+
+def test_custody_gas(p2p_nfts_usdc, ongoing_loan, usdc, now):
+    create_gas = p2p_nfts_usdc._computation.get_gas_used()
+
+    with boa.env.anchor():
+        usdc.approve(p2p_nfts_usdc.address, ongoing_loan.amount + ongoing_loan.interest, sender=ongoing_loan.borrower)
+        p2p_nfts_usdc.settle_loan(ongoing_loan, sender=ongoing_loan.borrower)
+        settle_gas = p2p_nfts_usdc._computation.get_gas_used()
+
+    boa.env.time_travel(seconds=ongoing_loan.maturity - now + 1)
+    p2p_nfts_usdc.claim_defaulted_loan_collateral(ongoing_loan, sender=ongoing_loan.lender)
+    claim_gas = p2p_nfts_usdc._computation.get_gas_used()
+
+    print(f"create_loan: {create_gas}, settle_loan: {settle_gas}, claim_defaulted_loan_collateral: {claim_gas}")
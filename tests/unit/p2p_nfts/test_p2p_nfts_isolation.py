@@ -0,0 +1,34 @@
+import boa
+
+
+def test_state_is_reverted(p2p_nfts_usdc, p2p_control, bayc, usdc, bayc_key_hash, borrower, owner):
+    # the changes are made in the same anchor the isolation fixture opens around each test
+    timestamp = boa.eval("block.timestamp")
+    with boa.env.anchor():
+        bayc.mint(borrower, 1)
+        usdc.mint(borrower, 10**6)
+        p2p_nfts_usdc.set_protocol_fee(100, 100, sender=owner)
+        p2p_control.change_collections_trait_roots([(bayc_key_hash, bayc_key_hash)], sender=owner)
+        boa.env.time_travel(seconds=3600)
+
+        assert bayc.balanceOf(borrower) == 1
+        assert usdc.balanceOf(borrower) == 10**6
+        assert p2p_nfts_usdc.protocol_upfront_fee() == 100  # noqa: PLR2004
+        assert p2p_control.trait_roots(bayc_key_hash) == bayc_key_hash
+
+    assert bayc.balanceOf(borrower) == 0
+    assert usdc.balanceOf(borrower) == 0
+    assert p2p_nfts_usdc.protocol_upfront_fee() == 0
+    assert p2p_control.trait_roots(bayc_key_hash) == b"\0" * 32
+    assert p2p_control.contracts(bayc_key_hash) == bayc.address
+    assert boa.eval("block.timestamp") == timestamp
+
+
+def test_golden_state_is_restored(p2p_nfts_usdc, p2p_control, usdc, cryptopunks, punks_key_hash, accounts, owner, lender):
+    assert boa.env.eoa == owner
+    assert p2p_nfts_usdc.owner() == owner
+    assert p2p_nfts_usdc.payment_token() == usdc.address
+    assert p2p_nfts_usdc.p2p_control() == p2p_control.address
+    assert p2p_control.contracts(punks_key_hash) == cryptopunks.address
+    assert boa.env.get_balance(lender) == 10**21
+    assert boa.env.generate_address() not in accounts
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from ...conftest_base import ZERO_ADDRESS, ZERO_BYTES32, Offer, OfferType, compute_signed_offer_id, sign_offer
+
+
+@pytest.fixture
+def lens(p2p_lending_lens_contract_def):
+    return p2p_lending_lens_contract_def.deploy()
+
+
+@pytest.fixture(autouse=True)
+def lender_funds(lender, usdc, p2p_nfts_usdc):
+    usdc.mint(lender, 10**12)
+    usdc.approve(p2p_nfts_usdc.address, 10**12, sender=lender)
+
+
+@pytest.fixture
+def offers(p2p_nfts_usdc, usdc, bayc_key_hash, lender, lender_key, now):
+    return [
+        sign_offer(
+            Offer(
+                principal=1000,
+                interest=100,
+                payment_token=usdc.address,
+                duration=100,
+                collection_key_hash=bayc_key_hash,
+                offer_type=OfferType.COLLECTION,
+                token_range_min=1,
+                token_range_max=100,
+                expiration=now + 100,
+                lender=lender,
+                size=3,
+                tracing_id=i.to_bytes(32, "big"),
+            ),
+            lender_key,
+            p2p_nfts_usdc.address,
+        )
+        for i in range(1, 4)
+    ]
+
+
+@pytest.fixture
+def loan_ids(p2p_nfts_usdc, offers, bayc, borrower, lender):
+    bayc.setApprovalForAll(p2p_nfts_usdc.address, True, sender=borrower)
+    loan_ids = []
+    for i, offer in enumerate(offers[:2]):
+        collaterals = [(token_id, [], ZERO_ADDRESS) for token_id in range(10 * i + 1, 10 * i + 2 + i)]
+        for token_id, _, _ in collaterals:
+            bayc.mint(borrower, token_id)
+        loan_ids += p2p_nfts_usdc.create_loans(offer, collaterals, 0, 0, ZERO_ADDRESS, sender=borrower)
+    p2p_nfts_usdc.revoke_offer(offers[2], sender=lender)
+    return loan_ids
+
+
+def test_get_loans(lens, p2p_nfts_usdc, loan_ids):
+    keys = [*loan_ids, os.urandom(32)]
+
+    loans = lens.get_loans(p2p_nfts_usdc.address, keys)
+
+    assert loans == [p2p_nfts_usdc.loans(key) for key in keys]
+    assert loans[-1] == ZERO_BYTES32
+    assert lens.get_loans(p2p_nfts_usdc.address, []) == []
+
+
+def test_get_offer_counts(lens, p2p_nfts_usdc, offers, loan_ids):
+    tracing_ids = [offer.offer.tracing_id for offer in offers]
+
+    counts = lens.get_offer_counts(p2p_nfts_usdc.address, tracing_ids)
+
+    assert counts == [p2p_nfts_usdc.offer_count(tracing_id) for tracing_id in tracing_ids]
+    assert counts == [1, 2, 0]
+
+
+def test_get_revoked_offers(lens, p2p_nfts_usdc, offers, loan_ids):
+    offer_ids = [compute_signed_offer_id(offer) for offer in offers]
+
+    revoked = lens.get_revoked_offers(p2p_nfts_usdc.address, offer_ids)
+
+    assert revoked == [p2p_nfts_usdc.revoked_offers(offer_id) for offer_id in offer_ids]
+    assert revoked == [False, False, True]
+
+
+def test_lens_gas_per_key(lens, p2p_nfts_usdc):
+    # the lens trades one RPC round trip per key for one external call per key inside a single eth_call
+    keys = [os.urandom(32) for _ in range(1024)]
+    readers = {"loans": lens.get_loans, "offer_count": lens.get_offer_counts, "revoked_offers": lens.get_revoked_offers}
+
+    for name, batch_getter in readers.items():
+        batch_getter(p2p_nfts_usdc.address, keys)
+        gas = lens._computation.get_gas_used()
+        print(f"{name}: {len(keys)} keys in one call, {gas // len(keys)} gas per key")
+        assert gas < 30_000_000
@@ -9,11 +9,10 @@ from ...conftest_base import (
     Loan,
     Offer,
     OfferType,
-    SignedOffer,
     compute_loan_hash,
     compute_signed_offer_id,
     get_last_event,
-    get_loan_mutations,
+    get_surviving_mutations,
     replace_namedtuple_field,
     sign_offer,
 )
@@ -196,10 +195,10 @@ def ongoing_loan_prorata(
 
 
 def test_replace_loan_reverts_if_loan_invalid(p2p_nfts_usdc, ongoing_loan_bayc, offer_bayc2):
-    for loan in get_loan_mutations(ongoing_loan_bayc):
-        print(f"{loan=}")
-        with boa.reverts("invalid loan"):
-            p2p_nfts_usdc.replace_loan(loan, offer_bayc2, [], 0, 0, ZERO_ADDRESS, sender=ongoing_loan_bayc.borrower)
+    def call(loan):
+        p2p_nfts_usdc.replace_loan(loan, offer_bayc2, [], 0, 0, ZERO_ADDRESS, sender=ongoing_loan_bayc.borrower)
+
+    assert get_surviving_mutations(call, ongoing_loan_bayc, "invalid loan") == []
 
 
 def test_replace_loan_reverts_if_loan_defaulted(p2p_nfts_usdc, ongoing_loan_bayc, now, offer_bayc2):
@@ -234,30 +233,10 @@ def test_replace_loan_reverts_if_offer_has_invalid_signature(p2p_nfts_usdc, ongo
     offer = offer_bayc2.offer
     signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
 
-    invalid_offers = [
-        replace_namedtuple_field(offer, principal=offer.principal + 1),
-        replace_namedtuple_field(offer, interest=offer.interest + 1),
-        replace_namedtuple_field(offer, payment_token=boa.env.generate_address("random")),
-        replace_namedtuple_field(offer, duration=offer.duration + 1),
-        replace_namedtuple_field(offer, origination_fee_amount=offer.origination_fee_amount + 1),
-        replace_namedtuple_field(offer, broker_upfront_fee_amount=offer.broker_upfront_fee_amount + 1),
-        replace_namedtuple_field(offer, broker_settlement_fee_bps=offer.broker_settlement_fee_bps + 1),
-        replace_namedtuple_field(offer, broker_address=boa.env.generate_address("random")),
-        replace_namedtuple_field(offer, collection_key_hash=b"1" * 32),
-        replace_namedtuple_field(offer, token_id=offer.token_id + 1),
-        replace_namedtuple_field(offer, expiration=offer.expiration + 1),
-        replace_namedtuple_field(offer, lender=boa.env.generate_address("random")),
-        replace_namedtuple_field(offer, pro_rata=not offer.pro_rata),
-        replace_namedtuple_field(offer, size=offer.size + 1),
-    ]
+    def call(signed_offer):
+        p2p_nfts_usdc.replace_loan(ongoing_loan_bayc, signed_offer, [], 0, 0, ZERO_ADDRESS, sender=ongoing_loan_bayc.borrower)
 
-    for invalid_offer in invalid_offers:
-        print(f"{invalid_offer=}")
-        with boa.reverts("offer not signed by lender"):
-            signed_offer = SignedOffer(invalid_offer, signed_offer.signature)
-            p2p_nfts_usdc.replace_loan(
-                ongoing_loan_bayc, signed_offer, [], 0, 0, ZERO_ADDRESS, sender=ongoing_loan_bayc.borrower
-            )
+    assert get_surviving_mutations(call, signed_offer, "offer not signed by lender") == []
 
 
 def test_replace_loan_reverts_if_offer_expired(
@@ -198,3 +198,67 @@ def test_revoke_offer_works_with_proxy(p2p_nfts_usdc, borrower, now, lender, len
     p2p_nfts_proxy.revoke_offer(signed_offer, sender=lender)
 
     assert p2p_nfts_usdc.revoked_offers(compute_signed_offer_id(signed_offer))
+
+
+def test_set_min_offer_nonce_reverts_if_not_increased(p2p_nfts_usdc, lender):
+    with boa.reverts("nonce not increased"):
+        p2p_nfts_usdc.set_min_offer_nonce(0, sender=lender)
+
+    p2p_nfts_usdc.set_min_offer_nonce(5, sender=lender)
+    with boa.reverts("nonce not increased"):
+        p2p_nfts_usdc.set_min_offer_nonce(5, sender=lender)
+
+
+def test_set_min_offer_nonce(p2p_nfts_usdc, lender, lender2):
+    p2p_nfts_usdc.set_min_offer_nonce(5, sender=lender)
+
+    assert p2p_nfts_usdc.min_offer_nonce(lender) == 5  # noqa: PLR2004
+    assert p2p_nfts_usdc.min_offer_nonce(lender2) == 0
+
+
+def test_set_min_offer_nonce_logs_event(p2p_nfts_usdc, lender):
+    p2p_nfts_usdc.set_min_offer_nonce(5, sender=lender)
+    p2p_nfts_usdc.set_min_offer_nonce(7, sender=lender)
+
+    event = get_last_event(p2p_nfts_usdc, "MinOfferNonceSet")
+    assert event.lender == lender
+    assert event.old_nonce == 5  # noqa: PLR2004
+    assert event.new_nonce == 7  # noqa: PLR2004
+
+
+def test_set_min_offer_nonce_works_with_proxy(p2p_nfts_usdc, lender, p2p_nfts_proxy):
+    p2p_nfts_usdc.set_proxy_authorization(p2p_nfts_proxy, True, sender=p2p_nfts_usdc.owner())
+    p2p_nfts_proxy.set_min_offer_nonce(5, sender=lender)
+
+    assert p2p_nfts_usdc.min_offer_nonce(lender) == 5  # noqa: PLR2004
+    assert p2p_nfts_usdc.min_offer_nonce(p2p_nfts_proxy.address) == 0
+
+
+def test_set_min_offer_nonce_uses_less_gas_than_revoke_offer(p2p_nfts_usdc, now, lender, lender_key):
+    offers = [
+        sign_offer(
+            Offer(
+                principal=1000,
+                interest=100,
+                offer_type=OfferType.COLLECTION,
+                expiration=now + 100,
+                lender=lender,
+                tracing_id=tracing_id.to_bytes(32, "big"),
+            ),
+            lender_key,
+            p2p_nfts_usdc.address,
+        )
+        for tracing_id in range(10)
+    ]
+
+    with boa.env.anchor():
+        revoke_gas = 0
+        for offer in offers:
+            p2p_nfts_usdc.revoke_offer(offer, sender=lender)
+            revoke_gas += p2p_nfts_usdc._computation.get_gas_used()
+
+    p2p_nfts_usdc.set_min_offer_nonce(1, sender=lender)
+    nonce_gas = p2p_nfts_usdc._computation.get_gas_used()
+
+    print(f"revoke_offer x{len(offers)}: {revoke_gas}, set_min_offer_nonce: {nonce_gas}")
+    assert nonce_gas < revoke_gas / len(offers)
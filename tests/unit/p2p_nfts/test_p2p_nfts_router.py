@@ -0,0 +1,298 @@
+from textwrap import dedent
+
+import boa
+import pytest
+from eth_account import Account
+from eth_account.messages import encode_structured_data
+
+from ...conftest_base import (
+    ZERO_ADDRESS,
+    ZERO_BYTES32,
+    Fee,
+    Loan,
+    Offer,
+    compute_loan_hash,
+    compute_signed_offer_id,
+    sign_offer,
+)
+
+PRINCIPAL = 1000
+INTEREST = 100
+
+
+@pytest.fixture
+def token(erc20_permit_contract_def):
+    return erc20_permit_contract_def.deploy("Permit Token")
+
+
+@pytest.fixture
+def p2p_nfts(p2p_lending_nfts_contract_def, token, delegation_registry, cryptopunks, owner, p2p_control):
+    return p2p_lending_nfts_contract_def.deploy(
+        token, p2p_control, delegation_registry, cryptopunks, 0, 0, owner, 10000, 10000, 10000, 10000, False
+    )
+
+
+@pytest.fixture
+def router(p2p_lending_router_contract_def, p2p_nfts, owner):
+    router = p2p_lending_router_contract_def.deploy(p2p_nfts.address)
+    p2p_nfts.set_proxy_authorization(router.address, True, sender=owner)
+    return router
+
+
+@pytest.fixture(autouse=True)
+def funds(p2p_nfts, token, lender, borrower):
+    for wallet in [lender, borrower]:
+        token.mint(wallet, 10**12)
+    token.approve(p2p_nfts.address, 10**12, sender=lender)
+
+
+@pytest.fixture
+def make_offer(p2p_nfts, token, bayc_key_hash, lender, lender_key, now):
+    def _make_offer(token_id, **kwargs):
+        offer = Offer(
+            principal=PRINCIPAL,
+            interest=INTEREST,
+            payment_token=token.address,
+            duration=100,
+            collection_key_hash=bayc_key_hash,
+            token_id=token_id,
+            expiration=now + 100,
+            lender=lender,
+            pro_rata=False,
+            size=1,
+            tracing_id=token_id.to_bytes(32, "big"),
+        )
+        return sign_offer(offer._replace(**kwargs), lender_key, p2p_nfts.address)
+
+    return _make_offer
+
+
+@pytest.fixture
+def mint_collateral(p2p_nfts, bayc, borrower):
+    def _mint_collateral(token_id):
+        bayc.mint(borrower, token_id)
+        bayc.approve(p2p_nfts.address, token_id, sender=borrower)
+
+    return _mint_collateral
+
+
+@pytest.fixture
+def ongoing_loan(p2p_nfts, make_offer, mint_collateral, bayc, borrower, now):
+    signed_offer = make_offer(1)
+    mint_collateral(1)
+    loan_id = p2p_nfts.create_loan(signed_offer, 1, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
+    loan = _loan(p2p_nfts, signed_offer, loan_id, borrower, bayc, now)
+    assert compute_loan_hash(loan) == p2p_nfts.loans(loan_id)
+    return loan
+
+
+def _loan(p2p_nfts, signed_offer, loan_id, borrower, bayc, now):
+    offer = signed_offer.offer
+    return Loan(
+        id=loan_id,
+        offer_id=compute_signed_offer_id(signed_offer),
+        offer_tracing_id=offer.tracing_id,
+        amount=offer.principal,
+        interest=offer.interest,
+        payment_token=offer.payment_token,
+        maturity=now + offer.duration,
+        start_time=now,
+        borrower=borrower,
+        lender=offer.lender,
+        collateral_contract=bayc.address,
+        collateral_token_id=offer.token_id,
+        fees=[
+            Fee.protocol(p2p_nfts, offer.principal),
+            Fee.origination(offer),
+            Fee.lender_broker(offer),
+            Fee.borrower_broker(ZERO_ADDRESS),
+        ],
+        pro_rata=offer.pro_rata,
+    )
+
+
+def _create_loan_call(p2p_nfts, signed_offer):
+    return p2p_nfts.create_loan.prepare_calldata(
+        signed_offer, signed_offer.offer.token_id, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS
+    )
+
+
+def sign_permit(token, owner_key, spender, value, deadline):
+    owner = Account.from_key(owner_key).address
+    typed_data = {
+        "types": {
+            "EIP712Domain": [
+                {"name": "name", "type": "string"},
+                {"name": "version", "type": "string"},
+                {"name": "chainId", "type": "uint256"},
+                {"name": "verifyingContract", "type": "address"},
+            ],
+            "Permit": [
+                {"name": "owner", "type": "address"},
+                {"name": "spender", "type": "address"},
+                {"name": "value", "type": "uint256"},
+                {"name": "nonce", "type": "uint256"},
+                {"name": "deadline", "type": "uint256"},
+            ],
+        },
+        "primaryType": "Permit",
+        "domain": {
+            "name": token.name(),
+            "version": "1",
+            "chainId": boa.eval("chain.id"),
+            "verifyingContract": token.address,
+        },
+        "message": {
+            "owner": owner,
+            "spender": spender,
+            "value": value,
+            "nonce": token.nonces(owner),
+            "deadline": deadline,
+        },
+    }
+    signed_msg = Account.from_key(owner_key).sign_message(encode_structured_data(typed_data))
+    return (value, deadline, signed_msg.v, signed_msg.r.to_bytes(32, "big"), signed_msg.s.to_bytes(32, "big"))
+
+
+def test_initial_state(router, p2p_nfts, token):
+    assert router.p2p_lending_nfts() == p2p_nfts.address
+    assert router.payment_token() == token.address
+
+
+def test_multicall_reverts_if_call_not_allowed(router, p2p_nfts, owner):
+    with boa.reverts("call not allowed"):
+        router.multicall([p2p_nfts.set_protocol_fee.prepare_calldata(0, 0)], sender=owner)
+
+    with boa.reverts("call not allowed"):
+        router.multicall([p2p_nfts.claim_pending_transfers.prepare_calldata()], sender=owner)
+
+
+def test_multicall_reverts_if_caller_not_eoa(router, p2p_nfts, make_offer, borrower):
+    caller = boa.loads(
+        dedent(
+            """
+            @external
+            def call(router: address, data: Bytes[4096]):
+                raw_call(router, data)
+            """
+        )
+    )
+    router_call_data = router.multicall.prepare_calldata([p2p_nfts.revoke_offer.prepare_calldata(make_offer(1))])
+
+    with boa.reverts("caller is not an EOA"):
+        caller.call(router.address, router_call_data, sender=borrower)
+
+
+def test_multicall_reverts_with_call_reason(router, p2p_nfts, make_offer, mint_collateral, borrower, now):
+    mint_collateral(1)
+    signed_offer = make_offer(1, expiration=now)
+
+    with boa.reverts("offer expired"):
+        router.multicall([_create_loan_call(p2p_nfts, signed_offer)], sender=borrower)
+
+
+def test_multicall_reverts_if_router_not_authorized(router, p2p_nfts, ongoing_loan, owner):
+    p2p_nfts.set_proxy_authorization(router.address, False, sender=owner)
+
+    with boa.reverts("not borrower"):
+        router.multicall([p2p_nfts.settle_loan.prepare_calldata(ongoing_loan)], sender=ongoing_loan.borrower)
+
+
+def test_multicall_creates_loans_for_caller(router, p2p_nfts, make_offer, mint_collateral, borrower, bayc, token, now):
+    offers = [make_offer(token_id) for token_id in [1, 2]]
+    for token_id in [1, 2]:
+        mint_collateral(token_id)
+    initial_balance = token.balanceOf(borrower)
+
+    results = router.multicall([_create_loan_call(p2p_nfts, offer) for offer in offers], sender=borrower)
+
+    assert token.balanceOf(borrower) == initial_balance + 2 * PRINCIPAL
+    for result, offer in zip(results, offers):
+        loan = _loan(p2p_nfts, offer, result, borrower, bayc, now)
+        assert compute_loan_hash(loan) == p2p_nfts.loans(loan.id)
+        assert bayc.ownerOf(offer.offer.token_id) == p2p_nfts.address
+
+
+def test_multicall_settles_and_creates_with_permit(
+    router, p2p_nfts, token, make_offer, mint_collateral, ongoing_loan, borrower, borrower_key, bayc, now
+):
+    new_offer = make_offer(2)
+    mint_collateral(2)
+    permit = sign_permit(token, borrower_key, p2p_nfts.address, PRINCIPAL + INTEREST, now + 100)
+
+    results = router.multicall(
+        [p2p_nfts.settle_loan.prepare_calldata(ongoing_loan), _create_loan_call(p2p_nfts, new_offer)],
+        permit,
+        sender=borrower,
+    )
+
+    assert results[0] == b""
+    assert p2p_nfts.loans(ongoing_loan.id) == ZERO_BYTES32
+    assert bayc.ownerOf(1) == borrower
+    new_loan = _loan(p2p_nfts, new_offer, results[1], borrower, bayc, now)
+    assert compute_loan_hash(new_loan) == p2p_nfts.loans(new_loan.id)
+    assert token.allowance(borrower, p2p_nfts.address) == 0
+
+
+def test_multicall_ignores_failed_permit(router, p2p_nfts, token, ongoing_loan, borrower, borrower_key, now):
+    permit = sign_permit(token, borrower_key, p2p_nfts.address, PRINCIPAL + INTEREST, now + 100)
+    token.permit(borrower, p2p_nfts.address, *permit[:2], *permit[2:], sender=borrower)
+
+    router.multicall([p2p_nfts.settle_loan.prepare_calldata(ongoing_loan)], permit, sender=borrower)
+
+    assert p2p_nfts.loans(ongoing_loan.id) == ZERO_BYTES32
+
+
+def test_multicall_replaces_loan(router, p2p_nfts, token, make_offer, ongoing_loan, borrower, lender2, lender2_key):
+    token.mint(lender2, 10**12)
+    token.approve(p2p_nfts.address, 10**12, sender=lender2)
+    token.approve(p2p_nfts.address, INTEREST, sender=borrower)
+    offer = sign_offer(
+        make_offer(1).offer._replace(lender=lender2, tracing_id=b"new".zfill(32)), lender2_key, p2p_nfts.address
+    )
+
+    results = router.multicall(
+        [p2p_nfts.replace_loan.prepare_calldata(ongoing_loan, offer, [], 0, 0, ZERO_ADDRESS)], sender=borrower
+    )
+
+    assert p2p_nfts.loans(ongoing_loan.id) == ZERO_BYTES32
+    assert p2p_nfts.loans(results[0]) != ZERO_BYTES32
+
+
+def test_multicall_revokes_offers_of_caller(router, p2p_nfts, make_offer, lender):
+    offers = [make_offer(token_id) for token_id in [1, 2]]
+
+    router.multicall([p2p_nfts.revoke_offer.prepare_calldata(offer) for offer in offers], sender=lender)
+
+    for offer in offers:
+        assert p2p_nfts.revoked_offers(compute_signed_offer_id(offer))
+
+
+def _tx_gas(contract, function, *args):
+    calldata_gas = sum(16 if b else 4 for b in function.prepare_calldata(*args))
+    return 21000 + calldata_gas + contract._computation.get_gas_used()
+
+
+def test_multicall_gas_against_separate_transactions(
+    router, p2p_nfts, token, make_offer, mint_collateral, ongoing_loan, borrower, borrower_key, now
+):
+    new_offer = make_offer(2)
+    mint_collateral(2)
+    settle_call = p2p_nfts.settle_loan.prepare_calldata(ongoing_loan)
+    create_call = _create_loan_call(p2p_nfts, new_offer)
+    create_args = (new_offer, 2, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS)
+
+    with boa.env.anchor():
+        token.approve(p2p_nfts.address, PRINCIPAL + INTEREST, sender=borrower)
+        separate_gas = _tx_gas(token, token.approve, p2p_nfts.address, PRINCIPAL + INTEREST)
+        p2p_nfts.settle_loan(ongoing_loan, sender=borrower)
+        separate_gas += _tx_gas(p2p_nfts, p2p_nfts.settle_loan, ongoing_loan)
+        p2p_nfts.create_loan(*create_args, sender=borrower)
+        separate_gas += _tx_gas(p2p_nfts, p2p_nfts.create_loan, *create_args)
+
+    permit = sign_permit(token, borrower_key, p2p_nfts.address, PRINCIPAL + INTEREST, now + 100)
+    router.multicall([settle_call, create_call], permit, sender=borrower)
+    router_gas = _tx_gas(router, router.multicall, [settle_call, create_call], permit)
+
+    print(f"approve + settle_loan + create_loan: {separate_gas}, multicall with permit: {router_gas}")
+    assert router_gas < separate_gas
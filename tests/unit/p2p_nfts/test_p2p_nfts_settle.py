@@ -14,8 +14,9 @@ from ...conftest_base import (
     Offer,
     compute_loan_hash,
     compute_signed_offer_id,
+    get_events,
     get_last_event,
-    get_loan_mutations,
+    get_surviving_mutations,
     sign_offer,
 )
 
@@ -290,10 +291,10 @@ def ongoing_loan_prorata(p2p_nfts_usdc, offer_bayc, usdc, borrower, lender, bayc
 
 
 def test_settle_loan_reverts_if_loan_invalid(p2p_nfts_usdc, ongoing_loan_bayc):
-    for loan in get_loan_mutations(ongoing_loan_bayc):
-        print(f"{loan=}")
-        with boa.reverts("invalid loan"):
-            p2p_nfts_usdc.settle_loan(loan, sender=ongoing_loan_bayc.borrower)
+    def call(loan):
+        p2p_nfts_usdc.settle_loan(loan, sender=ongoing_loan_bayc.borrower)
+
+    assert get_surviving_mutations(call, ongoing_loan_bayc, "invalid loan") == []
 
 
 def test_settle_loan_reverts_if_loan_defaulted(p2p_nfts_usdc, ongoing_loan_bayc, now):
@@ -570,6 +571,87 @@ def test_settle_loan_doesnt_transfer_excess_amount_from_borrower(p2p_nfts_usdc,
     assert usdc.balanceOf(ongoing_loan_bayc.borrower) == initial_borrower_balance - amount_to_settle
 
 
+@pytest.mark.parametrize(
+    ("protocol_settlement_fee", "lender_broker_settlement_fee", "borrower_broker_settlement_fee"),
+    [(0, 0, 0), (1000, 0, 0), (1000, 200, 0), (1000, 200, 300)],
+)
+def test_settle_loan_pays_directly_from_borrower(
+    p2p_nfts_usdc,
+    usdc,
+    bayc,
+    bayc_key_hash,
+    borrower,
+    lender,
+    lender_key,
+    now,
+    protocol_settlement_fee,
+    lender_broker_settlement_fee,
+    borrower_broker_settlement_fee,
+):
+    token_id = 1
+    lender_broker = boa.env.generate_address() if lender_broker_settlement_fee else ZERO_ADDRESS
+    borrower_broker = boa.env.generate_address() if borrower_broker_settlement_fee else ZERO_ADDRESS
+    offer = Offer(
+        principal=1000,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        broker_settlement_fee_bps=lender_broker_settlement_fee,
+        broker_address=lender_broker,
+        collection_key_hash=bayc_key_hash,
+        token_id=token_id,
+        expiration=now + 100,
+        lender=lender,
+        pro_rata=False,
+        size=1,
+    )
+    signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+    bayc.mint(borrower, token_id)
+    bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+    usdc.approve(p2p_nfts_usdc.address, offer.principal, sender=lender)
+    p2p_nfts_usdc.set_protocol_fee(0, protocol_settlement_fee, sender=p2p_nfts_usdc.owner())
+    p2p_nfts_usdc.change_protocol_wallet(p2p_nfts_usdc.owner(), sender=p2p_nfts_usdc.owner())
+
+    loan_id = p2p_nfts_usdc.create_loan(
+        signed_offer, token_id, [], ZERO_ADDRESS, 0, borrower_broker_settlement_fee, borrower_broker, sender=borrower
+    )
+    loan = Loan(
+        id=loan_id,
+        offer_id=compute_signed_offer_id(signed_offer),
+        offer_tracing_id=offer.tracing_id,
+        amount=offer.principal,
+        interest=offer.interest,
+        payment_token=offer.payment_token,
+        maturity=now + offer.duration,
+        start_time=now,
+        borrower=borrower,
+        lender=lender,
+        collateral_contract=bayc.address,
+        collateral_token_id=token_id,
+        fees=[
+            Fee.protocol(p2p_nfts_usdc, offer.principal),
+            Fee.origination(offer),
+            Fee.lender_broker(offer),
+            Fee.borrower_broker(borrower_broker, 0, borrower_broker_settlement_fee),
+        ],
+        pro_rata=offer.pro_rata,
+    )
+    borrower_broker_fee_amount = loan.calc_borrower_broker_settlement_fee(now)
+    usdc.approve(p2p_nfts_usdc.address, loan.amount + loan.interest + borrower_broker_fee_amount, sender=borrower)
+
+    p2p_nfts_usdc.settle_loan(loan, sender=borrower)
+    gas = p2p_nfts_usdc._computation.get_gas_used()
+
+    recipients = 1 + sum(
+        1 for fee in (protocol_settlement_fee, lender_broker_settlement_fee, borrower_broker_settlement_fee) if fee
+    )
+    transfers = [e for e in get_events(p2p_nfts_usdc, "Transfer") if e.sender == borrower]
+    assert len(transfers) == recipients
+    assert usdc.balanceOf(p2p_nfts_usdc.address) == 0
+    print(f"settle_loan with {recipients} recipients: {gas}")
+
+
 def test_settle_loan_transfers_collateral_to_borrower_erc721(p2p_nfts_usdc, ongoing_loan_bayc, usdc, bayc, now):
     loan = ongoing_loan_bayc
     borrower_broker_fee = loan.calc_borrower_broker_settlement_fee(now)
@@ -770,18 +852,24 @@ def test_settle_loan_creates_pending_transfer_on_erc20_transfer_fail(
 ):
     failing_erc20_code = dedent("""
 
+            failing_receiver: address
+
+            @external
+            def __init__(_failing_receiver: address):
+                self.failing_receiver = _failing_receiver
+
             @external
             def transfer(_to : address, _value : uint256) -> bool:
                 return False
 
             @external
             def transferFrom(_from : address, _to : address, _value : uint256) -> bool:
-                return True
+                return _to != self.failing_receiver
 
             """)
-    erc20 = boa.loads(failing_erc20_code)
+    erc20 = boa.loads(failing_erc20_code, lender)
     p2p_nfts_erc20 = p2p_lending_nfts_contract_def.deploy(
-        erc20, p2p_control, delegation_registry, cryptopunks, 0, 0, owner, 0, 0, 0, 0
+        erc20, p2p_control, delegation_registry, cryptopunks, 0, 0, owner, 0, 0, 0, 0, False
     )
     p2p_control.change_collections_contracts([CollectionContract(bayc_key_hash, bayc.address)])
 
@@ -0,0 +1,250 @@
+import boa
+import pytest
+
+from ...conftest_base import (
+    ZERO_ADDRESS,
+    ZERO_BYTES32,
+    Fee,
+    FeeAmount,
+    Loan,
+    Offer,
+    compute_loan_hash,
+    compute_signed_offer_id,
+    get_events,
+    get_surviving_mutations,
+    sign_offer,
+)
+
+
+@pytest.fixture(autouse=True)
+def lender_funds(lender, lender2, usdc):
+    usdc.mint(lender, 10**12)
+    usdc.mint(lender2, 10**12)
+
+
+@pytest.fixture(autouse=True)
+def borrower_funds(borrower, usdc):
+    usdc.mint(borrower, 10**12)
+
+
+@pytest.fixture
+def broker():
+    return boa.env.generate_address()
+
+
+@pytest.fixture
+def borrower_broker_fee():
+    return Fee.borrower_broker(boa.env.generate_address(), upfront_amount=15, settlement_bps=300)
+
+
+@pytest.fixture
+def protocol_fees(p2p_nfts_usdc):
+    p2p_nfts_usdc.set_protocol_fee(11, 1000, sender=p2p_nfts_usdc.owner())
+    p2p_nfts_usdc.change_protocol_wallet(p2p_nfts_usdc.owner(), sender=p2p_nfts_usdc.owner())
+
+
+@pytest.fixture
+def create_loan(p2p_nfts_usdc, usdc, bayc, bayc_key_hash, borrower, broker, borrower_broker_fee, now, protocol_fees):
+    def _create_loan(token_id, lender, lender_key, *, principal=1000, interest=100, pro_rata=False, delegate=borrower):
+        offer = Offer(
+            principal=principal,
+            interest=interest,
+            payment_token=usdc.address,
+            duration=100,
+            origination_fee_amount=10,
+            broker_upfront_fee_amount=15,
+            broker_settlement_fee_bps=200,
+            broker_address=broker,
+            collection_key_hash=bayc_key_hash,
+            token_id=token_id,
+            expiration=now + 100,
+            lender=lender,
+            pro_rata=pro_rata,
+            size=1,
+            tracing_id=token_id.to_bytes(32, "big"),
+        )
+        signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+        bayc.mint(borrower, token_id)
+        bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+        usdc.approve(p2p_nfts_usdc.address, principal - 10 + 15, sender=lender)
+
+        loan_id = p2p_nfts_usdc.create_loan(
+            signed_offer,
+            token_id,
+            [],
+            delegate,
+            borrower_broker_fee.upfront_amount,
+            borrower_broker_fee.settlement_bps,
+            borrower_broker_fee.wallet,
+            sender=borrower,
+        )
+        loan = Loan(
+            id=loan_id,
+            offer_id=compute_signed_offer_id(signed_offer),
+            offer_tracing_id=offer.tracing_id,
+            amount=principal,
+            interest=interest,
+            payment_token=usdc.address,
+            maturity=now + offer.duration,
+            start_time=now,
+            borrower=borrower,
+            lender=lender,
+            collateral_contract=bayc.address,
+            collateral_token_id=token_id,
+            fees=[
+                Fee.protocol(p2p_nfts_usdc, principal),
+                Fee.origination(offer),
+                Fee.lender_broker(offer),
+                borrower_broker_fee,
+            ],
+            pro_rata=pro_rata,
+            delegate=delegate,
+        )
+        assert compute_loan_hash(loan) == p2p_nfts_usdc.loans(loan_id)
+        return loan
+
+    return _create_loan
+
+
+@pytest.fixture
+def ongoing_loans(create_loan, lender, lender_key, lender2, lender2_key):
+    return [
+        create_loan(1, lender, lender_key),
+        create_loan(2, lender, lender_key, principal=2000, interest=300, delegate=ZERO_ADDRESS),
+        create_loan(3, lender2, lender2_key, principal=3000, interest=600, pro_rata=True),
+    ]
+
+
+def _settlement(loan, timestamp):
+    interest = loan.get_interest(timestamp)
+    fees = [FeeAmount(fee.type, interest * fee.settlement_bps // 10000, fee.wallet) for fee in loan.fees if fee.settlement_bps]
+    borrower_broker_fee = loan.calc_borrower_broker_settlement_fee(timestamp)
+    lender_amount = loan.amount + interest - sum(fee.amount for fee in fees) + borrower_broker_fee
+    return interest, fees, loan.amount + interest + borrower_broker_fee, lender_amount
+
+
+def _amount_to_settle(loans, timestamp):
+    return sum(_settlement(loan, timestamp)[2] for loan in loans)
+
+
+def test_settle_loans_reverts_if_loan_invalid(p2p_nfts_usdc, ongoing_loans, usdc, now):
+    usdc.approve(p2p_nfts_usdc.address, _amount_to_settle(ongoing_loans, now), sender=ongoing_loans[0].borrower)
+
+    def call(loan):
+        p2p_nfts_usdc.settle_loans([ongoing_loans[0], loan], sender=ongoing_loans[0].borrower)
+
+    assert get_surviving_mutations(call, ongoing_loans[1], "invalid loan") == []
+
+
+def test_settle_loans_reverts_if_loan_repeated(p2p_nfts_usdc, ongoing_loans, usdc, now):
+    usdc.approve(p2p_nfts_usdc.address, 2 * _amount_to_settle(ongoing_loans, now), sender=ongoing_loans[0].borrower)
+
+    with boa.reverts("invalid loan"):
+        p2p_nfts_usdc.settle_loans([*ongoing_loans, ongoing_loans[0]], sender=ongoing_loans[0].borrower)
+
+
+def test_settle_loans_reverts_if_loan_defaulted(p2p_nfts_usdc, ongoing_loans, usdc, now):
+    boa.env.time_travel(seconds=ongoing_loans[0].maturity - now + 1)
+    usdc.approve(p2p_nfts_usdc.address, _amount_to_settle(ongoing_loans, now), sender=ongoing_loans[0].borrower)
+
+    with boa.reverts("loan defaulted"):
+        p2p_nfts_usdc.settle_loans(ongoing_loans, sender=ongoing_loans[0].borrower)
+
+
+def test_settle_loans_reverts_if_not_borrower(p2p_nfts_usdc, ongoing_loans, usdc, now):
+    with boa.reverts("not borrower"):
+        p2p_nfts_usdc.settle_loans(ongoing_loans, sender=ongoing_loans[0].lender)
+
+
+def test_settle_loans_reverts_if_funds_not_approved(p2p_nfts_usdc, ongoing_loans, usdc, now):
+    usdc.approve(p2p_nfts_usdc.address, _amount_to_settle(ongoing_loans, now) - 1, sender=ongoing_loans[0].borrower)
+
+    with boa.reverts():
+        p2p_nfts_usdc.settle_loans(ongoing_loans, sender=ongoing_loans[0].borrower)
+
+
+def test_settle_loans(p2p_nfts_usdc, ongoing_loans, usdc, bayc, delegation_registry, now):
+    borrower = ongoing_loans[0].borrower
+    actual_duration = 60
+    boa.env.time_travel(seconds=actual_duration)
+    amount_to_settle = _amount_to_settle(ongoing_loans, now + actual_duration)
+    initial_borrower_balance = usdc.balanceOf(borrower)
+
+    usdc.approve(p2p_nfts_usdc.address, amount_to_settle + 1, sender=borrower)
+    p2p_nfts_usdc.settle_loans(ongoing_loans, sender=borrower)
+
+    assert usdc.balanceOf(p2p_nfts_usdc.address) == 0
+    assert usdc.balanceOf(borrower) == initial_borrower_balance - amount_to_settle
+    for loan in ongoing_loans:
+        assert p2p_nfts_usdc.loans(loan.id) == ZERO_BYTES32
+        assert p2p_nfts_usdc.offer_count(loan.offer_tracing_id) == 0
+        assert bayc.ownerOf(loan.collateral_token_id) == borrower
+        assert not delegation_registry.checkDelegateForERC721(
+            borrower, p2p_nfts_usdc.address, loan.collateral_contract, loan.collateral_token_id, ZERO_BYTES32
+        )
+
+
+def test_settle_loans_aggregates_payouts(p2p_nfts_usdc, ongoing_loans, usdc, now):
+    borrower = ongoing_loans[0].borrower
+    expected_balances = {}
+    for loan in ongoing_loans:
+        _, fees, _, lender_amount = _settlement(loan, now)
+        expected_balances[loan.lender] = expected_balances.get(loan.lender, 0) + lender_amount
+        for fee in fees:
+            expected_balances[fee.wallet] = expected_balances.get(fee.wallet, 0) + fee.amount
+    initial_balances = {wallet: usdc.balanceOf(wallet) for wallet in expected_balances}
+
+    usdc.approve(p2p_nfts_usdc.address, _amount_to_settle(ongoing_loans, now), sender=borrower)
+    p2p_nfts_usdc.settle_loans(ongoing_loans, sender=borrower)
+
+    for wallet, amount in expected_balances.items():
+        assert usdc.balanceOf(wallet) == initial_balances[wallet] + amount
+
+    transfers = [(e.sender, e.receiver) for e in get_events(p2p_nfts_usdc, "Transfer") if e.receiver in expected_balances]
+    assert sorted(transfers) == sorted((borrower, wallet) for wallet in expected_balances)
+
+
+def test_settle_loans_logs_events(p2p_nfts_usdc, ongoing_loans, usdc, now):
+    borrower = ongoing_loans[0].borrower
+    usdc.approve(p2p_nfts_usdc.address, _amount_to_settle(ongoing_loans, now), sender=borrower)
+    p2p_nfts_usdc.settle_loans(ongoing_loans, sender=borrower)
+
+    events = get_events(p2p_nfts_usdc, "LoanPaid")
+    assert len(events) == len(ongoing_loans)
+    for event, loan in zip(events, ongoing_loans):
+        interest, fees, _, _ = _settlement(loan, now)
+        assert event.id == loan.id
+        assert event.borrower == loan.borrower
+        assert event.lender == loan.lender
+        assert event.payment_token == loan.payment_token
+        assert event.paid_principal == loan.amount
+        assert event.paid_interest == interest
+        assert event.paid_settlement_fees == fees
+
+
+def test_settle_loans_creates_pending_transfer_on_erc20_transfer_fail(p2p_nfts_usdc, ongoing_loans, usdc, lender, now):
+    borrower = ongoing_loans[0].borrower
+    usdc.blacklist(lender, True)
+    usdc.approve(p2p_nfts_usdc.address, _amount_to_settle(ongoing_loans, now), sender=borrower)
+    p2p_nfts_usdc.settle_loans(ongoing_loans, sender=borrower)
+
+    lender_amount = sum(_settlement(loan, now)[3] for loan in ongoing_loans if loan.lender == lender)
+    assert p2p_nfts_usdc.pending_transfers(lender) == lender_amount
+
+
+def test_settle_loans_uses_less_gas_than_settle_loan(p2p_nfts_usdc, ongoing_loans, usdc, now):
+    borrower = ongoing_loans[0].borrower
+    usdc.approve(p2p_nfts_usdc.address, 2 * _amount_to_settle(ongoing_loans, now), sender=borrower)
+
+    with boa.env.anchor():
+        single_gas = 0
+        for loan in ongoing_loans:
+            p2p_nfts_usdc.settle_loan(loan, sender=borrower)
+            single_gas += p2p_nfts_usdc._computation.get_gas_used()
+
+    p2p_nfts_usdc.settle_loans(ongoing_loans, sender=borrower)
+    batch_gas = p2p_nfts_usdc._computation.get_gas_used()
+
+    print(f"settle_loan x{len(ongoing_loans)}: {single_gas}, settle_loans: {batch_gas}")
+    assert batch_gas < single_gas
@@ -0,0 +1,208 @@
+import boa
+import pytest
+
+from ...conftest_base import (
+    ZERO_ADDRESS,
+    Fee,
+    FeeAmount,
+    FeeType,
+    Loan,
+    Offer,
+    compute_loan_hash,
+    compute_signed_offer_id,
+    get_last_event,
+    sign_offer,
+)
+
+PROTOCOL_SETTLEMENT_FEE = 1000
+
+
+@pytest.fixture
+def p2p_nfts_sparse(p2p_lending_nfts_contract_def, usdc, delegation_registry, cryptopunks, owner, p2p_control):
+    return p2p_lending_nfts_contract_def.deploy(
+        usdc, p2p_control, delegation_registry, cryptopunks, 0, 0, owner, 10000, 10000, 10000, 10000, True
+    )
+
+
+@pytest.fixture(autouse=True)
+def funds(p2p_nfts_usdc, p2p_nfts_sparse, usdc, lender, lender2, borrower):
+    for wallet in [lender, lender2, borrower]:
+        usdc.mint(wallet, 10**12)
+        usdc.approve(p2p_nfts_usdc.address, 10**12, sender=wallet)
+        usdc.approve(p2p_nfts_sparse.address, 10**12, sender=wallet)
+    for p2p_nfts in [p2p_nfts_usdc, p2p_nfts_sparse]:
+        p2p_nfts.set_protocol_fee(0, PROTOCOL_SETTLEMENT_FEE, sender=p2p_nfts.owner())
+        p2p_nfts.change_protocol_wallet(p2p_nfts.owner(), sender=p2p_nfts.owner())
+
+
+@pytest.fixture
+def make_offer(usdc, bayc_key_hash, now):
+    def _make_offer(p2p_nfts, lender, lender_key, token_id, tracing_id, duration=100):
+        offer = Offer(
+            principal=1000,
+            interest=100,
+            payment_token=usdc.address,
+            duration=duration,
+            collection_key_hash=bayc_key_hash,
+            token_id=token_id,
+            expiration=now + 100,
+            lender=lender,
+            pro_rata=True,
+            size=1,
+            tracing_id=tracing_id,
+        )
+        return sign_offer(offer, lender_key, p2p_nfts.address)
+
+    return _make_offer
+
+
+def _loan_fees(p2p_nfts, offer, borrower_broker_fee):
+    fees = [Fee.protocol(p2p_nfts, offer.principal), Fee.origination(offer), Fee.lender_broker(offer), borrower_broker_fee]
+    if p2p_nfts.sparse_fees():
+        return [fee for fee in fees if fee.upfront_amount or fee.settlement_bps]
+    return fees
+
+
+@pytest.fixture
+def create_loan(make_offer, bayc, borrower, lender, lender_key, now):
+    def _create_loan(p2p_nfts, token_id, borrower_broker_fee=None):
+        borrower_broker_fee = borrower_broker_fee or Fee.borrower_broker(ZERO_ADDRESS)
+        signed_offer = make_offer(p2p_nfts, lender, lender_key, token_id, token_id.to_bytes(32, "big"))
+        fees = _loan_fees(p2p_nfts, signed_offer.offer, borrower_broker_fee)
+        bayc.mint(borrower, token_id)
+        bayc.approve(p2p_nfts.address, token_id, sender=borrower)
+
+        loan_id = p2p_nfts.create_loan(
+            signed_offer,
+            token_id,
+            [],
+            ZERO_ADDRESS,
+            borrower_broker_fee.upfront_amount,
+            borrower_broker_fee.settlement_bps,
+            borrower_broker_fee.wallet,
+            sender=borrower,
+        )
+        return Loan(
+            id=loan_id,
+            offer_id=compute_signed_offer_id(signed_offer),
+            offer_tracing_id=signed_offer.offer.tracing_id,
+            amount=signed_offer.offer.principal,
+            interest=signed_offer.offer.interest,
+            payment_token=signed_offer.offer.payment_token,
+            maturity=now + signed_offer.offer.duration,
+            start_time=now,
+            borrower=borrower,
+            lender=lender,
+            collateral_contract=bayc.address,
+            collateral_token_id=token_id,
+            fees=fees,
+            pro_rata=signed_offer.offer.pro_rata,
+        )
+
+    return _create_loan
+
+
+def test_create_loan_stores_only_non_zero_fees(p2p_nfts_sparse, create_loan):
+    loan = create_loan(p2p_nfts_sparse, 1)
+
+    assert get_last_event(p2p_nfts_sparse, "LoanCreated").fees == loan.fees
+    assert [fee.type for fee in loan.fees] == [FeeType.PROTOCOL]
+    assert compute_loan_hash(loan) == p2p_nfts_sparse.loans(loan.id)
+
+
+def test_create_loan_stores_all_fees_by_default(p2p_nfts_usdc, create_loan):
+    loan = create_loan(p2p_nfts_usdc, 1)
+
+    assert len(loan.fees) == 4  # noqa: PLR2004
+    assert compute_loan_hash(loan) == p2p_nfts_usdc.loans(loan.id)
+
+
+def test_settle_loan_with_sparse_fees(p2p_nfts_sparse, create_loan, usdc, now):
+    loan = create_loan(p2p_nfts_sparse, 1)
+    protocol_wallet = p2p_nfts_sparse.protocol_wallet()
+    initial_protocol_balance = usdc.balanceOf(protocol_wallet)
+    boa.env.time_travel(seconds=50)
+
+    p2p_nfts_sparse.settle_loan(loan, sender=loan.borrower)
+
+    interest = loan.get_interest(now + 50)
+    protocol_fee_amount = interest * PROTOCOL_SETTLEMENT_FEE // 10000
+    event = get_last_event(p2p_nfts_sparse, "LoanPaid")
+    assert event.paid_interest == interest
+    assert event.paid_settlement_fees == [FeeAmount(FeeType.PROTOCOL, protocol_fee_amount, protocol_wallet)]
+    assert usdc.balanceOf(protocol_wallet) == initial_protocol_balance + protocol_fee_amount
+
+
+def test_replace_loan_with_sparse_fees(p2p_nfts_sparse, create_loan, make_offer, lender2, lender2_key):
+    loan = create_loan(p2p_nfts_sparse, 1)
+    offer = make_offer(p2p_nfts_sparse, lender2, lender2_key, 1, b"replace".zfill(32))
+
+    p2p_nfts_sparse.replace_loan(loan, offer, [], 0, 0, ZERO_ADDRESS, sender=loan.borrower)
+
+    event = get_last_event(p2p_nfts_sparse, "LoanReplaced")
+    assert [fee_type for fee_type, *_ in event.fees] == [FeeType.PROTOCOL]
+    assert [fee_type for fee_type, *_ in event.paid_settlement_fees] == [FeeType.PROTOCOL]
+    assert p2p_nfts_sparse.loans(loan.id) == b"\0" * 32
+
+
+@pytest.mark.parametrize("borrower_broker_settlement_bps", [0, 300])
+def test_replace_loan_lender_with_sparse_fees(
+    p2p_nfts_sparse, p2p_nfts_usdc, create_loan, make_offer, lender2, lender2_key, borrower_broker_settlement_bps
+):
+    borrower_broker_fee = Fee.borrower_broker(
+        boa.env.generate_address() if borrower_broker_settlement_bps else ZERO_ADDRESS, 0, borrower_broker_settlement_bps
+    )
+    replacements = []
+    for token_id, p2p_nfts in enumerate([p2p_nfts_usdc, p2p_nfts_sparse], start=1):
+        loan = create_loan(p2p_nfts, token_id, borrower_broker_fee)
+        offer = make_offer(p2p_nfts, lender2, lender2_key, token_id, b"replace".zfill(32), duration=150)
+        replacements.append((p2p_nfts, loan, offer))
+    boa.env.time_travel(seconds=50)
+
+    results = []
+    for p2p_nfts, loan, offer in replacements:
+        p2p_nfts.replace_loan_lender(loan, offer, [], sender=loan.lender)
+
+        event = get_last_event(p2p_nfts, "LoanReplacedByLender")
+        results.append((event.paid_interest, event.paid_settlement_fees, event.borrower_compensation))
+
+    assert results[0] == results[1]
+
+
+def _calldata_gas(fn, *args):
+    return sum(16 if b else 4 for b in fn.prepare_calldata(*args))
+
+
+def test_sparse_fees_reduce_calldata_and_gas(p2p_nfts_usdc, p2p_nfts_sparse, create_loan, make_offer, lender2, lender2_key):
+    results = {}
+    for token_id, p2p_nfts in enumerate([p2p_nfts_usdc, p2p_nfts_sparse], start=1):
+        loan = create_loan(p2p_nfts, token_id)
+        offer = make_offer(p2p_nfts, lender2, lender2_key, token_id, b"replace".zfill(32), duration=150)
+        replace_args = (loan, offer, [], 0, 0, ZERO_ADDRESS)
+        measures = {}
+
+        with boa.env.anchor():
+            p2p_nfts.settle_loan(loan, sender=loan.borrower)
+            measures["settle_loan"] = (_calldata_gas(p2p_nfts.settle_loan, loan), p2p_nfts._computation.get_gas_used())
+
+        with boa.env.anchor():
+            p2p_nfts.replace_loan(*replace_args, sender=loan.borrower)
+            measures["replace_loan"] = (
+                _calldata_gas(p2p_nfts.replace_loan, *replace_args),
+                p2p_nfts._computation.get_gas_used(),
+            )
+
+        with boa.env.anchor():
+            p2p_nfts.replace_loan_lender(loan, offer, [], sender=loan.lender)
+            measures["replace_loan_lender"] = (
+                _calldata_gas(p2p_nfts.replace_loan_lender, loan, offer, []),
+                p2p_nfts._computation.get_gas_used(),
+            )
+
+        results[p2p_nfts.sparse_fees()] = measures
+
+    for function_name, (dense_calldata, dense_gas) in results[False].items():
+        sparse_calldata, sparse_gas = results[True][function_name]
+        print(f"{function_name}: calldata gas {dense_calldata} -> {sparse_calldata}, gas {dense_gas} -> {sparse_gas}")
+        assert sparse_calldata < dense_calldata
+        assert sparse_gas < dense_gas
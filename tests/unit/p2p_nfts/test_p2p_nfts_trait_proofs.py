@@ -0,0 +1,124 @@
+import os
+
+import boa
+import pytest
+
+from ...conftest_base import (
+    ZERO_ADDRESS,
+    ZERO_BYTES32,
+    Offer,
+    OfferType,
+    TokenTraitTree,
+    TokenTraitTreeV2,
+    sign_offer,
+)
+
+TOKEN_ID = 1
+
+
+@pytest.fixture(autouse=True)
+def lender_funds(lender, usdc, p2p_nfts_usdc):
+    usdc.mint(lender, 10**12)
+    usdc.approve(p2p_nfts_usdc.address, 10**12, sender=lender)
+
+
+@pytest.fixture(autouse=True)
+def collateral(p2p_nfts_usdc, bayc, borrower):
+    bayc.mint(borrower, TOKEN_ID)
+    bayc.approve(p2p_nfts_usdc.address, TOKEN_ID, sender=borrower)
+
+
+@pytest.fixture
+def trait(traits):
+    return next((k, v[0]) for k, v in traits.items())
+
+
+@pytest.fixture
+def signed_offer(p2p_nfts_usdc, usdc, bayc_key_hash, lender, lender_key, trait, now):
+    offer = Offer(
+        principal=1000,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        collection_key_hash=bayc_key_hash,
+        offer_type=OfferType.TRAIT,
+        trait_hash=TokenTraitTree.trait_hash(*trait),
+        expiration=now + 100,
+        lender=lender,
+        size=1,
+    )
+    return sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+
+@pytest.fixture
+def set_trait_root(p2p_control, bayc_key_hash, owner):
+    def _set_trait_root(root, version):
+        p2p_control.change_collections_versioned_trait_roots([(bayc_key_hash, root, version)], sender=owner)
+
+    return _set_trait_root
+
+
+def _tree(tree_cls, bayc, traits):
+    return tree_cls(
+        [
+            (bayc.address, trait_name, trait_value, token_id)
+            for token_id in range(TOKEN_ID, TOKEN_ID + 100)
+            for trait_name, trait_values in traits.items()
+            for trait_value in trait_values
+        ]
+    )
+
+
+def test_v2_tree_proofs_are_order_independent(bayc, traits, trait):
+    tree = _tree(TokenTraitTreeV2, bayc, traits)
+
+    for token_id in range(TOKEN_ID, TOKEN_ID + 10):
+        token_node = TokenTraitTreeV2.token_node(bayc.address, *trait, token_id)
+        proof = tree.proof(token_node)
+        assert len(proof) > 0
+        assert TokenTraitTreeV2.root_from_proof(token_node, proof) == tree.root()
+        assert TokenTraitTree.root_from_proof(token_node, proof) != tree.root()
+
+
+@pytest.mark.parametrize("tree_cls", [TokenTraitTree, TokenTraitTreeV2])
+def test_create_loan_with_versioned_trait_root(
+    p2p_nfts_usdc, signed_offer, set_trait_root, borrower, bayc, traits, trait, debug_precompile, tree_cls
+):
+    tree = _tree(tree_cls, bayc, traits)
+    set_trait_root(tree.root(), tree_cls.version)
+    proof = tree.proof(tree_cls.token_node(bayc.address, *trait, TOKEN_ID))
+
+    loan_id = p2p_nfts_usdc.create_loan(signed_offer, TOKEN_ID, proof, ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+    assert p2p_nfts_usdc.loans(loan_id) != ZERO_BYTES32
+    assert bayc.ownerOf(TOKEN_ID) == p2p_nfts_usdc.address
+
+
+@pytest.mark.parametrize(("tree_cls", "root_version"), [(TokenTraitTree, 2), (TokenTraitTreeV2, 1)])
+def test_create_loan_reverts_if_proof_version_mismatch(
+    p2p_nfts_usdc, signed_offer, set_trait_root, borrower, bayc, traits, trait, debug_precompile, tree_cls, root_version
+):
+    tree = _tree(tree_cls, bayc, traits)
+    set_trait_root(tree.root(), root_version)
+    proof = tree.proof(tree_cls.token_node(bayc.address, *trait, TOKEN_ID))
+
+    with boa.reverts("proof invalid"):
+        p2p_nfts_usdc.create_loan(signed_offer, TOKEN_ID, proof, ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+
+def test_trait_proof_gas_by_depth(p2p_nfts_usdc, signed_offer, set_trait_root, borrower, bayc, trait):
+    token_node = TokenTraitTree.token_node(bayc.address, *trait, TOKEN_ID)
+    gas = {}
+    for depth in [0, *range(10, 25)]:
+        # trees with 2**depth tokens are too large to build, the proof verification cost only depends on its length
+        proof = [os.urandom(32) for _ in range(depth)]
+        for tree_cls in [TokenTraitTree, TokenTraitTreeV2]:
+            with boa.env.anchor():
+                set_trait_root(tree_cls.root_from_proof(token_node, proof), tree_cls.version)
+                p2p_nfts_usdc.create_loan(signed_offer, TOKEN_ID, proof, ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
+                gas[depth, tree_cls.version] = p2p_nfts_usdc._computation.get_gas_used()
+
+    for depth in range(10, 25):
+        v1, v2 = ((gas[depth, version] - gas[0, version]) for version in [1, 2])
+        print(f"depth {depth}: v1 {v1}, v2 {v2} proof verification gas ({v1 - v2} saved)")
+        assert v2 < v1